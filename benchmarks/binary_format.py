@@ -0,0 +1,111 @@
+from __future__ import annotations
+
+import argparse
+import random
+import tempfile
+import time
+from pathlib import Path
+
+from tracker.binary_storage import BinaryStorage
+from tracker.storage import JsonStorage, set_cache_enabled
+
+
+# Synthetic ledger rows with realistic repetition in categories and notes.
+def _records(count: int) -> list[dict]:
+    rng = random.Random(12)
+    categories = ["food", "transport", "rent", "utilities", "health", "fun"]
+    notes = ["", "", "lunch", "bus fare", "groceries", "monthly bill"]
+    rows = []
+    for number in range(count):
+        day = f"20{rng.randint(20, 26)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}"
+        rows.append(
+            {
+                "id": f"EXP-{day.replace('-', '')}-{number:04d}",
+                "date": day,
+                "category": rng.choice(categories),
+                "amount": rng.randint(100, 500000) / 100,
+                "currency": "BDT",
+                "note": rng.choice(notes),
+                "created_at": f"{day}T12:00:00",
+            }
+        )
+    return rows
+
+
+# Best of `repeat` wall-clock timings of `action`.
+def _timed(action, repeat: int = 3) -> tuple[float, object]:
+    best = float("inf")
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = action()
+        best = min(best, time.perf_counter() - started)
+    return best, result
+
+
+# Month totals by streaming every JSON record, as the JSON engines' scan does.
+def _json_month_total(store: JsonStorage, month: str) -> float:
+    return sum(
+        float(item["amount"])
+        for item in store.iter_records()
+        if str(item["date"]).startswith(month)
+    )
+
+
+# Compare file size, full load, a filtered query and totals for both formats.
+def run(rows: int) -> None:
+    set_cache_enabled(False)
+    records = _records(rows)
+    data = {"version": 1, "expenses": records}
+    with tempfile.TemporaryDirectory(prefix="tracker-binary-") as tmp:
+        json_store = JsonStorage(Path(tmp) / "expenses.json")
+        binary_store = BinaryStorage(Path(tmp) / "expenses.bin")
+        json_store.save(data)
+        binary_store.save(data)
+
+        json_size = json_store.path.stat().st_size
+        binary_size = binary_store.path.stat().st_size
+        print(f"rows: {rows}")
+        print(
+            f"file size: json {json_size / 1e6:.1f} MB, binary {binary_size / 1e6:.1f} MB "
+            f"({json_size / binary_size:.1f}x smaller)"
+        )
+
+        checks = [
+            ("full load", json_store.load, binary_store.load),
+            (
+                "query month+category",
+                lambda: [
+                    item
+                    for item in json_store.iter_records()
+                    if item["date"].startswith("2024-03") and item["category"] == "rent"
+                ],
+                lambda: list(
+                    binary_store.query(month="2024-03", category="rent", sort_by=None)
+                ),
+            ),
+            (
+                "month total",
+                lambda: _json_month_total(json_store, "2024-03"),
+                lambda: binary_store.totals(month="2024-03")[1],
+            ),
+        ]
+        for label, json_action, binary_action in checks:
+            json_time, _ = _timed(json_action)
+            binary_time, _ = _timed(binary_action)
+            print(
+                f"{label}: json {json_time * 1000:.0f} ms, binary "
+                f"{binary_time * 1000:.0f} ms ({json_time / binary_time:.1f}x)"
+            )
+
+
+# Entry point: python -m benchmarks.binary_format [--rows N]
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="JSON vs binary ledger format")
+    parser.add_argument("--rows", type=int, default=200000)
+    args = parser.parse_args(argv)
+    run(args.rows)
+
+
+if __name__ == "__main__":
+    main()
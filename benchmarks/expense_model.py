@@ -0,0 +1,109 @@
+from __future__ import annotations
+
+import argparse
+import gc
+import json
+import random
+import time
+import tracemalloc
+from dataclasses import dataclass
+
+from tracker.models import Expense
+
+
+# The dataclass Expense used before the tuple-backed record, for comparison.
+@dataclass(frozen=True)
+class DataclassExpense:
+    id: str
+    date: str
+    category: str
+    amount: float
+    currency: str
+    note: str
+    created_at: str
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "DataclassExpense":
+        return cls(
+            id=str(data["id"]),
+            date=str(data["date"]),
+            category=str(data["category"]),
+            amount=float(data["amount"]),
+            currency=str(data.get("currency", "BDT")),
+            note=str(data.get("note", "")),
+            created_at=str(data["created_at"]),
+        )
+
+
+# Synthetic ledger as JSON text, so every load yields fresh string objects.
+def _ledger_text(count: int) -> str:
+    rng = random.Random(13)
+    categories = ["food", "transport", "rent", "utilities", "health", "fun"]
+    rows = [
+        {
+            "id": f"EXP-2026{rng.randint(1, 12):02d}{rng.randint(1, 28):02d}-{number:04d}",
+            "date": f"2026-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+            "category": rng.choice(categories),
+            "amount": rng.randint(100, 500000) / 100,
+            "currency": "BDT",
+            "note": "",
+            "created_at": "2026-01-01T12:00:00",
+        }
+        for number in range(count)
+    ]
+    return json.dumps(rows)
+
+
+BUILDERS = {
+    "dataclass from_dict": lambda rows: [DataclassExpense.from_dict(item) for item in rows],
+    "Expense.from_dict": lambda rows: [Expense.from_dict(item) for item in rows],
+    "Expense.from_dicts": lambda rows: list(Expense.from_dicts(rows)),
+}
+
+
+# Best-of-3 build time, and memory held by the expenses (strings included)
+# once the parsed dicts are dropped.
+def _measure(text: str, build) -> tuple[float, int]:
+    elapsed = float("inf")
+    for _ in range(3):
+        rows = json.loads(text)
+        gc.collect()
+        started = time.perf_counter()
+        expenses = build(rows)
+        elapsed = min(elapsed, time.perf_counter() - started)
+        del rows, expenses
+
+    gc.collect()
+    tracemalloc.start()
+    rows = json.loads(text)
+    expenses = build(rows)
+    del rows
+    gc.collect()
+    retained, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del expenses
+    return elapsed, retained
+
+
+# Compare the record types on `count` rows.
+def run(count: int) -> None:
+    text = _ledger_text(count)
+    print(f"rows: {count}")
+    for label, build in BUILDERS.items():
+        elapsed, retained = _measure(text, build)
+        print(
+            f"{label}: {elapsed * 1000:.0f} ms, "
+            f"{retained / 1e6:.0f} MB retained ({retained / count:.0f} B/row)"
+        )
+
+
+# Entry point: python -m benchmarks.expense_model [--rows N]
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="Expense record type benchmark")
+    parser.add_argument("--rows", type=int, default=1000000)
+    args = parser.parse_args(argv)
+    run(args.rows)
+
+
+if __name__ == "__main__":
+    main()
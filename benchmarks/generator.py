@@ -0,0 +1,173 @@
+from __future__ import annotations
+
+import argparse
+import json
+import random
+from dataclasses import dataclass
+from datetime import date as date_cls, timedelta
+from pathlib import Path
+from typing import Iterator
+
+from tracker.utils import IdAllocator
+
+DEFAULT_CATEGORIES = (
+    ("food", 35.0),
+    ("transport", 20.0),
+    ("utilities", 12.0),
+    ("shopping", 10.0),
+    ("health", 8.0),
+    ("fun", 8.0),
+    ("rent", 4.0),
+    ("education", 3.0),
+)
+_WORDS = (
+    "lunch", "bus", "fare", "groceries", "monthly", "bill", "coffee", "taxi",
+    "medicine", "gift", "book", "market", "dinner", "ticket", "repair", "fuel",
+)
+
+
+# Shape of a synthetic ledger; the same spec always yields the same rows.
+@dataclass(frozen=True)
+class LedgerSpec:
+    rows: int = 10000
+    seed: int = 17
+    start: str = "2024-01-01"
+    days: int = 730
+    categories: tuple[tuple[str, float], ...] = DEFAULT_CATEGORIES
+    note_min: int = 0
+    note_max: int = 40
+    currency: str = "BDT"
+
+
+# Parse "food=30,transport=20" into (category, weight) pairs.
+def parse_categories(value: str) -> tuple[tuple[str, float], ...]:
+    pairs = []
+    for part in value.split(","):
+        name, _, weight = part.partition("=")
+        if not name.strip():
+            raise ValueError(f"invalid category weight: {part!r}")
+        try:
+            pairs.append((name.strip().lower(), float(weight or 1)))
+        except ValueError as exc:
+            raise ValueError(f"invalid category weight: {part!r}") from exc
+    return tuple(pairs)
+
+
+# Stream ledger records in storage format (ids from the tracker's allocator).
+#
+# Dates are spread uniformly over the span, amounts are log-normal in
+# cents, notes are slices of a seeded word text, and created_at advances
+# with the row number as in a real ledger.
+def iter_records(spec: LedgerSpec) -> Iterator[dict]:
+    rng = random.Random(spec.seed)
+    names = [name for name, _ in spec.categories]
+    weights = [weight for _, weight in spec.categories]
+    start = date_cls.fromisoformat(spec.start)
+    dates = [(start + timedelta(days=offset)).isoformat() for offset in range(spec.days)]
+    text = " ".join(rng.choice(_WORDS) for _ in range(20000))
+    allocator = IdAllocator()
+    step = max(1, spec.days * 86400 // max(spec.rows, 1))
+    created_days: dict[int, str] = {}
+    random_float = rng.random
+    note_span = spec.note_max - spec.note_min + 1
+    batch = 4096
+    for first in range(0, spec.rows, batch):
+        count = min(batch, spec.rows - first)
+        categories = rng.choices(names, weights, k=count)
+        for offset in range(count):
+            day = dates[int(random_float() * spec.days)]
+            cents = max(1, int(rng.lognormvariate(6.5, 1.2)))
+            length = spec.note_min + int(random_float() * note_span)
+            at = int(random_float() * (len(text) - length))
+            seconds = (first + offset) * step
+            created_day = created_days.get(seconds // 86400)
+            if created_day is None:
+                created_day = (start + timedelta(days=seconds // 86400)).isoformat()
+                created_days[seconds // 86400] = created_day
+            rest = seconds % 86400
+            yield {
+                "id": allocator.allocate(day),
+                "date": day,
+                "category": categories[offset],
+                "amount": cents / 100,
+                "currency": spec.currency,
+                "note": text[at:at + length].strip(),
+                "created_at": (
+                    f"{created_day}T{rest // 3600:02d}:{rest // 60 % 60:02d}:{rest % 60:02d}"
+                ),
+            }
+
+
+# Whole ledger in the snapshot shape engines save.
+def build_ledger(spec: LedgerSpec) -> dict:
+    return {"version": 1, "expenses": list(iter_records(spec))}
+
+
+# Write the ledger without holding it in memory: a JSON snapshot
+# (data/expenses.json format) or JSONL rows without ids for `tracker import`.
+#
+# Ids, dates and notes are plain ASCII, so rows are formatted directly;
+# only the category and currency names go through the JSON encoder.
+def write_ledger(spec: LedgerSpec, path: Path) -> int:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    encoded: dict[str, str] = {}
+
+    def _quoted(value: str) -> str:
+        text = encoded.get(value)
+        if text is None:
+            text = encoded[value] = json.dumps(value, ensure_ascii=False)
+        return text
+
+    jsonl = path.suffix == ".jsonl"
+    count = 0
+    with path.open("w", encoding="utf-8") as handle:
+        handle.write("" if jsonl else '{"version": 1, "expenses": [')
+        for record in iter_records(spec):
+            fields = (
+                f'"date": "{record["date"]}", "category": {_quoted(record["category"])}, '
+                f'"amount": {record["amount"]!r}, "currency": {_quoted(record["currency"])}, '
+                f'"note": "{record["note"]}"'
+            )
+            if jsonl:
+                handle.write("{" + fields + "}\n")
+            else:
+                handle.write(
+                    ("," if count else "")
+                    + f'\n{{"id": "{record["id"]}", {fields}, '
+                    + f'"created_at": "{record["created_at"]}"}}'
+                )
+            count += 1
+        handle.write("" if jsonl else "\n]}\n")
+    return count
+
+
+# Entry point: python -m benchmarks.generator --rows N --out ledger.json|.jsonl
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="Deterministic synthetic ledger")
+    parser.add_argument("--rows", type=int, default=LedgerSpec.rows)
+    parser.add_argument("--seed", type=int, default=LedgerSpec.seed)
+    parser.add_argument("--start", default=LedgerSpec.start, help="YYYY-MM-DD")
+    parser.add_argument("--days", type=int, default=LedgerSpec.days)
+    parser.add_argument(
+        "--categories", type=parse_categories, default=DEFAULT_CATEGORIES,
+        help="weights, e.g. food=30,transport=20,rent=5",
+    )
+    parser.add_argument("--note-min", type=int, default=LedgerSpec.note_min)
+    parser.add_argument("--note-max", type=int, default=LedgerSpec.note_max)
+    parser.add_argument("--out", type=Path, required=True)
+    args = parser.parse_args(argv)
+    spec = LedgerSpec(
+        rows=args.rows,
+        seed=args.seed,
+        start=args.start,
+        days=args.days,
+        categories=args.categories,
+        note_min=args.note_min,
+        note_max=max(args.note_min, args.note_max),
+    )
+    count = write_ledger(spec, args.out)
+    print(f"Wrote {count} row(s) to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
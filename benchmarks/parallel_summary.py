@@ -0,0 +1,95 @@
+from __future__ import annotations
+
+import argparse
+import os
+import tempfile
+import time
+from pathlib import Path
+
+from benchmarks.generator import LedgerSpec, write_ledger
+from benchmarks.runner import parse_sizes, percentile
+
+# Summarized range; main() keeps the day aggregates out, so every run
+# summarizes the rows.
+DEFAULT_FROM = "2024-01-15"
+DEFAULT_TO = "2025-12-20"
+
+
+# Worker counts 1, 2, 4, ... up to `limit`, always ending at `limit`.
+def worker_counts(limit: int) -> list[int]:
+    counts = []
+    workers = 1
+    while workers < limit:
+        counts.append(workers)
+        workers *= 2
+    counts.append(limit)
+    return counts
+
+
+# Time summary_totals for each worker count; checks every result matches
+# the single-process one.
+def measure(counts: list[int], filters: dict, repeat: int) -> list[tuple[int, float]]:
+    from tracker import service
+
+    expected = None
+    results = []
+    for workers in counts:
+        samples = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            summary = service.summary_totals(**filters, workers=workers)
+            samples.append((time.perf_counter() - started) * 1000)
+            if expected is None:
+                expected = summary
+            elif summary != expected:
+                raise SystemExit(f"{workers} worker(s) returned a different summary")
+        results.append((workers, percentile(samples, 50)))
+    return results
+
+
+# Entry point: python -m benchmarks.parallel_summary [--rows 5M] [--workers N]
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="Parallel summary scaling")
+    parser.add_argument("--rows", type=parse_sizes, default=[5000000])
+    parser.add_argument("--engine", choices=("json", "partitioned"), default="json")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--from", dest="from_date", default=DEFAULT_FROM)
+    parser.add_argument("--to", dest="to_date", default=DEFAULT_TO)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args(argv)
+    if args.workers <= 0 or args.repeat <= 0:
+        parser.error("--workers and --repeat must be > 0")
+
+    with tempfile.TemporaryDirectory(prefix="tracker-parallel-") as data_dir:
+        os.environ["TRACKER_DATA_DIR"] = data_dir
+        os.environ["TRACKER_STORAGE"] = "json"
+        os.environ.setdefault("TRACKER_LOG_LEVEL", "WARNING")
+        from tracker import service
+        from tracker.aggregates import Aggregates
+        from tracker.storage import set_cache_enabled
+
+        # Like the CLI: nothing cached between runs.
+        set_cache_enabled(False)
+        started = time.perf_counter()
+        rows = write_ledger(LedgerSpec(rows=args.rows[0]), Path(data_dir) / "expenses.json")
+        if args.engine != "json":
+            service.migrate_storage(args.engine)
+            os.environ["TRACKER_STORAGE"] = args.engine
+        # Inexact aggregates are never used for answers: summaries scan.
+        service.load_aggregates = lambda store: Aggregates(exact=False)
+        print(
+            f"{rows:,} rows ({args.engine}) ready in {time.perf_counter() - started:.1f} s; "
+            f"summary {args.from_date}..{args.to_date}, {os.cpu_count()} CPU(s)"
+        )
+        filters = {"from_date": args.from_date, "to_date": args.to_date}
+        results = measure(worker_counts(args.workers), filters, args.repeat)
+
+    base = results[0][1]
+    print(f"  {'workers':>7}{'p50 ms':>12}{'speedup':>10}")
+    for workers, p50 in results:
+        print(f"  {workers:>7}{p50:>12.1f}{base / p50:>9.2f}x")
+    print("All worker counts returned identical summaries.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,238 @@
+from __future__ import annotations
+
+import argparse
+import json
+import math
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable
+
+from benchmarks.generator import LedgerSpec, build_ledger
+from tracker.storage import ENGINES
+
+try:
+    import resource
+except ImportError:  # Not available on Windows; peak RSS is then not reported.
+    resource = None
+
+DEFAULT_SIZES = (1000, 10000, 100000)
+
+
+# Nearest-rank percentile of samples (p in 0..100).
+def percentile(samples: list[float], p: float) -> float:
+    ordered = sorted(samples)
+    rank = max(1, math.ceil(p / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+# Peak resident set size of this process in MB, or None when unknown.
+def peak_rss_mb() -> float | None:
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes.
+    return peak / (1024 * 1024 if sys.platform == "darwin" else 1024)
+
+
+# Time `action` up to `repeat` times (at least 3, fewer once `budget`
+# seconds are spent); returns milliseconds per run.
+def _timings(action: Callable[[int], object], repeat: int, budget: float) -> list[float]:
+    samples = []
+    spent = 0.0
+    for run in range(repeat):
+        started = time.perf_counter()
+        action(run)
+        elapsed = time.perf_counter() - started
+        samples.append(elapsed * 1000)
+        spent += elapsed
+        if run >= 2 and spent > budget:
+            break
+    return samples
+
+
+# Measure every operation on one ledger size in this process.
+def measure(engine: str, rows: int, repeat: int, budget: float) -> dict:
+    from tracker import service, utils
+    from tracker.storage import load_data, save_data, set_cache_enabled
+
+    # Like the CLI: one command per call, nothing cached between them.
+    set_cache_enabled(False)
+    spec = LedgerSpec(rows=rows)
+    data = build_ledger(spec)
+    records = data["expenses"]
+    save_data(data)
+
+    rng = random.Random(rows)
+    ids = [record["id"] for record in records]
+    rng.shuffle(ids)
+    months = sorted({record["date"][:7] for record in records})
+    month = months[len(months) // 2]
+    day = records[len(records) // 2]["date"]
+    allocator = utils.IdAllocator(records)
+    csv_path = Path(os.environ["TRACKER_DATA_DIR"]) / "export.csv"
+
+    operations: dict[str, Callable[[int], object]] = {
+        "storage.load_data": lambda run: load_data(),
+        "storage.save_data": lambda run: save_data(data),
+        "add_expense": lambda run: service.add_expense(
+            date=day, category="food", amount=12.5, note="bench", currency="BDT"
+        ),
+        "list_expenses (month)": lambda run: service.list_expenses(month=month),
+        "list_expenses (top 10 by amount)": lambda run: service.list_expenses(
+            sort_by="amount", desc=True, limit=10
+        ),
+        "summary (month)": lambda run: service.summary(month=month),
+        "summary_totals": lambda run: service.summary_totals(),
+        "edit_expense": lambda run: service.edit_expense(
+            expense_id=ids[run], amount=99.0 + run
+        ),
+        "delete_expense": lambda run: service.delete_expense(ids[-1 - run]),
+        "export_csv": lambda run: service.export_csv(
+            str(csv_path), service.iter_expenses()
+        ),
+        "generate_id": lambda run: utils.generate_id(records, day),
+        "IdAllocator.allocate": lambda run: allocator.allocate(day),
+    }
+    results = {}
+    for name, action in operations.items():
+        samples = _timings(action, repeat, budget)
+        results[name] = {
+            "p50_ms": round(percentile(samples, 50), 3),
+            "p95_ms": round(percentile(samples, 95), 3),
+            "runs": len(samples),
+        }
+    return {"ops": results, "peak_rss_mb": peak_rss_mb()}
+
+
+# Run one size in a fresh interpreter so peak RSS and caches are its own.
+def _measure_in_child(engine: str, rows: int, repeat: int, budget: float) -> dict:
+    with tempfile.TemporaryDirectory(prefix="tracker-bench-") as data_dir:
+        env = dict(os.environ, TRACKER_DATA_DIR=data_dir, TRACKER_STORAGE=engine)
+        env.setdefault("TRACKER_LOG_LEVEL", "WARNING")
+        result = subprocess.run(
+            [
+                sys.executable, "-m", "benchmarks.runner", "--child",
+                "--engine", engine, "--sizes", str(rows),
+                "--repeat", str(repeat), "--budget", str(budget),
+            ],
+            capture_output=True,
+            text=True,
+            env=env,
+        )
+    if result.returncode != 0:
+        raise RuntimeError(f"benchmark of {rows} row(s) failed:\n{result.stderr}")
+    return json.loads(result.stdout)
+
+
+# Compare p50 timings with a baseline run; returns regression lines.
+def compare(results: dict, baseline: dict, threshold: float, min_delta_ms: float) -> list[str]:
+    regressions = []
+    for engine, sizes in results["results"].items():
+        for rows, current in sizes.items():
+            previous = baseline.get("results", {}).get(engine, {}).get(rows)
+            if previous is None:
+                continue
+            for name, timing in current["ops"].items():
+                before = previous["ops"].get(name)
+                if before is None:
+                    continue
+                now, then = timing["p50_ms"], before["p50_ms"]
+                if now > then * threshold and now - then > min_delta_ms:
+                    regressions.append(
+                        f"{engine} {rows} rows {name}: p50 {then:.3f} -> {now:.3f} ms "
+                        f"({now / then:.2f}x)"
+                    )
+    return regressions
+
+
+# Print one table per engine and size.
+def report(results: dict, baseline: dict | None) -> None:
+    for engine, sizes in results["results"].items():
+        for rows, current in sizes.items():
+            rss = current["peak_rss_mb"]
+            rss_text = "n/a" if rss is None else f"{rss:.0f} MB"
+            print(f"\n{engine}, {int(rows):,} rows (peak RSS {rss_text})")
+            previous = (baseline or {}).get("results", {}).get(engine, {}).get(rows)
+            header = f"  {'operation':<34}{'p50 ms':>11}{'p95 ms':>11}{'runs':>6}"
+            print(header + ("  baseline p50" if previous else ""))
+            for name, timing in current["ops"].items():
+                line = (
+                    f"  {name:<34}{timing['p50_ms']:>11.3f}{timing['p95_ms']:>11.3f}"
+                    f"{timing['runs']:>6}"
+                )
+                before = (previous or {}).get("ops", {}).get(name)
+                if before:
+                    ratio = timing["p50_ms"] / before["p50_ms"] if before["p50_ms"] else 0.0
+                    line += f"  {before['p50_ms']:>10.3f} ({ratio:.2f}x)"
+                print(line)
+
+
+# Parse "1000,10k,1M" style sizes.
+def parse_sizes(value: str) -> list[int]:
+    sizes = []
+    for part in value.split(","):
+        part = part.strip().lower()
+        scale = {"k": 1000, "m": 1000000}.get(part[-1:], 1)
+        number = part[:-1] if scale > 1 else part
+        if not number.isdigit() or int(number) <= 0:
+            raise argparse.ArgumentTypeError(f"invalid size: {part!r}")
+        sizes.append(int(number) * scale)
+    return sizes
+
+
+# Entry point: python -m benchmarks.runner [--sizes 1k,10k,100k] [--baseline FILE]
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="Service operation benchmarks")
+    parser.add_argument("--sizes", type=parse_sizes, default=list(DEFAULT_SIZES))
+    parser.add_argument("--engine", choices=ENGINES, action="append")
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument(
+        "--budget", type=float, default=5.0, help="seconds per operation before stopping"
+    )
+    parser.add_argument("--output", type=Path, help="write results JSON here")
+    parser.add_argument("--baseline", type=Path, help="compare with a saved results JSON")
+    parser.add_argument("--threshold", type=float, default=1.25)
+    parser.add_argument("--min-delta-ms", type=float, default=0.5)
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+    engines = args.engine or ["json"]
+
+    if args.child:
+        print(json.dumps(measure(engines[0], args.sizes[0], args.repeat, args.budget)))
+        return
+
+    results = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "results": {
+            engine: {
+                str(rows): _measure_in_child(engine, rows, args.repeat, args.budget)
+                for rows in args.sizes
+            }
+            for engine in engines
+        },
+    }
+    baseline = json.loads(args.baseline.read_text()) if args.baseline else None
+    report(results, baseline)
+    if args.output:
+        args.output.write_text(json.dumps(results, indent=2) + "\n")
+        print(f"\nResults written to {args.output}")
+    if baseline is None:
+        return
+    regressions = compare(results, baseline, args.threshold, args.min_delta_ms)
+    if regressions:
+        print(f"\nRegressions over {args.threshold:.2f}x the baseline p50:")
+        for line in regressions:
+            print(f"  {line}")
+        raise SystemExit(1)
+    print("\nNo regressions against the baseline.")
+
+
+if __name__ == "__main__":
+    main()
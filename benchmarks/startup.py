@@ -0,0 +1,95 @@
+from __future__ import annotations
+
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+
+# Modules `--help` must not pull in: the service/storage layers and heavy
+# optional dependencies are imported by the handlers that need them.
+FORBIDDEN = (
+    "numpy",
+    "csv",
+    "sqlite3",
+    "asyncio",
+    "tracker.service",
+    "tracker.storage",
+    "tracker.models",
+    "tracker.client",
+    "tracker.daemon",
+)
+
+
+# Parse `-X importtime` output into (module, cumulative us, depth) rows.
+def parse_importtime(stderr: str) -> list[tuple[str, int, int]]:
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line.split("|", 2)
+        # One space after the bar, then two per nesting level.
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        rows.append((name.strip(), int(cumulative), depth))
+    return rows
+
+
+# Import rows of one `python -X importtime -m tracker <argv>` run.
+def measure(argv: list[str]) -> list[tuple[str, int, int]]:
+    with tempfile.TemporaryDirectory(prefix="tracker-startup-") as tmp:
+        env = dict(os.environ, TRACKER_DATA_DIR=tmp)
+        result = subprocess.run(
+            [sys.executable, "-X", "importtime", "-m", "tracker", *argv],
+            capture_output=True,
+            text=True,
+            env=env,
+        )
+    return parse_importtime(result.stderr)
+
+
+# Check `tracker <argv>` startup against the import budget; returns the exit code.
+def run(argv: list[str], budget_ms: float, repeat: int) -> int:
+    # The first run may compile bytecode; it is not counted.
+    measure(argv)
+    best = None
+    for _ in range(repeat):
+        rows = measure(argv)
+        tracker_ms = sum(
+            cumulative for name, cumulative, depth in rows
+            if depth == 0 and name.split(".")[0] == "tracker"
+        ) / 1000
+        if best is None or tracker_ms < best[0]:
+            best = tracker_ms, rows
+
+    tracker_ms, rows = best
+    imported = {name for name, _, _ in rows}
+    heaviest = sorted(rows, key=lambda row: row[1], reverse=True)[:10]
+    print(f"tracker {' '.join(argv)}: {len(rows)} module(s) imported; heaviest:")
+    for name, cumulative, _ in heaviest:
+        print(f"  {name}: {cumulative / 1000:.1f} ms")
+    print(f"tracker import time: {tracker_ms:.1f} ms (budget {budget_ms:.0f} ms)")
+
+    failures = []
+    if "--help" in argv or "-h" in argv:
+        failures.extend(f"imports {name}" for name in FORBIDDEN if name in imported)
+    if tracker_ms > budget_ms:
+        failures.append(f"import time {tracker_ms:.1f} ms over {budget_ms:.0f} ms")
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    return 1 if failures else 0
+
+
+# Entry point: python -m benchmarks.startup [--budget-ms N] [-- ARGS...]
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="CLI startup import-time check")
+    parser.add_argument("--budget-ms", type=float, default=60.0)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument(
+        "args", nargs="*", default=["--help"], help="tracker arguments (default: --help)"
+    )
+    args = parser.parse_args(argv)
+    raise SystemExit(run(args.args, args.budget_ms, args.repeat))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+from __future__ import annotations
+
+import argparse
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+from tracker.storage import ENGINES
+
+
+# Add `count` expenses once every writer is ready; reports elapsed seconds.
+def _writer(number: int, count: int, start, elapsed) -> None:
+    from tracker.service import add_expense
+
+    start.wait()
+    started = time.perf_counter()
+    for item in range(count):
+        add_expense(
+            date=f"2026-01-{item % 28 + 1:02d}",
+            category=f"cat{number % 5}",
+            amount=1.25,
+            note=f"writer {number} #{item}",
+            currency="BDT",
+        )
+    elapsed[number] = time.perf_counter() - started
+
+
+# Run parallel writers against a scratch ledger and check no row was lost.
+def run(writers: int, adds: int, engine: str) -> int:
+    from tracker.service import summary_totals, verify_storage
+    from tracker.storage import get_storage
+
+    # Build the summary aggregates so writers have to keep them in step.
+    summary_totals()
+    context = multiprocessing.get_context("fork")
+    start = context.Event()
+    elapsed = context.Array("d", writers)
+    processes = [
+        context.Process(target=_writer, args=(number, adds, start, elapsed))
+        for number in range(writers)
+    ]
+    for process in processes:
+        process.start()
+    wall_started = time.perf_counter()
+    start.set()
+    for process in processes:
+        process.join()
+    wall = time.perf_counter() - wall_started
+
+    records = list(get_storage().iter_records())
+    ids = {record["id"] for record in records}
+    notes = {record["note"] for record in records}
+    expected = writers * adds
+    failed = [process.exitcode for process in processes if process.exitcode != 0]
+    drift = verify_storage()
+
+    print(f"engine={engine} writers={writers} adds/writer={adds}")
+    print(f"rows: expected {expected}, stored {len(records)}, unique ids {len(ids)}")
+    print(f"wall {wall:.2f}s, {expected / wall:.0f} adds/sec overall")
+    print(f"slowest writer {max(elapsed):.2f}s, fastest {min(elapsed):.2f}s")
+    lost = expected - len(notes)
+    if failed or drift or lost or len(records) != expected or len(ids) != expected:
+        print(f"FAILED: writer exit codes {failed}, aggregate drift {drift}")
+        return 1
+    print("OK: no lost or duplicated rows")
+    return 0
+
+
+# Entry point: python -m benchmarks.stress_writers [--writers N] [--adds M]
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="Concurrent writer stress test")
+    parser.add_argument("--writers", type=int, default=8)
+    parser.add_argument("--adds", type=int, default=50)
+    parser.add_argument("--engine", choices=ENGINES, default="json")
+    args = parser.parse_args(argv)
+    with tempfile.TemporaryDirectory(prefix="tracker-stress-") as data_dir:
+        os.environ["TRACKER_DATA_DIR"] = data_dir
+        os.environ["TRACKER_STORAGE"] = args.engine
+        sys.exit(run(args.writers, args.adds, args.engine))
+
+
+if __name__ == "__main__":
+    main()
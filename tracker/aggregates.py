@@ -0,0 +1,480 @@
+from __future__ import annotations
+
+import json
+import math
+import os
+from bisect import bisect_left, bisect_right
+from datetime import date as date_cls
+from itertools import accumulate
+from pathlib import Path
+from typing import Iterable
+from uuid import uuid4
+
+from .logger import get_logger
+from .models import Summary
+from .rates import RateTable
+from .storage import Change, last_line, read_log, sidecar_path
+from .utils import day_bounds, day_number, minor_units, periods
+
+
+_AGG_VERSION = 2
+_AGG_SUFFIX = ".agg.json"
+_LOG_SUFFIX = ".agg.jsonl"
+# Writes kept in the log before the next read folds them into the base.
+_DELTA_LIMIT = 1000
+
+# Day number (0 for a non-canonical date), category, currency.
+Cell = tuple[int, str, str]
+# Days with amounts of one category and currency, sorted, with running
+# totals and counts that start at 0: the days in positions i..j-1 add up
+# to totals[j] - totals[i].
+Series = tuple[list[int], list, list[int]]
+
+
+# Materialized day x category x currency totals (minor units) and counts.
+#
+# `exact` turns false when a record has a sub-cent amount or a
+# non-canonical date; such aggregates are kept but never used for
+# summaries. Their amounts are rounded to cents unless built with
+# rounded=False, for in-memory use only.
+class Aggregates:
+    def __init__(
+        self,
+        cells: dict[Cell, list] | None = None,
+        exact: bool = True,
+        rounded: bool = True,
+    ) -> None:
+        self.cells = cells if cells is not None else {}
+        self.exact = exact
+        self.rounded = rounded
+        self._series: dict[tuple[str, str], Series] | None = None
+
+    # Build aggregates from scratch.
+    @classmethod
+    def build(cls, records: Iterable[dict], rounded: bool = True) -> "Aggregates":
+        aggregates = cls(rounded=rounded)
+        for record in records:
+            aggregates.add(record)
+        return aggregates
+
+    # Restore persisted aggregates; returns None when the payload is unusable.
+    @classmethod
+    def from_dict(cls, payload: object) -> "Aggregates | None":
+        if not isinstance(payload, dict) or payload.get("version") != _AGG_VERSION:
+            return None
+        cells: dict[Cell, list] = {}
+        try:
+            for category, currencies in payload["series"].items():
+                for currency, flat in currencies.items():
+                    for position in range(0, len(flat), 3):
+                        day, total, count = flat[position : position + 3]
+                        # Non-finite amounts keep their float total.
+                        total = int(total) if math.isfinite(total) else float(total)
+                        cells[(int(day), category, currency)] = [total, int(count)]
+            exact = bool(payload["exact"])
+        except (KeyError, TypeError, ValueError, AttributeError):
+            return None
+        return cls(cells, exact)
+
+    # Serializable form: category -> currency -> flat [day, total, count, ...]
+    # runs in day order.
+    def to_dict(self) -> dict:
+        nested: dict[str, dict[str, list[int]]] = {}
+        for (day, category, currency), value in sorted(self.cells.items()):
+            nested.setdefault(category, {}).setdefault(currency, []).extend([day, *value])
+        return {"version": _AGG_VERSION, "exact": self.exact, "series": nested}
+
+    # Cell of a record and its amount in minor units.
+    def _cell(self, record: dict) -> tuple[Cell, float]:
+        day = day_number(record.get("date"))
+        minor = minor_units(record["amount"])
+        if minor is None or day is None:
+            self.exact = False
+            minor = float(record["amount"]) * 100
+            if self.rounded and math.isfinite(minor):
+                minor = round(minor)
+        key = (
+            day or 0,
+            str(record["category"]),
+            str(record.get("currency", "BDT")),
+        )
+        return key, minor
+
+    # Move a cell by `total` and `count`; cells left without records go.
+    def _move(self, key: Cell, total: float, count: int) -> None:
+        cell = self.cells.setdefault(key, [0, 0])
+        cell[0] += total
+        cell[1] += count
+        if cell[1] == 0:
+            del self.cells[key]
+        self._series = None
+
+    # Add (sign=1) or remove (sign=-1) one record.
+    def add(self, record: dict, sign: int = 1) -> None:
+        key, minor = self._cell(record)
+        self._move(key, sign * minor, sign)
+
+    # Apply the deltas of a batch of changes.
+    def apply(self, changes: Iterable[Change]) -> None:
+        for before, after in changes:
+            if before is not None:
+                self.add(before, -1)
+            if after is not None:
+                self.add(after)
+
+    # Net cell deltas of a batch of changes, as [day, category, currency,
+    # total, count] rows, and whether they are exact.
+    @classmethod
+    def deltas(cls, changes: Iterable[Change]) -> tuple[list[list], bool]:
+        probe = cls()
+        moved: dict[Cell, list] = {}
+        for change in changes:
+            for record, sign in zip(change, (-1, 1)):
+                if record is None:
+                    continue
+                key, minor = probe._cell(record)
+                cell = moved.setdefault(key, [0, 0])
+                cell[0] += sign * minor
+                cell[1] += sign
+        rows = [[*key, *cell] for key, cell in moved.items() if cell != [0, 0]]
+        return rows, probe.exact
+
+    # Apply logged cell deltas (see deltas()).
+    def merge(self, rows: list[list], exact: bool) -> None:
+        for day, category, currency, total, count in rows:
+            self._move((day, category, currency), total, count)
+        if not exact:
+            self.exact = False
+
+    # Running totals per (category, currency), built on first use.
+    def series(self) -> dict[tuple[str, str], Series]:
+        if self._series is None:
+            grouped: dict[tuple[str, str], list[tuple[int, object, int]]] = {}
+            for (day, category, currency), (total, count) in self.cells.items():
+                grouped.setdefault((category, currency), []).append((day, total, count))
+            self._series = {}
+            for key, rows in grouped.items():
+                rows.sort()
+                self._series[key] = (
+                    [day for day, _, _ in rows],
+                    list(accumulate((total for _, total, _ in rows), initial=0)),
+                    list(accumulate((count for _, _, count in rows), initial=0)),
+                )
+        return self._series
+
+    # First and last day with amounts (of one category), or None when empty.
+    def bounds(self, category: str | None = None) -> tuple[int, int] | None:
+        firsts, lasts = [], []
+        for (series_category, _), (days, _, _) in self.series().items():
+            if category is not None and series_category != category:
+                continue
+            # Day 0 holds the amounts of non-canonical dates.
+            start = 1 if days[0] == 0 else 0
+            if start < len(days):
+                firsts.append(days[start])
+                lasts.append(days[-1])
+        if not firsts:
+            return None
+        return min(firsts), max(lasts)
+
+    # Total (minor units) and count of one series over the days low..high:
+    # two lookups in its running totals. With `currency`, the total is
+    # converted into it, one factor per stretch between rate changes.
+    def series_span(
+        self,
+        key: tuple[str, str],
+        low: int,
+        high: int,
+        currency: str | None = None,
+        rates: RateTable | None = None,
+    ) -> tuple[float, int]:
+        days, totals, counts = self.series()[key]
+        start, end = bisect_left(days, low), bisect_right(days, high)
+        if start >= end:
+            return 0, 0
+        count = counts[end] - counts[start]
+        source = key[1]
+        if count == 0 or currency is None or source.upper() == currency.upper():
+            return totals[end] - totals[start], count
+        if rates is None:
+            raise ValueError(f"no rates to convert {source} into {currency}")
+        cuts = sorted(
+            {
+                day
+                for code in (source.upper(), currency.upper())
+                for day in rates.changes.get(code, [])
+                if low < day <= high
+            }
+        )
+        value = 0.0
+        for part_low, part_high in zip([low, *cuts], [cut - 1 for cut in cuts] + [high]):
+            start, end = bisect_left(days, part_low), bisect_right(days, part_high)
+            if counts[end] > counts[start]:
+                factor = rates.factor(source, currency, days[start])
+                value += (totals[end] - totals[start]) * factor
+        return value, count
+
+    # Total (minor units, converted into `currency` when given) and count
+    # over the days low..high, optionally of one category.
+    def span(
+        self,
+        low: int,
+        high: int,
+        category: str | None = None,
+        currency: str | None = None,
+        rates: RateTable | None = None,
+    ) -> tuple[float, int]:
+        total: float = 0
+        count = 0
+        for key in self.series():
+            if category is None or key[0] == category:
+                value, matched = self.series_span(key, low, high, currency, rates)
+                total += value
+                count += matched
+        return total, count
+
+    # Currencies with amounts over the days low..high (of one category).
+    def currencies(self, low: int, high: int, category: str | None = None) -> list[str]:
+        found = {
+            key[1]
+            for key in self.series()
+            if (category is None or key[0] == category)
+            and self.series_span(key, low, high)[1]
+        }
+        return sorted(found)
+
+    # Totals for the summary filters from the running totals of each
+    # series, or None when the aggregates are inexact or a filter date is
+    # not canonical, and a scan is needed instead.
+    #
+    # With `currency`, each series is converted per stretch between rate
+    # changes.
+    def summarize(
+        self,
+        *,
+        month: str | None = None,
+        category: str | None = None,
+        from_date: str | None = None,
+        to_date: str | None = None,
+        currency: str | None = None,
+        rates: RateTable | None = None,
+    ) -> Summary | None:
+        bounds = day_bounds(month, from_date, to_date)
+        if not self.exact or bounds is None:
+            return None
+        low, high = bounds
+        known = self.bounds(category)
+        if known is not None:
+            low = known[0] if low is None else low
+            high = known[1] if high is None else high
+        months = [] if known is None else list(periods(low, high, "month"))
+
+        count = 0
+        total: float = 0
+        category_totals: dict[str, float] = {}
+        month_totals: dict[str, float] = {}
+        currency_totals: dict[str, int] = {}
+        for key in self.series() if known is not None else ():
+            series_category, series_currency = key
+            if category is not None and series_category != category:
+                continue
+            amount, matched = self.series_span(key, low, high)
+            if not matched:
+                continue
+            value: float = amount
+            if currency is not None:
+                value = self.series_span(key, low, high, currency, rates)[0]
+            currency_totals[series_currency] = (
+                currency_totals.get(series_currency, 0) + amount
+            )
+            count += matched
+            total += value
+            category_totals[series_category] = category_totals.get(series_category, 0) + value
+            for label, first, last in months:
+                part, part_count = self.series_span(key, first, last, currency, rates)
+                if part_count:
+                    month_totals[label] = month_totals.get(label, 0) + part
+
+        return Summary(
+            count,
+            total / 100,
+            {key: value / 100 for key, value in category_totals.items()},
+            {key: value / 100 for key, value in sorted(month_totals.items())},
+            {key: value / 100 for key, value in currency_totals.items()},
+            currency,
+        )
+
+    # Human-readable differences against another set of aggregates.
+    def diff(self, other: "Aggregates") -> list[str]:
+        lines = []
+        if self.exact != other.exact:
+            lines.append(f"exact flag: stored {self.exact}, actual {other.exact}")
+        for key in sorted(set(self.cells) | set(other.cells)):
+            stored = self.cells.get(key, [0, 0])
+            actual = other.cells.get(key, [0, 0])
+            # A NaN total (of a NaN amount) never equals itself.
+            same_nan = stored[1] == actual[1] and math.isnan(stored[0]) and math.isnan(actual[0])
+            if stored != actual and not same_nan:
+                day, category, currency = key
+                date_str = date_cls.fromordinal(day).isoformat() if day else "(bad date)"
+                lines.append(
+                    f"{date_str} {category} {currency}: stored {stored[0] / 100:.2f} x{stored[1]}, "
+                    f"actual {actual[0] / 100:.2f} x{actual[1]}"
+                )
+        return lines
+
+
+# Paths of the base file and the change log.
+def _paths() -> tuple[Path, Path]:
+    return sidecar_path(_AGG_SUFFIX), sidecar_path(_LOG_SUFFIX)
+
+
+# Header line of the base file ({"stamp", "generation"}) and, with `body`,
+# the aggregates under it; None when the file is missing or unusable.
+def _read_base(path: Path, body: bool) -> tuple[dict, Aggregates | None] | None:
+    try:
+        with path.open("r", encoding="utf-8") as handle:
+            header = json.loads(handle.readline())
+            if not isinstance(header, dict) or not isinstance(header.get("generation"), str):
+                return None
+            if not body:
+                return header, None
+            aggregates = Aggregates.from_dict(json.loads(handle.readline()))
+    except FileNotFoundError:
+        return None
+    except (OSError, json.JSONDecodeError) as exc:
+        get_logger().error("Ignoring unreadable aggregates %s: %s", path, exc)
+        return None
+    if aggregates is None:
+        return None
+    return header, aggregates
+
+
+# Read the stored aggregates with their log applied, as (stamp,
+# aggregates, logged writes); (None, None, 0) when unusable.
+def _read(base_path: Path, log_path: Path) -> tuple[object, Aggregates | None, int]:
+    base = _read_base(base_path, True)
+    if base is None:
+        return None, None, 0
+    header, aggregates = base
+    stamp = header.get("stamp")
+    entries = read_log(log_path, header["generation"])
+    try:
+        for entry in entries:
+            aggregates.merge(entry["cells"], entry["exact"])
+            stamp = entry["stamp"]
+    except (KeyError, TypeError, ValueError) as exc:
+        get_logger().error("Ignoring unreadable aggregates log %s: %s", log_path, exc)
+        return None, None, 0
+    return stamp, aggregates, len(entries)
+
+
+# Ledger stamp the stored aggregates describe, with their generation; None
+# when there are no usable aggregates. Reads the header and the last log
+# line only.
+def _stored_state(base_path: Path, log_path: Path) -> tuple[object, str] | None:
+    base = _read_base(base_path, False)
+    if base is None:
+        return None
+    header = base[0]
+    stamp, generation = header.get("stamp"), header["generation"]
+    last = last_line(log_path)
+    if last is not None:
+        try:
+            entry = json.loads(last)
+        except json.JSONDecodeError:
+            entry = None
+        if isinstance(entry, dict) and entry.get("generation") == generation:
+            stamp = entry.get("stamp")
+    return stamp, generation
+
+
+# Persist aggregates for the ledger state described by `stamp` as a new
+# base, and drop the log of the previous one.
+def _write(base_path: Path, log_path: Path, aggregates: Aggregates, stamp: list) -> None:
+    header = {"stamp": stamp, "generation": uuid4().hex}
+    tmp_path = base_path.with_name(f"{base_path.name}.tmp")
+    try:
+        with tmp_path.open("w", encoding="utf-8") as handle:
+            for payload in (header, aggregates.to_dict()):
+                json.dump(payload, handle, ensure_ascii=True, separators=(",", ":"))
+                handle.write("\n")
+        os.replace(tmp_path, base_path)
+        log_path.unlink(missing_ok=True)
+    except OSError as exc:
+        get_logger().error("Failed to write aggregates %s: %s", base_path, exc)
+
+
+# Persist aggregates read or built for the ledger state `stamp`, unless the
+# ledger changed since. Readers do not hold the ledger lock: a writer that
+# stored in the meantime logs its delta against whatever base it finds, so
+# a base holding its rows under the older stamp would count them twice.
+def _write_current(
+    store, base_path: Path, log_path: Path, aggregates: Aggregates, stamp: list
+) -> None:
+    if store.stamp() != stamp:
+        get_logger().info("Ledger changed while reading aggregates; not storing them")
+        return
+    _write(base_path, log_path, aggregates, stamp)
+
+
+# Aggregates for the current ledger, rebuilt by a scan when missing or
+# stale. A log of more than _DELTA_LIMIT writes is folded into the base.
+def load_aggregates(store) -> Aggregates:
+    base_path, log_path = _paths()
+    stamp = store.stamp()
+    stored_stamp, aggregates, logged = _read(base_path, log_path)
+    if aggregates is not None and stored_stamp == stamp:
+        if logged > _DELTA_LIMIT:
+            _write_current(store, base_path, log_path, aggregates, stamp)
+        return aggregates
+    get_logger().info("Rebuilding aggregates %s", base_path)
+    aggregates = Aggregates.build(store.iter_records())
+    _write_current(store, base_path, log_path, aggregates, stamp)
+    return aggregates
+
+
+# Log the cell deltas of a write; `stamp` is the ledger stamp taken before
+# the write. Only the base header and the last log line are read, so the
+# cost depends on the write, not on the number of cells.
+#
+# Aggregates that were already stale are left for the next read to rebuild.
+def update_aggregates(store, stamp: list, changes: list[Change]) -> None:
+    base_path, log_path = _paths()
+    state = _stored_state(base_path, log_path)
+    if state is None or state[0] != stamp:
+        return
+    rows, exact = Aggregates.deltas(changes)
+    new_stamp = store.stamp()
+    if not rows and new_stamp == stamp:
+        return
+    entry = {"generation": state[1], "stamp": new_stamp, "exact": exact, "cells": rows}
+    try:
+        with log_path.open("a", encoding="utf-8") as handle:
+            handle.write(json.dumps(entry, ensure_ascii=True, separators=(",", ":")) + "\n")
+    except OSError as exc:
+        get_logger().error("Failed to update aggregates %s: %s", log_path, exc)
+
+
+# Remove the aggregates files, so the next read rebuilds them.
+def discard_aggregates() -> None:
+    for path in _paths():
+        try:
+            path.unlink(missing_ok=True)
+        except OSError as exc:
+            get_logger().error("Failed to remove aggregates %s: %s", path, exc)
+
+
+# Rebuild aggregates from the ledger; returns differences from the stored ones.
+def verify_aggregates(store) -> list[str]:
+    base_path, log_path = _paths()
+    stamp = store.stamp()
+    stored_stamp, stored, _ = _read(base_path, log_path)
+    actual = Aggregates.build(store.iter_records())
+    _write(base_path, log_path, actual, stamp)
+    if stored is None:
+        return [f"aggregates file {base_path.name} is missing or unreadable"]
+    lines = stored.diff(actual)
+    if lines and stored_stamp != stamp:
+        lines.insert(0, "stored aggregates were stale (ledger changed outside tracker)")
+    return lines
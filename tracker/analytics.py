@@ -0,0 +1,260 @@
+from __future__ import annotations
+
+from bisect import bisect_left, bisect_right
+from typing import Iterable
+
+from .models import Summary
+from .rates import RateTable
+from .utils import day_bounds, day_number, minor_units
+
+_NUMPY_UNSET = object()
+_numpy_module = _NUMPY_UNSET
+
+
+# NumPy, imported on first use so commands that never build columns do not
+# pay for it; None when it is not installed (list-based columns are used).
+def _numpy():
+    global _numpy_module
+    if _numpy_module is _NUMPY_UNSET:
+        try:
+            import numpy
+        except ImportError:
+            numpy = None
+        _numpy_module = numpy
+    return _numpy_module
+
+
+# Ledger decoded into parallel columns sorted by day.
+#
+# Amounts are integer minor units, days are ordinals, and category/currency
+# are codes into the name lists. Works on NumPy arrays when NumPy is
+# installed and on plain lists otherwise; both give the same totals.
+class LedgerColumns:
+    def __init__(
+        self,
+        days,
+        amounts,
+        categories,
+        currencies,
+        months,
+        category_names: list[str],
+        currency_names: list[str],
+    ) -> None:
+        self.days = days
+        self.amounts = amounts
+        self.categories = categories
+        self.currencies = currencies
+        self.months = months
+        self.category_names = category_names
+        self.currency_names = currency_names
+        self.category_codes = {name: code for code, name in enumerate(category_names)}
+
+    # Decode records into columns; None when a date is not canonical or an
+    # amount is not a whole number of minor units.
+    @classmethod
+    def from_records(cls, records: Iterable[dict]) -> "LedgerColumns | None":
+        day_cache: dict[str, tuple[int, int] | None] = {}
+        category_codes: dict[str, int] = {}
+        currency_codes: dict[str, int] = {}
+        rows: list[tuple[int, int, int, int, int]] = []
+        for item in records:
+            date_str = str(item["date"])
+            day = day_cache.get(date_str, False)
+            if day is False:
+                number = day_number(date_str)
+                day = None
+                if number is not None:
+                    day = (number, int(date_str[:4]) * 12 + int(date_str[5:7]) - 1)
+                day_cache[date_str] = day
+            if day is None:
+                return None
+            minor = minor_units(item["amount"])
+            if minor is None:
+                return None
+            category = category_codes.setdefault(
+                str(item["category"]), len(category_codes)
+            )
+            currency = currency_codes.setdefault(
+                str(item.get("currency", "BDT")), len(currency_codes)
+            )
+            rows.append((day[0], minor, category, currency, day[1]))
+
+        rows.sort(key=lambda row: row[0])
+        columns = [list(column) for column in zip(*rows)] or [[], [], [], [], []]
+        np = _numpy()
+        if np is not None:
+            dtypes = (np.int32, np.int64, np.int32, np.int32, np.int32)
+            columns = [
+                np.array(column, dtype=dtype) for column, dtype in zip(columns, dtypes)
+            ]
+        return cls(*columns, list(category_codes), list(currency_codes))
+
+    # Totals for the summary filters; None when a filter needs a full scan.
+    # With `currency`, every row is converted at its day's rate from `rates`.
+    def summarize(
+        self,
+        *,
+        month: str | None = None,
+        category: str | None = None,
+        from_date: str | None = None,
+        to_date: str | None = None,
+        currency: str | None = None,
+        rates: RateTable | None = None,
+    ) -> Summary | None:
+        bounds = day_bounds(month, from_date, to_date)
+        if bounds is None:
+            return None
+        code = None
+        if category is not None:
+            code = self.category_codes.get(category)
+            if code is None:
+                return Summary(0, 0.0, {}, {}, {}, currency)
+        target = (currency, rates) if currency is not None and rates is not None else None
+        if _numpy() is not None:
+            return self._summarize_numpy(bounds, code, target)
+        return self._summarize_lists(bounds, code, target)
+
+    # Row range covering the inclusive day bounds.
+    def _slice(self, bounds: tuple[int | None, int | None]) -> tuple[int, int]:
+        low, high = bounds
+        np = _numpy()
+        if np is not None:
+            start = 0 if low is None else int(np.searchsorted(self.days, low, "left"))
+            stop = (
+                len(self.days)
+                if high is None
+                else int(np.searchsorted(self.days, high, "right"))
+            )
+        else:
+            start = 0 if low is None else bisect_left(self.days, low)
+            stop = len(self.days) if high is None else bisect_right(self.days, high)
+        return start, max(start, stop)
+
+    # Conversion factor of each row, gathered from the rate table's
+    # (currency, day) rows in one indexing step.
+    def _row_factors(self, currencies, days, currency: str, rates: RateTable):
+        np = _numpy()
+        table = np.array(
+            [rates.factors(name, currency) for name in self.currency_names],
+            dtype=np.float64,
+        ).reshape(len(self.currency_names), rates.slots)
+        slots = np.clip(days - (rates.first_day - 1), 0, rates.slots - 1)
+        factors = table[currencies, slots]
+        missing = np.flatnonzero(np.isnan(factors))
+        if len(missing):
+            row = int(missing[0])
+            rates.missing(self.currency_names[currencies[row]], currency, int(days[row]))
+        return factors
+
+    # Vectorized totals with bincount over category, month and currency codes.
+    def _summarize_numpy(
+        self,
+        bounds: tuple[int | None, int | None],
+        code: int | None,
+        target: tuple[str, RateTable] | None,
+    ) -> Summary:
+        np = _numpy()
+        start, stop = self._slice(bounds)
+        amounts = self.amounts[start:stop]
+        categories = self.categories[start:stop]
+        months = self.months[start:stop]
+        currencies = self.currencies[start:stop]
+        days = self.days[start:stop]
+        if code is not None:
+            mask = categories == code
+            amounts, categories, months = amounts[mask], categories[mask], months[mask]
+            currencies, days = currencies[mask], days[mask]
+        currency = target[0] if target is not None else None
+        if not len(amounts):
+            return Summary(0, 0.0, {}, {}, {}, currency)
+
+        # Float weights are exact for minor-unit sums below 2**53.
+        weights = amounts.astype(np.float64)
+        currency_sums = np.bincount(currencies, weights=weights)
+        currency_totals = {
+            self.currency_names[index]: int(currency_sums[index]) / 100
+            for index in np.flatnonzero(np.bincount(currencies))
+        }
+        # Converted sums are fractional, so they are not rounded to integers.
+        exact = int
+        if target is not None:
+            weights = weights * self._row_factors(currencies, days, *target)
+            exact = float
+        category_sums = np.bincount(categories, weights=weights)
+        category_counts = np.bincount(categories)
+        first_month = int(months.min())
+        month_offsets = months - first_month
+        month_sums = np.bincount(month_offsets, weights=weights)
+        month_counts = np.bincount(month_offsets)
+
+        category_totals = {
+            self.category_names[index]: exact(category_sums[index]) / 100
+            for index in np.flatnonzero(category_counts)
+        }
+        month_totals = {
+            _month_key(first_month + int(index)): exact(month_sums[index]) / 100
+            for index in np.flatnonzero(month_counts)
+        }
+        total = exact(weights.sum()) / 100
+        return Summary(
+            len(amounts), total, category_totals, month_totals, currency_totals, currency
+        )
+
+    # Same totals with plain loops over the column lists.
+    def _summarize_lists(
+        self,
+        bounds: tuple[int | None, int | None],
+        code: int | None,
+        target: tuple[str, RateTable] | None,
+    ) -> Summary:
+        start, stop = self._slice(bounds)
+        category_sums: dict[int, float] = {}
+        month_sums: dict[int, float] = {}
+        currency_sums: dict[int, int] = {}
+        count = 0
+        total: float = 0
+        amounts, categories, months = self.amounts, self.categories, self.months
+        currencies, days = self.currencies, self.days
+        factor_rows = None
+        if target is not None:
+            currency, rates = target
+            factor_rows = [rates.factors(name, currency) for name in self.currency_names]
+        for row in range(start, stop):
+            category = categories[row]
+            if code is not None and category != code:
+                continue
+            amount = amounts[row]
+            currency_code = currencies[row]
+            currency_sums[currency_code] = currency_sums.get(currency_code, 0) + amount
+            if factor_rows is not None:
+                factor = factor_rows[currency_code][rates.slot(days[row])]
+                if factor != factor:
+                    rates.missing(self.currency_names[currency_code], currency, days[row])
+                amount = amount * factor
+            count += 1
+            total += amount
+            category_sums[category] = category_sums.get(category, 0) + amount
+            month_sums[months[row]] = month_sums.get(months[row], 0) + amount
+
+        category_totals = {
+            self.category_names[key]: value / 100
+            for key, value in category_sums.items()
+        }
+        month_totals = {_month_key(key): value / 100 for key, value in month_sums.items()}
+        currency_totals = {
+            self.currency_names[key]: value / 100 for key, value in currency_sums.items()
+        }
+        return Summary(
+            count,
+            total / 100,
+            category_totals,
+            month_totals,
+            currency_totals,
+            target[0] if target is not None else None,
+        )
+
+
+# YYYY-MM for a month index (year * 12 + month - 1).
+def _month_key(index: int) -> str:
+    year, month = divmod(index, 12)
+    return f"{year:04d}-{month + 1:02d}"
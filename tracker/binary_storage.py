@@ -0,0 +1,432 @@
+from __future__ import annotations
+
+import heapq
+import math
+import mmap
+import os
+import struct
+from contextlib import contextmanager
+from datetime import date as date_cls
+from itertools import islice
+from pathlib import Path
+from typing import Iterator
+
+from .index import LedgerIndex
+from .logger import get_logger
+from .storage import Change, apply_ops, file_signature, fsync_dir, op_results
+from .utils import day_bounds, day_number
+
+
+_MAGIC = b"TRKB"
+_VERSION = 1
+# magic, version, reserved, record count, symbol count, string count, string table offset
+_HEADER = struct.Struct("<4sHHIIIQ")
+# flags, amount, day, category, currency, id, note, created_at. The amount is
+# in minor units (or float64 bits), the day a date ordinal (or the string
+# index of a non-canonical date); category and currency index the symbols,
+# the rest index the string heap.
+_RECORD = struct.Struct("<BqiIIIII")
+_OFFSET_PAIR = struct.Struct("<II")
+_INT64 = struct.Struct("<q")
+_FLOAT64 = struct.Struct("<d")
+_FLOAT_AMOUNT = 1
+_DATE_STRING = 2
+_SORT_FIELDS = {
+    "date": "date",
+    "amount": "amount",
+    "category": "category",
+    "created": "created_at",
+    "id": "id",
+}
+
+
+# Stored amount field and flag for an amount.
+def _pack_amount(value: object) -> tuple[int, int]:
+    amount = float(value)
+    if math.isfinite(amount):
+        minor = round(amount * 100)
+        if minor / 100 == amount and abs(minor) < 1 << 62:
+            return minor, 0
+    return _INT64.unpack(_FLOAT64.pack(amount))[0], _FLOAT_AMOUNT
+
+
+# Amount from its stored field.
+def _unpack_amount(flags: int, stored: int) -> float:
+    if flags & _FLOAT_AMOUNT:
+        return _FLOAT64.unpack(_INT64.pack(stored))[0]
+    return stored / 100
+
+
+# Encode a ledger: header, fixed-width records, then the string table
+# (offsets, then UTF-8 bytes). Categories and currencies are interned as
+# the first strings ("symbols") so they can be resolved without the heap.
+def _encode(expenses: list[dict]) -> list[bytes]:
+    strings: dict[str, int] = {}
+    for item in expenses:
+        strings.setdefault(str(item["category"]), len(strings))
+        strings.setdefault(str(item.get("currency", "BDT")), len(strings))
+    symbol_count = len(strings)
+
+    records = bytearray()
+    for item in expenses:
+        amount, flags = _pack_amount(item["amount"])
+        date_str = str(item["date"])
+        day = day_number(date_str)
+        if day is None:
+            flags |= _DATE_STRING
+            day = strings.setdefault(date_str, len(strings))
+        records += _RECORD.pack(
+            flags,
+            amount,
+            day,
+            strings[str(item["category"])],
+            strings[str(item.get("currency", "BDT"))],
+            strings.setdefault(str(item["id"]), len(strings)),
+            strings.setdefault(str(item.get("note", "")), len(strings)),
+            strings.setdefault(str(item["created_at"]), len(strings)),
+        )
+
+    encoded = [value.encode("utf-8") for value in strings]
+    offsets = [0]
+    for value in encoded:
+        offsets.append(offsets[-1] + len(value))
+    table_offset = _HEADER.size + len(records)
+    header = _HEADER.pack(
+        _MAGIC, _VERSION, 0, len(expenses), symbol_count, len(encoded), table_offset
+    )
+    return [
+        header,
+        bytes(records),
+        struct.pack(f"<{len(offsets)}I", *offsets),
+        b"".join(encoded),
+    ]
+
+
+# Read-only view of a binary ledger through a memory map. Fields are read
+# in place with struct.unpack_from; strings are decoded only on demand.
+class _MappedLedger:
+    def __init__(self, buffer: mmap.mmap) -> None:
+        self.buffer = buffer
+        try:
+            magic, version, _, count, symbols, strings, table = _HEADER.unpack_from(
+                buffer, 0
+            )
+        except struct.error as exc:
+            raise RuntimeError("Data file is corrupted") from exc
+        if magic != _MAGIC or version != _VERSION:
+            get_logger().error("Unexpected binary ledger header")
+            raise RuntimeError("Data file has an invalid schema")
+        self.count = count
+        self._strings = strings
+        self._table = table
+        self._heap = table + 4 * (strings + 1)
+        self.symbols = [self.string(index) for index in range(symbols)]
+        self.symbol_codes = {name: code for code, name in enumerate(self.symbols)}
+        self._dates: dict[int, str] = {}
+
+    # String number `index` from the string table.
+    def string(self, index: int) -> str:
+        start, end = _OFFSET_PAIR.unpack_from(self.buffer, self._table + 4 * index)
+        return self.buffer[self._heap + start : self._heap + end].decode("utf-8")
+
+    # Every string in the table, decoded in one pass (for full loads).
+    def all_strings(self) -> list[str]:
+        offsets, heap = self.string_bytes()
+        return [
+            heap[start:end].decode("utf-8") for start, end in zip(offsets, offsets[1:])
+        ]
+
+    # Raw UTF-8 bytes of every string, as (start, end) offsets into `heap`.
+    def string_bytes(self) -> tuple[tuple[int, ...], bytes]:
+        offsets = struct.unpack_from(f"<{self._strings + 1}I", self.buffer, self._table)
+        return offsets, self.buffer[self._heap : self._heap + offsets[-1]]
+
+    # Integer fields of every record, in ledger order.
+    def all_fields(self) -> Iterator[tuple]:
+        end = _HEADER.size + self.count * _RECORD.size
+        return _RECORD.iter_unpack(self.buffer[_HEADER.size : end])
+
+    # Integer fields of record `position`, without decoding any string.
+    def fields(self, position: int) -> tuple:
+        return _RECORD.unpack_from(self.buffer, _HEADER.size + position * _RECORD.size)
+
+    # Date string for the stored day field.
+    def date(self, flags: int, day: int) -> str:
+        if flags & _DATE_STRING:
+            return self.string(day)
+        date_str = self._dates.get(day)
+        if date_str is None:
+            date_str = date_cls.fromordinal(day).isoformat()
+            self._dates[day] = date_str
+        return date_str
+
+    # Fully decoded record from its integer fields.
+    def record(self, fields: tuple) -> dict:
+        flags, amount, day, category, currency, expense_id, note, created = fields
+        return {
+            "id": self.string(expense_id),
+            "date": self.date(flags, day),
+            "category": self.symbols[category],
+            "amount": _unpack_amount(flags, amount),
+            "currency": self.symbols[currency],
+            "note": self.string(note),
+            "created_at": self.string(created),
+        }
+
+
+# Map a binary ledger for reading; yields None when the file does not exist.
+@contextmanager
+def _mapped(path: Path) -> Iterator[_MappedLedger | None]:
+    try:
+        handle = path.open("rb")
+    except FileNotFoundError:
+        yield None
+        return
+    except OSError as exc:
+        get_logger().error("Failed to read data file %s: %s", path, exc)
+        raise RuntimeError("Unable to read data file") from exc
+    with handle, mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+        yield _MappedLedger(buffer)
+
+
+# Binary storage: struct-packed fixed-width records with a string heap,
+# scanned through mmap. Filters and totals read only the integer fields
+# they need; every write rewrites the file.
+class BinaryStorage:
+    name = "binary"
+    supports_queries = True
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+
+    # Signature of the ledger file, for derived data to check.
+    def stamp(self) -> list:
+        return [file_signature(self.path)]
+
+    # Load the whole ledger.
+    def load(self) -> dict:
+        return {"version": 1, "expenses": list(self.iter_records())}
+
+    # Stream decoded records in ledger order, decoding the string table once.
+    def iter_records(self) -> Iterator[dict]:
+        with _mapped(self.path) as ledger:
+            if ledger is None:
+                return
+            strings = ledger.all_strings()
+            date = ledger.date
+            for flags, amount, day, category, currency, expense_id, note, created in (
+                ledger.all_fields()
+            ):
+                yield {
+                    "id": strings[expense_id],
+                    "date": strings[day] if flags & _DATE_STRING else date(flags, day),
+                    "category": strings[category],
+                    "amount": (
+                        _unpack_amount(flags, amount)
+                        if flags & _FLOAT_AMOUNT
+                        else amount / 100
+                    ),
+                    "currency": strings[currency],
+                    "note": strings[note],
+                    "created_at": strings[created],
+                }
+
+    # Records with the given ids, in that order; missing ids are skipped.
+    # Compares the raw id bytes of each record and decodes only the matches.
+    def records_by_id(self, ids: list[str]) -> Iterator[dict]:
+        found: dict[str, dict] = {}
+        wanted = {expense_id.encode("utf-8") for expense_id in ids}
+        with _mapped(self.path) as ledger:
+            if ledger is not None and wanted:
+                offsets, heap = ledger.string_bytes()
+                for fields in ledger.all_fields():
+                    string = fields[5]
+                    if heap[offsets[string] : offsets[string + 1]] in wanted:
+                        record = ledger.record(fields)
+                        found[record["id"]] = record
+                        if len(found) == len(wanted):
+                            break
+        return (found[expense_id] for expense_id in ids if expense_id in found)
+
+    # Replace the whole ledger (temp file, fsync, rename).
+    def save(self, data: dict) -> None:
+        chunks = _encode(data["expenses"])
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_name(f"{self.path.name}.tmp")
+        try:
+            with tmp_path.open("wb") as handle:
+                for chunk in chunks:
+                    handle.write(chunk)
+                handle.flush()
+                os.fsync(handle.fileno())
+            os.replace(tmp_path, self.path)
+        except OSError as exc:
+            get_logger().error("Failed to write data file %s: %s", self.path, exc)
+            raise RuntimeError("Unable to write data file") from exc
+        fsync_dir(self.path.parent)
+
+    # Apply operations and return the per-operation results.
+    def apply(self, ops: list[dict]) -> list[dict | None]:
+        return op_results(ops, self.apply_changes(ops))
+
+    # Apply operations, persist the result, and return what changed.
+    def apply_changes(self, ops: list[dict]) -> list[Change]:
+        data = self.load()
+        changes = apply_ops(data, ops, LedgerIndex.build(data["expenses"]))
+        if any(after is not None or before is not None for before, after in changes):
+            self.save(data)
+        return changes
+
+    # Rewrite the file, dropping unused strings; returns the number of expenses.
+    def compact(self) -> int:
+        data = self.load()
+        self.save(data)
+        return len(data["expenses"])
+
+    # Positions of records passing the filters, in ledger order.
+    #
+    # Canonical filters compare day numbers; rows or filters that are not
+    # canonical YYYY-MM-DD dates compare date strings like the JSON engines.
+    def _matching(
+        self,
+        ledger: _MappedLedger,
+        month: str | None,
+        category: str | None,
+        min_amount: float | None,
+        max_amount: float | None,
+        from_date: str | None,
+        to_date: str | None,
+    ) -> Iterator[tuple]:
+        code = None
+        if category is not None:
+            code = ledger.symbol_codes.get(category)
+            if code is None:
+                return
+        bounds = day_bounds(month, from_date, to_date)
+        low, high = bounds if bounds is not None else (None, None)
+        dated = month is not None or from_date is not None or to_date is not None
+        for position in range(ledger.count):
+            fields = ledger.fields(position)
+            flags, amount, day, category_code = fields[:4]
+            if code is not None and category_code != code:
+                continue
+            if dated and (bounds is None or flags & _DATE_STRING):
+                date_str = ledger.date(flags, day)
+                if (
+                    (month is not None and not date_str.startswith(month))
+                    or (from_date is not None and date_str < from_date)
+                    or (to_date is not None and date_str > to_date)
+                ):
+                    continue
+            elif (low is not None and day < low) or (high is not None and day > high):
+                continue
+            if min_amount is not None or max_amount is not None:
+                value = _unpack_amount(flags, amount)
+                if (min_amount is not None and value < min_amount) or (
+                    max_amount is not None and value > max_amount
+                ):
+                    continue
+            yield fields
+
+    # Stream filtered, sorted and limited rows; sort_by=None keeps ledger order.
+    def query(
+        self,
+        *,
+        month: str | None = None,
+        category: str | None = None,
+        min_amount: float | None = None,
+        max_amount: float | None = None,
+        from_date: str | None = None,
+        to_date: str | None = None,
+        sort_by: str | None = "date",
+        desc: bool = False,
+        limit: int | None = None,
+    ) -> Iterator[dict]:
+        with _mapped(self.path) as ledger:
+            if ledger is None:
+                return
+            matches = self._matching(
+                ledger, month, category, min_amount, max_amount, from_date, to_date
+            )
+            rows = (ledger.record(fields) for fields in matches)
+            if sort_by is None:
+                yield from islice(rows, limit)
+                return
+            field = _SORT_FIELDS[sort_by]
+            if limit is not None:
+                pick = heapq.nlargest if desc else heapq.nsmallest
+                yield from pick(limit, rows, key=lambda item: item[field])
+                return
+            yield from sorted(rows, key=lambda item: item[field], reverse=desc)
+
+    # Never split for parallel reads: totals decode only integer fields,
+    # which is cheaper than shipping decoded records to other processes.
+    def chunks(self, count: int, **filters) -> None:
+        return None
+
+    # Count, grand total, category, month and currency totals from the
+    # integer fields alone; exact amounts are summed in minor units.
+    def totals(
+        self,
+        *,
+        month: str | None = None,
+        category: str | None = None,
+        from_date: str | None = None,
+        to_date: str | None = None,
+    ) -> tuple[int, float, dict[str, float], dict[str, float], dict[str, float]]:
+        count = 0
+        minor_categories: dict[int, int] = {}
+        minor_months: dict[str, int] = {}
+        minor_currencies: dict[int, int] = {}
+        float_categories: dict[int, float] = {}
+        float_months: dict[str, float] = {}
+        float_currencies: dict[int, float] = {}
+        month_of: dict[tuple[int, int], str] = {}
+        with _mapped(self.path) as ledger:
+            if ledger is None:
+                return 0, 0.0, {}, {}, {}
+            matches = self._matching(
+                ledger, month, category, None, None, from_date, to_date
+            )
+            for flags, amount, day, category_code, currency_code, *_ in matches:
+                count += 1
+                key = (flags & _DATE_STRING, day)
+                month_key = month_of.get(key)
+                if month_key is None:
+                    month_key = ledger.date(flags, day)[:7]
+                    month_of[key] = month_key
+                if flags & _FLOAT_AMOUNT:
+                    value = _unpack_amount(flags, amount)
+                    float_categories[category_code] = (
+                        float_categories.get(category_code, 0.0) + value
+                    )
+                    float_months[month_key] = float_months.get(month_key, 0.0) + value
+                    float_currencies[currency_code] = (
+                        float_currencies.get(currency_code, 0.0) + value
+                    )
+                else:
+                    minor_categories[category_code] = (
+                        minor_categories.get(category_code, 0) + amount
+                    )
+                    minor_months[month_key] = minor_months.get(month_key, 0) + amount
+                    minor_currencies[currency_code] = (
+                        minor_currencies.get(currency_code, 0) + amount
+                    )
+            symbols = ledger.symbols
+
+        categories: dict[str, float] = {}
+        for code in minor_categories.keys() | float_categories.keys():
+            categories[symbols[code]] = (
+                minor_categories.get(code, 0) / 100 + float_categories.get(code, 0.0)
+            )
+        months = {
+            key: minor_months.get(key, 0) / 100 + float_months.get(key, 0.0)
+            for key in minor_months.keys() | float_months.keys()
+        }
+        currencies = {
+            symbols[code]: minor_currencies.get(code, 0) / 100
+            + float_currencies.get(code, 0.0)
+            for code in minor_currencies.keys() | float_currencies.keys()
+        }
+        total = sum(minor_categories.values()) / 100 + sum(float_categories.values())
+        return count, total, categories, months, currencies
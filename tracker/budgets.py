@@ -0,0 +1,331 @@
+from __future__ import annotations
+
+import json
+import math
+import os
+from pathlib import Path
+
+from .aggregates import Aggregates, load_aggregates
+from .logger import get_logger
+from .models import Budget, BudgetAlert, BudgetStatus
+from .rates import RateTable, load_rates, rates_path
+from .storage import Change, data_file, file_signature, sidecar_path
+from .utils import day_number, month_bounds, periods
+
+_BUDGETS_VERSION = 1
+_BUDGETS_FILE = "budgets.json"
+_COUNTERS_VERSION = 1
+_COUNTERS_SUFFIX = ".budget.json"
+
+# Last budgets read, with the path and file signature they were read from.
+_loaded: tuple[Path, list[int] | None, dict[str, Budget]] | None = None
+
+# (category, YYYY-MM) of a budget's month.
+BudgetMonth = tuple[str, str]
+
+
+# Path of the budgets file in the data directory.
+def budgets_path() -> Path:
+    return data_file(_BUDGETS_FILE)
+
+
+# Parse a budgets file:
+# {"version": 1, "budgets": {"food": {"limit": 5000.0, "currency": "BDT",
+#  "thresholds": [80, 100]}, ...}}
+def _read_budgets(path: Path) -> dict[str, Budget]:
+    try:
+        with path.open("r", encoding="utf-8") as handle:
+            payload = json.load(handle)
+    except (OSError, json.JSONDecodeError) as exc:
+        raise RuntimeError(f"Failed to read budgets file {path}: {exc}") from exc
+    if (
+        not isinstance(payload, dict)
+        or payload.get("version") != _BUDGETS_VERSION
+        or not isinstance(payload.get("budgets"), dict)
+    ):
+        raise RuntimeError(f"Invalid budgets file {path}: expected a 'budgets' object")
+    budgets = {}
+    for category, entry in payload["budgets"].items():
+        try:
+            budgets[category] = Budget(
+                category,
+                float(entry["limit"]),
+                str(entry["currency"]),
+                [int(threshold) for threshold in entry["thresholds"]],
+            )
+        except (KeyError, TypeError, ValueError) as exc:
+            raise RuntimeError(f"Invalid budgets file {path}: bad {category!r} budget") from exc
+    return budgets
+
+
+# Current budgets by category, re-read only when the budgets file changes.
+def load_budgets() -> dict[str, Budget]:
+    global _loaded
+    path = budgets_path()
+    signature = file_signature(path)
+    if _loaded is not None and _loaded[0] == path and _loaded[1] == signature:
+        return _loaded[2]
+    budgets = _read_budgets(path) if signature is not None else {}
+    _loaded = (path, signature, budgets)
+    return budgets
+
+
+# Replace the budgets file with `budgets`.
+def save_budgets(budgets: dict[str, Budget]) -> None:
+    path = budgets_path()
+    payload = {
+        "version": _BUDGETS_VERSION,
+        "budgets": {
+            category: {
+                "limit": budget.limit,
+                "currency": budget.currency,
+                "thresholds": budget.thresholds,
+            }
+            for category, budget in sorted(budgets.items())
+        },
+    }
+    tmp_path = path.with_name(f"{path.name}.tmp")
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with tmp_path.open("w", encoding="utf-8") as handle:
+            json.dump(payload, handle, ensure_ascii=True, indent=2)
+        os.replace(tmp_path, path)
+    except OSError as exc:
+        raise RuntimeError(f"Failed to write budgets file {path}: {exc}") from exc
+
+
+# Spend (minor units of the budget currency) and count of a budget's
+# month, read from the day totals: two lookups per currency series.
+def month_spend(
+    aggregates: Aggregates, budget: Budget, month: str, rates: RateTable
+) -> tuple[float, int]:
+    low, high = month_bounds(month)
+    return aggregates.span(low, high, budget.category, budget.currency, rates)
+
+
+# Thresholds a month's spend went up to or past going from `before` to
+# `after` (minor units); limit x percent is the threshold in minor units.
+def crossed(budget: Budget, before: float, after: float) -> list[int]:
+    return [
+        threshold
+        for threshold in budget.thresholds
+        if before < budget.limit * threshold <= after
+    ]
+
+
+# Spend a record adds to its budget's month, as (budget, month, minor units
+# of the budget currency); None when it has no budget or no canonical date.
+def _record_spend(
+    record: dict | None, budgets: dict[str, Budget], rates: RateTable
+) -> tuple[Budget, str, float] | None:
+    if record is None:
+        return None
+    budget = budgets.get(record["category"])
+    day = day_number(record.get("date"))
+    if budget is None or day is None:
+        return None
+    # Whole minor units, like the day totals the counters are rebuilt from.
+    amount = float(record["amount"]) * 100
+    if math.isfinite(amount):
+        amount = round(amount)
+    currency = str(record.get("currency", "BDT"))
+    if currency.upper() != budget.currency.upper():
+        amount *= rates.factor(currency, budget.currency, day)
+    return budget, record["date"][:7], amount
+
+
+# Spend and count each change moves its budget months by, one map per
+# change.
+def _spend_deltas(
+    changes: list[Change], budgets: dict[str, Budget], rates: RateTable
+) -> list[dict[BudgetMonth, list]]:
+    deltas = []
+    for change in changes:
+        moved: dict[BudgetMonth, list] = {}
+        for record, sign in zip(change, (-1, 1)):
+            spend = _record_spend(record, budgets, rates)
+            if spend is None:
+                continue
+            budget, month, amount = spend
+            delta = moved.setdefault((budget.category, month), [0, 0])
+            delta[0] += sign * amount
+            delta[1] += sign
+        deltas.append(moved)
+    return deltas
+
+
+# Alerts for the thresholds each change took its budget months to, one
+# list per change. `counters` hold the [spend, count] of every budget month
+# before the changes and are moved on in place, change by change.
+def budget_alerts(
+    counters: dict[BudgetMonth, list],
+    deltas: list[dict[BudgetMonth, list]],
+    budgets: dict[str, Budget],
+) -> list[list[BudgetAlert]]:
+    alerts = []
+    for moved in deltas:
+        found = []
+        for key, (amount, count) in moved.items():
+            budget = budgets[key[0]]
+            counter = counters.setdefault(key, [0, 0])
+            before = counter[0]
+            counter[0] = after = before + amount
+            counter[1] += count
+            found.extend(
+                BudgetAlert(
+                    budget.category, key[1], threshold, budget.limit, after / 100, budget.currency
+                )
+                for threshold in crossed(budget, before, after)
+            )
+        alerts.append(found)
+    return alerts
+
+
+# Path of the budget counters file next to the ledger.
+def _counters_path() -> Path:
+    return sidecar_path(_COUNTERS_SUFFIX)
+
+
+# What budget counters depend on: the ledger stamp and the budgets and rates
+# files.
+def _counters_stamp(ledger_stamp: list) -> list:
+    return [ledger_stamp, file_signature(budgets_path()), file_signature(rates_path())]
+
+
+# Read the budget counters file as (stamp, counters); (None, None) when it
+# is missing or unusable. The file is small: one [spend, count] per budget
+# month with expenses.
+def _read_counters(path: Path) -> tuple[object, dict[BudgetMonth, list] | None]:
+    try:
+        with path.open("r", encoding="utf-8") as handle:
+            payload = json.load(handle)
+        counters = {
+            (category, month): [float(spend), int(count)]
+            for category, months in payload["spend"].items()
+            for month, (spend, count) in months.items()
+        }
+    except FileNotFoundError:
+        return None, None
+    except (OSError, ValueError, KeyError, TypeError, AttributeError) as exc:
+        get_logger().error("Ignoring unreadable budget counters %s: %s", path, exc)
+        return None, None
+    return payload.get("stamp"), counters
+
+
+# Persist budget counters for `stamp`; a failed write is logged and left
+# for the next read to rebuild.
+def _write_counters(path: Path, stamp: list, counters: dict[BudgetMonth, list]) -> None:
+    nested: dict[str, dict[str, list]] = {}
+    for (category, month), counter in sorted(counters.items()):
+        if counter[1]:
+            nested.setdefault(category, {})[month] = counter
+    payload = {"version": _COUNTERS_VERSION, "stamp": stamp, "spend": nested}
+    tmp_path = path.with_name(f"{path.name}.tmp")
+    try:
+        with tmp_path.open("w", encoding="utf-8") as handle:
+            json.dump(payload, handle, ensure_ascii=True, separators=(",", ":"))
+        os.replace(tmp_path, path)
+    except OSError as exc:
+        get_logger().error("Failed to write budget counters %s: %s", path, exc)
+
+
+# Counters of every budget month with expenses, from the day totals.
+def _build_counters(
+    aggregates: Aggregates, budgets: dict[str, Budget], rates: RateTable
+) -> dict[BudgetMonth, list]:
+    counters = {}
+    for category, budget in budgets.items():
+        known = aggregates.bounds(category)
+        if known is None:
+            continue
+        for month, _, _ in periods(known[0], known[1], "month"):
+            spent, count = month_spend(aggregates, budget, month, rates)
+            if count:
+                counters[(category, month)] = [spent, count]
+    return counters
+
+
+# Budget counters of the current ledger, rebuilt from the day totals when
+# missing or stale.
+#
+# Reads do not take the ledger lock, so rebuilt counters are only stored
+# when the ledger, budgets and rates did not change while they were built:
+# a write stored in the meantime moves the counters it finds under the
+# older stamp, and would count its spend twice.
+def load_counters(
+    store, budgets: dict[str, Budget], rates: RateTable
+) -> dict[BudgetMonth, list]:
+    path = _counters_path()
+    stamp = _counters_stamp(store.stamp())
+    stored_stamp, counters = _read_counters(path)
+    if counters is not None and stored_stamp == stamp:
+        return counters
+    get_logger().info("Rebuilding budget counters %s", path)
+    counters = _build_counters(load_aggregates(store), budgets, rates)
+    if _counters_stamp(store.stamp()) == stamp:
+        _write_counters(path, stamp, counters)
+    else:
+        get_logger().info("Ledger changed while building budget counters; not storing them")
+    return counters
+
+
+# Budget alerts of a write, one list per change; `stamp` is the ledger
+# stamp taken before the write. The counters of the budget months the
+# changes touch are moved in place, so the cost depends on the write and
+# the number of budget months, not on the ledger or the day totals;
+# counters that were stale are rebuilt from the (already updated) day
+# totals.
+#
+# Runs after the write is stored, so a bad budgets file or a missing rate
+# is logged and the checks skipped rather than failing the write.
+def write_alerts(store, stamp: list, changes: list[Change]) -> list[list[BudgetAlert]]:
+    try:
+        budgets = load_budgets()
+        if not budgets:
+            return [[] for _ in changes]
+        deltas = None
+        if any(
+            record is not None and record["category"] in budgets
+            for change in changes
+            for record in change
+        ):
+            deltas = _spend_deltas(changes, budgets, load_rates())
+        path = _counters_path()
+        stored_stamp, counters = _read_counters(path)
+        if counters is None or stored_stamp != _counters_stamp(stamp):
+            get_logger().info("Rebuilding budget counters %s", path)
+            counters = _build_counters(load_aggregates(store), budgets, load_rates())
+            # The day totals include the write: step back to before it.
+            for moved in deltas or ():
+                for key, (amount, count) in moved.items():
+                    counter = counters.setdefault(key, [0, 0])
+                    counter[0] -= amount
+                    counter[1] -= count
+        alerts = (
+            budget_alerts(counters, deltas, budgets) if deltas else [[] for _ in changes]
+        )
+        _write_counters(path, _counters_stamp(store.stamp()), counters)
+        return alerts
+    except Exception as exc:
+        get_logger().error("Skipping budget checks: %s", exc)
+        return [[] for _ in changes]
+
+
+# Move the budget alerts of a write result into `alerts`, when given.
+def take_alerts(result: dict, alerts: list[BudgetAlert] | None) -> None:
+    if alerts is not None:
+        alerts.extend(BudgetAlert(**alert) for alert in result.get("alerts", ()))
+
+
+# Spend of every budget in a month, from the budget counters.
+def budget_statuses(
+    counters: dict[BudgetMonth, list], budgets: dict[str, Budget], month: str
+) -> list[BudgetStatus]:
+    statuses = []
+    for category, budget in sorted(budgets.items()):
+        spent, count = counters.get((category, month), (0, 0))
+        reached = crossed(budget, -1, spent)
+        statuses.append(
+            BudgetStatus(budget, month, spent / 100, count, max(reached, default=None))
+        )
+    return statuses
@@ -1,18 +1,19 @@
 from __future__ import annotations
 
 import argparse
+import math
+import os
 import sys
+import time
+from itertools import chain, islice
+from typing import Iterable, Iterator
 
-from .logger import get_logger
-from .service import (
-    add_expense,
-    delete_expense,
-    edit_expense,
-    export_csv,
-    list_expenses,
-    summary,
-)
-from .utils import format_amount, parse_date, parse_month, today_str
+from .logger import get_logger, operation_fields
+from .spans import Span, span
+from .utils import day_bounds, format_amount, month_bounds, parse_date, parse_month, today_str
+
+# Service, storage and daemon modules are imported inside the handlers that
+# use them, so `--help`, argument errors and the parser stay cheap.
 
 
 # Parse and validate positive amount input.
@@ -21,19 +22,21 @@ def _positive_amount(value: str) -> float:
         amount = float(value)
     except ValueError as exc:
         raise ValueError("amount must be a number") from exc
+    if not math.isfinite(amount):
+        raise ValueError("amount must be a number")
     if amount <= 0:
         raise ValueError("amount must be > 0")
     return amount
 
 
 # Parse and validate positive integer input.
-def _positive_int(value: str) -> int:
+def _positive_int(value: str, name: str = "limit") -> int:
     try:
         number = int(value)
     except ValueError as exc:
-        raise ValueError("limit must be an integer") from exc
+        raise ValueError(f"{name} must be an integer") from exc
     if number <= 0:
-        raise ValueError("limit must be > 0")
+        raise ValueError(f"{name} must be > 0")
     return number
 
 
@@ -42,20 +45,113 @@ def _validate_month(value: str) -> None:
     parse_month(value)
 
 
-# Render a boxed table for expenses.
-def _render_table(expenses: list) -> str:
-    headers = ["id", "date", "category", "amount", "note"]
-    rows = [
+# Normalize the currency code of --in.
+def _currency_arg(value: str | None) -> str | None:
+    if value is None:
+        return None
+    code = value.strip().upper()
+    if not code.isalpha():
+        raise ValueError("currency must be a code such as USD")
+    return code
+
+
+# Backend for ledger commands: the running daemon, else direct file access.
+def _backend():
+    from .client import DaemonClient
+
+    client = DaemonClient.connect()
+    if client is not None:
+        return client
+    from . import service
+
+    return service
+
+
+# Empty query plan to fill for --explain, else None.
+def _plan_arg(explain: bool):
+    if not explain:
+        return None
+    from .query import QueryPlan
+
+    return QueryPlan()
+
+
+# Print the query plan chosen for list/export --explain.
+def _print_plan(plan, out=None) -> None:
+    print("\nQuery plan:", file=out)
+    for line in plan.lines():
+        print(f"  {line}", file=out)
+
+
+# Map the --sort choice to a service sort key ("none" keeps storage order).
+def _sort_arg(value: str) -> str | None:
+    return None if value == "none" else value
+
+
+_EXPENSE_HEADERS = ["id", "date", "category", "amount", "note"]
+# Free-text columns of the expense table, cut to fit when a later row is
+# wider than the sampled rows.
+_CLIPPED_COLUMNS = (2, 4)
+_EXPORT_HEADERS = ["id", "date", "category", "amount", "currency", "note", "created_at"]
+# Rows that fix the streamed table's column widths.
+_SAMPLE_ROWS = 1000
+# Rows written to stdout per write call.
+_WRITE_ROWS = 1000
+_PAGE_SIZE = 50
+# Matches shown by search unless --limit says otherwise.
+_SEARCH_LIMIT = 20
+_TSV_ESCAPES = str.maketrans({"\\": "\\\\", "\t": "\\t", "\n": "\\n", "\r": "\\r"})
+
+
+# Write expenses as a boxed table, streamed; returns the row count.
+def _write_table(expenses: Iterator, max_width: int | None = None) -> int:
+    rows = (
+        [exp.id, exp.date, exp.category, format_amount(exp.amount, exp.currency), exp.note]
+        for exp in expenses
+    )
+    return _write_box_table(_EXPENSE_HEADERS, rows, _CLIPPED_COLUMNS, max_width)
+
+
+# Write expenses as tab-separated values with a header line, in the CSV
+# export's columns; tabs, newlines and backslashes in values are escaped.
+def _write_tsv(expenses: Iterator) -> int:
+    rows = (
         [
             exp.id,
             exp.date,
             exp.category,
-            format_amount(exp.amount, exp.currency),
+            f"{exp.amount:.2f}",
+            exp.currency,
             exp.note,
+            exp.created_at,
         ]
         for exp in expenses
-    ]
-    return _render_box_table(headers, rows)
+    )
+    lines = (
+        "\t".join(value.translate(_TSV_ESCAPES) for value in row)
+        for row in chain([_EXPORT_HEADERS], rows)
+    )
+    return _write_lines(lines) - 1
+
+
+# Write expenses as one JSON object per line.
+def _write_jsonl(expenses: Iterator) -> int:
+    import json
+
+    return _write_lines(json.dumps(exp.to_dict(), ensure_ascii=False) for exp in expenses)
+
+
+# Write lines to stdout in batches; returns the line count.
+def _write_lines(lines: Iterable[str]) -> int:
+    lines = iter(lines)
+    count = 0
+    out = sys.stdout
+    with span("render.table"):
+        for batch in iter(lambda: list(islice(lines, _WRITE_ROWS)), []):
+            out.write("\n".join(batch) + "\n")
+            count += len(batch)
+    out.flush()
+    return count
 
 
 # Print an error message to stderr.
@@ -65,26 +161,71 @@ def _print_error(message: str) -> None:
 
 # Render a boxed table.
 def _render_box_table(headers: list[str], rows: list[list[str]]) -> str:
+    with span("render.table"):
+        return "\n".join(_box_lines(headers, rows, len(rows)))
+
+
+# Write a boxed table to stdout as rows arrive; returns the row count.
+#
+# Column widths come from the headers and the first rows, capped at
+# `max_width`. Cells wider than their column are cut with an ellipsis in
+# the `clipped` columns, or in every column when `max_width` is given.
+def _write_box_table(
+    headers: list[str],
+    rows: Iterable[list[str]],
+    clipped: tuple[int, ...] = (),
+    max_width: int | None = None,
+) -> int:
+    count = 0
+
+    def _counted() -> Iterator[list[str]]:
+        nonlocal count
+        for row in rows:
+            count += 1
+            yield row
+
+    _write_lines(_box_lines(headers, _counted(), _SAMPLE_ROWS, clipped, max_width))
+    return count
+
+
+# Box-drawing lines of a table with widths fixed from the first `sample` rows.
+def _box_lines(
+    headers: list[str],
+    rows: Iterable[list[str]],
+    sample: int,
+    clipped: tuple[int, ...] = (),
+    max_width: int | None = None,
+) -> Iterator[str]:
+    rows = iter(rows)
+    head = list(islice(rows, sample))
     widths = [len(header) for header in headers]
-    for row in rows:
-        widths = [max(widths[i], len(str(row[i]))) for i in range(len(headers))]
+    for row in head:
+        for i, value in enumerate(row):
+            width = len(str(value))
+            if width > widths[i]:
+                widths[i] = width
+    if max_width is not None:
+        widths = [min(width, max_width) for width in widths]
+        clipped = tuple(range(len(headers)))
 
     def _hline(left: str, mid: str, right: str) -> str:
-        parts = ["─" * (widths[i] + 2) for i in range(len(headers))]
-        return left + mid.join(parts) + right
+        return left + mid.join("─" * (width + 2) for width in widths) + right
 
     def _format_row(values: list[str]) -> str:
-        cells = [f" {str(values[i]).ljust(widths[i])} " for i in range(len(values))]
+        cells = []
+        for i, value in enumerate(values):
+            value = str(value)
+            if len(value) > widths[i] and i in clipped:
+                value = value[: max(widths[i] - 1, 0)] + "…"
+            cells.append(f" {value.ljust(widths[i])} ")
         return "│" + "│".join(cells) + "│"
 
-    lines = [
-        _hline("┌", "┬", "┐"),
-        _format_row(headers),
-        _hline("├", "┼", "┤"),
-    ]
-    lines.extend(_format_row(row) for row in rows)
-    lines.append(_hline("└", "┴", "┘"))
-    return "\n".join(lines)
+    yield _hline("┌", "┬", "┐")
+    yield _format_row(headers)
+    yield _hline("├", "┼", "┤")
+    for row in chain(head, rows):
+        yield _format_row(row)
+    yield _hline("└", "┴", "┘")
 
 
 # Render a boxed 2-column key/value table.
@@ -98,65 +239,164 @@ class _LoggingArgumentParser(argparse.ArgumentParser):
         super().error(message)
 
 
+# One-line description of a stored expense.
+def _describe(expense) -> str:
+    return (
+        f"{expense.id} | {expense.date} | {expense.category} | "
+        f"{format_amount(expense.amount, expense.currency)} | {expense.note}"
+    )
+
+
+# One line per budget threshold a write reached.
+def _alert_lines(alerts: Iterable) -> list[str]:
+    return [
+        f"Budget alert: {alert.category} {alert.month} reached {alert.threshold}% "
+        f"({format_amount(alert.spent, alert.currency)} of "
+        f"{format_amount(alert.limit, alert.currency)})"
+        for alert in alerts
+    ]
+
+
+# Validated add_expense fields from parsed `add` arguments.
+def _add_fields(args: argparse.Namespace) -> dict:
+    date = args.date or today_str()
+    if args.date:
+        parse_date(args.date)
+    category = args.category.strip()
+    if not category:
+        raise ValueError("category is required")
+    return {
+        "date": date,
+        "category": category.lower(),
+        "amount": _positive_amount(args.amount),
+        "note": args.note or "",
+        "currency": args.currency,
+    }
+
+
 # Handle add command.
 def _handle_add(args: argparse.Namespace) -> int:
+    alerts: list = []
     try:
-        date = args.date or today_str()
-        if args.date:
-            parse_date(args.date)
-        category = args.category.strip()
-        if not category:
-            raise ValueError("category is required")
-        amount = _positive_amount(args.amount)
-        expense = add_expense(
-            date=date,
-            category=category.lower(),
-            amount=amount,
-            note=args.note or "",
-            currency=args.currency,
-        )
+        expense = _backend().add_expense(**_add_fields(args), alerts=alerts)
     except ValueError as exc:
         get_logger().error("Validation failure on add: %s", exc)
         _print_error(str(exc))
         return 1
 
-    print(
-        f"Added: {expense.id} | {expense.date} | {expense.category} | "
-        f"{format_amount(expense.amount, expense.currency)} | {expense.note}"
-    )
+    print(f"Added: {_describe(expense)}")
+    for line in _alert_lines(alerts):
+        print(line)
     return 0
 
 
+# Offset and row limit of --page/--page-size, paging within the --limit rows.
+def _page_args(
+    page: str | None, page_size: str | None, limit: int | None
+) -> tuple[int, int | None]:
+    if page is None and page_size is None:
+        return 0, limit
+    number = _positive_int(page, "page") if page else 1
+    size = _positive_int(page_size, "page-size") if page_size else _PAGE_SIZE
+    offset = (number - 1) * size
+    if limit is not None:
+        size = max(min(size, limit - offset), 0)
+    return offset, size
+
+
 # Handle list command.
 def _handle_list(args: argparse.Namespace) -> int:
+    plain = args.format != "box"
     try:
         if args.month:
             _validate_month(args.month)
         min_amount = _positive_amount(args.min) if args.min else None
         max_amount = _positive_amount(args.max) if args.max else None
         limit = _positive_int(args.limit) if args.limit else None
-        expenses = list_expenses(
+        offset, limit = _page_args(args.page, args.page_size, limit)
+        max_width = _positive_int(args.max_width, "max-width") if args.max_width else None
+        plan = _plan_arg(args.explain)
+        expenses: Iterator = iter(())
+        if limit != 0:
+            expenses = _backend().query_expenses(
+                month=args.month,
+                category=args.category,
+                min_amount=min_amount,
+                max_amount=max_amount,
+                sort_by=_sort_arg(args.sort),
+                desc=args.desc,
+                limit=limit,
+                plan=plan,
+                currency=_currency_arg(args.in_currency),
+                offset=offset,
+            )
+        # Rows arrive lazily, so conversion errors can surface while writing.
+        first = next(expenses, None)
+        rows = chain([] if first is None else [first], expenses)
+        if args.format == "tsv":
+            _write_tsv(rows)
+        elif args.format == "jsonl":
+            _write_jsonl(rows)
+        elif first is None:
+            print("No expenses found.")
+        else:
+            count = _write_table(rows, max_width)
+            if args.page or args.page_size:
+                print(f"Page {int(args.page or 1)}: rows {offset + 1}-{offset + count}")
+    except ValueError as exc:
+        get_logger().error("Validation failure on list: %s", exc)
+        _print_error(str(exc))
+        return 1
+
+    if plan is not None:
+        _print_plan(plan, sys.stderr if plain else sys.stdout)
+    return 0
+
+
+# Handle search command.
+def _handle_search(args: argparse.Namespace) -> int:
+    query = " ".join(args.query)
+    try:
+        if args.month:
+            _validate_month(args.month)
+        min_amount = _positive_amount(args.min) if args.min else None
+        max_amount = _positive_amount(args.max) if args.max else None
+        limit = _positive_int(args.limit)
+        max_width = _positive_int(args.max_width, "max-width") if args.max_width else None
+        expenses = _backend().search_expenses(
+            query,
             month=args.month,
             category=args.category,
             min_amount=min_amount,
             max_amount=max_amount,
-            sort_by=args.sort,
-            desc=args.desc,
             limit=limit,
         )
     except ValueError as exc:
-        get_logger().error("Validation failure on list: %s", exc)
+        get_logger().error("Validation failure on search: %s", exc)
         _print_error(str(exc))
         return 1
 
-    if not expenses:
-        print("No expenses found.")
-        return 0
-
-    print(_render_table(expenses))
+    if args.format == "tsv":
+        _write_tsv(iter(expenses))
+    elif args.format == "jsonl":
+        _write_jsonl(iter(expenses))
+    elif not expenses:
+        print(f"No expenses match {query!r}.")
+    else:
+        _write_table(iter(expenses), max_width)
     return 0
 
 
+# Days of a YYYY-MM month within the days low..high (either may be None).
+def _days_in(month: str, low: int | None, high: int | None) -> int:
+    first, last = month_bounds(month)
+    if low is not None:
+        first = max(first, low)
+    if high is not None:
+        last = min(last, high)
+    return max(last - first + 1, 1)
+
+
 # Handle summary command.
 def _handle_summary(args: argparse.Namespace) -> int:
     try:
@@ -166,32 +406,59 @@ def _handle_summary(args: argparse.Namespace) -> int:
             parse_date(args.from_date)
         if args.to_date:
             parse_date(args.to_date)
+        if args.workers is not None:
+            workers = _positive_int(args.workers, "workers")
+        else:
+            workers = os.cpu_count() or 1
+        result = _backend().summary_totals(
+            month=args.month,
+            category=args.category,
+            from_date=args.from_date,
+            to_date=args.to_date,
+            currency=_currency_arg(args.in_currency),
+            workers=workers,
+        )
     except ValueError as exc:
         get_logger().error("Validation failure on summary: %s", exc)
         _print_error(str(exc))
         return 1
 
-    expenses, categories, months = summary(
-        month=args.month,
-        category=args.category,
-        from_date=args.from_date,
-        to_date=args.to_date,
-    )
+    categories = result.categories
+    months = result.months
+    currencies = result.currencies
 
     if not categories:
         print("No expenses to summarize.")
         return 0
 
-    total_amount = sum(item.amount for item in expenses)
+    # Without --in, amounts in several currencies can only be added as-is.
+    label = result.currency
+    if label is None:
+        label = next(iter(currencies)) if len(currencies) == 1 else "(mixed)"
     summary_rows = [
-        ["Total Expenses", str(len(expenses))],
-        ["Grand Total", format_amount(total_amount, "BDT")],
+        ["Total Expenses", str(result.count)],
+        ["Grand Total", format_amount(result.total, label)],
     ]
+    low, high = day_bounds(args.month, args.from_date, args.to_date) or (None, None)
+    if low is not None and high is not None and low <= high:
+        summary_rows.append(
+            ["Average per day", format_amount(result.total / (high - low + 1), label)]
+        )
     print(_render_kv_table(["metric", "value"], summary_rows))
 
+    if len(currencies) > 1 or (label not in currencies and currencies):
+        currency_rows = [
+            [currency, format_amount(currencies[currency], currency)]
+            for currency in sorted(currencies)
+        ]
+        print("\nBy currency:")
+        print(_render_kv_table(["currency", "total"], currency_rows))
+        if result.currency is None:
+            print("Totals add amounts in different currencies; use --in CUR to convert.")
+
     if categories:
         category_rows = [
-            [category, format_amount(categories[category], "BDT")]
+            [category, format_amount(categories[category], label)]
             for category in sorted(categories)
         ]
         print("\nBy category:")
@@ -199,7 +466,7 @@ def _handle_summary(args: argparse.Namespace) -> int:
 
     if months:
         avg_rows = [
-            [month, format_amount(months[month] / 30, "BDT")]
+            [month, format_amount(months[month] / _days_in(month, low, high), label)]
             for month in sorted(months)
         ]
         print("\nAverage per day in month:")
@@ -208,6 +475,163 @@ def _handle_summary(args: argparse.Namespace) -> int:
     return 0
 
 
+# Handle trend command.
+def _handle_trend(args: argparse.Namespace) -> int:
+    try:
+        if args.month:
+            _validate_month(args.month)
+        if args.from_date:
+            parse_date(args.from_date)
+        if args.to_date:
+            parse_date(args.to_date)
+        window = _positive_int(args.window, "window") if args.window else None
+        trend = _backend().trend_series(
+            by=args.by,
+            month=args.month,
+            from_date=args.from_date,
+            to_date=args.to_date,
+            category=args.category,
+            window=window,
+            currency=_currency_arg(args.in_currency),
+        )
+    except ValueError as exc:
+        get_logger().error("Validation failure on trend: %s", exc)
+        _print_error(str(exc))
+        return 1
+
+    overall = trend.overall
+    if overall is None or not overall.count:
+        print("No expenses in range.")
+        return 0
+    label = trend.currency
+    if label is None:
+        label = trend.currencies[0] if len(trend.currencies) == 1 else "(mixed)"
+    headers = [args.by, "days", "count", "total", "avg/day"]
+    if window is not None:
+        headers.append(f"{window}-day avg")
+    rows = []
+    for point in trend.points:
+        days = _day_count(point.start, point.end)
+        row = [
+            point.period,
+            str(days),
+            str(point.count),
+            format_amount(point.total, label),
+            format_amount(point.average, label),
+        ]
+        if point.rolling is not None:
+            row.append(format_amount(point.rolling, label))
+        rows.append(row)
+    print(_render_box_table(headers, rows))
+    print(
+        f"{overall.start}..{overall.end}: {overall.count} expense(s), "
+        f"{format_amount(overall.total, label)} over "
+        f"{_day_count(overall.start, overall.end)} day(s), "
+        f"{format_amount(overall.average, label)}/day"
+    )
+    if trend.currency is None and len(trend.currencies) > 1:
+        print("Totals add amounts in different currencies; use --in CUR to convert.")
+    return 0
+
+
+# Days from one YYYY-MM-DD date to another, both included.
+def _day_count(start: str, end: str) -> int:
+    return (parse_date(end) - parse_date(start)).days + 1
+
+
+# Percent thresholds as "80%, 100%".
+def _percents(thresholds: Iterable[int]) -> str:
+    return ", ".join(f"{threshold}%" for threshold in thresholds)
+
+
+# Handle budget set command.
+def _handle_budget_set(args: argparse.Namespace) -> int:
+    from . import service
+
+    try:
+        category = args.category.strip().lower()
+        if not category:
+            raise ValueError("category is required")
+        thresholds = [
+            _positive_int(part.strip().rstrip("%"), "alert")
+            for part in args.alerts.split(",")
+        ]
+        budget = service.set_budget(
+            category=category,
+            limit=_positive_amount(args.amount),
+            currency=_currency_arg(args.currency),
+            thresholds=thresholds,
+        )
+    except ValueError as exc:
+        get_logger().error("Validation failure on budget set: %s", exc)
+        _print_error(str(exc))
+        return 1
+
+    print(
+        f"Budget set: {budget.category} {format_amount(budget.limit, budget.currency)} "
+        f"per month, alerts at {_percents(budget.thresholds)}"
+    )
+    return 0
+
+
+# Handle budget list command.
+def _handle_budget_list(args: argparse.Namespace) -> int:
+    from . import service
+
+    budgets = service.list_budgets()
+    if not budgets:
+        print("No budgets set.")
+        return 0
+    rows = [
+        [
+            budget.category,
+            format_amount(budget.limit, budget.currency),
+            _percents(budget.thresholds),
+        ]
+        for budget in budgets
+    ]
+    print(_render_box_table(["category", "monthly limit", "alerts"], rows))
+    return 0
+
+
+# Handle budget status command.
+def _handle_budget_status(args: argparse.Namespace) -> int:
+    from . import service
+
+    try:
+        if args.month:
+            _validate_month(args.month)
+        statuses = service.budget_status(args.month)
+    except ValueError as exc:
+        get_logger().error("Validation failure on budget status: %s", exc)
+        _print_error(str(exc))
+        return 1
+
+    if not statuses:
+        print("No budgets set.")
+        return 0
+    rows = []
+    for status in statuses:
+        budget = status.budget
+        rows.append(
+            [
+                budget.category,
+                str(status.count),
+                format_amount(status.spent, budget.currency),
+                format_amount(budget.limit, budget.currency),
+                f"{status.spent / budget.limit * 100:.0f}%",
+                f"{status.reached}%" if status.reached is not None else "-",
+            ]
+        )
+    print(f"Budgets for {statuses[0].month}:")
+    print(
+        _render_box_table(
+            ["category", "count", "spent", "limit", "used", "reached"], rows
+        )
+    )
+    return 0
+
+
 # Handle export command.
 def _handle_export(args: argparse.Namespace) -> int:
     try:
@@ -216,28 +640,33 @@ def _handle_export(args: argparse.Namespace) -> int:
         min_amount = _positive_amount(args.min) if args.min else None
         max_amount = _positive_amount(args.max) if args.max else None
         limit = _positive_int(args.limit) if args.limit else None
+        plan = _plan_arg(args.explain)
+        path, count = _backend().export_expenses(
+            args.path,
+            month=args.month,
+            category=args.category,
+            min_amount=min_amount,
+            max_amount=max_amount,
+            sort_by=_sort_arg(args.sort),
+            desc=args.desc,
+            limit=limit,
+            plan=plan,
+            currency=_currency_arg(args.in_currency),
+        )
     except ValueError as exc:
         get_logger().error("Validation failure on export: %s", exc)
         _print_error(str(exc))
         return 1
 
-    expenses = list_expenses(
-        month=args.month,
-        category=args.category,
-        min_amount=min_amount,
-        max_amount=max_amount,
-        sort_by=args.sort,
-        desc=args.desc,
-        limit=limit,
-    )
-    path = export_csv(args.path, expenses)
-    print(f"Exported {len(expenses)} expense(s) to {path}")
+    print(f"Exported {count} expense(s) to {path}")
+    if plan is not None:
+        _print_plan(plan)
     return 0
 
 
 # Handle delete command.
 def _handle_delete(args: argparse.Namespace) -> int:
-    deleted = delete_expense(args.id)
+    deleted = _backend().delete_expense(args.id)
     if not deleted:
         _print_error(f"Expense not found: {args.id}")
         get_logger().error("Delete failed: %s", args.id)
@@ -246,57 +675,277 @@ def _handle_delete(args: argparse.Namespace) -> int:
     return 0
 
 
+# Validated edit_expense fields from parsed `edit` arguments.
+def _edit_fields(args: argparse.Namespace) -> dict:
+    if not any([args.date, args.category, args.amount, args.note, args.currency]):
+        raise ValueError("At least one field is required to edit")
+    if args.date:
+        parse_date(args.date)
+    category = None
+    if args.category is not None:
+        category = args.category.strip().lower()
+        if not category:
+            raise ValueError("category is required")
+    return {
+        "expense_id": args.id,
+        "date": args.date,
+        "category": category,
+        "amount": _positive_amount(args.amount) if args.amount else None,
+        "note": args.note,
+        "currency": args.currency,
+    }
+
+
 # Handle edit command.
 def _handle_edit(args: argparse.Namespace) -> int:
-    if not any(
-        [
-            args.date,
-            args.category,
-            args.amount,
-            args.note,
-            args.currency,
-        ]
-    ):
-        _print_error("At least one field is required to edit")
-        return 1
-
     try:
-        if args.date:
-            parse_date(args.date)
-        if args.amount:
-            args.amount = _positive_amount(args.amount)
-        if args.category is not None:
-            args.category = args.category.strip()
-            if not args.category:
-                raise ValueError("category is required")
+        fields = _edit_fields(args)
     except ValueError as exc:
         get_logger().error("Validation failure on edit: %s", exc)
         _print_error(str(exc))
         return 1
 
-    expense = edit_expense(
-        expense_id=args.id,
-        date=args.date,
-        category=args.category.lower() if args.category else None,
-        amount=args.amount,
-        note=args.note,
-        currency=args.currency,
-    )
+    alerts: list = []
+    expense = _backend().edit_expense(**fields, alerts=alerts)
     if expense is None:
         _print_error(f"Expense not found: {args.id}")
         get_logger().error("Edit failed: %s", args.id)
         return 1
 
+    print(f"Updated: {_describe(expense)}")
+    for line in _alert_lines(alerts):
+        print(line)
+    return 0
+
+
+# Argument parser for batch lines: errors raise ValueError instead of exiting.
+class _BatchArgumentParser(argparse.ArgumentParser):
+    def error(self, message: str) -> None:
+        raise ValueError(message)
+
+    def print_help(self, file=None) -> None:
+        pass
+
+    def exit(self, status: int = 0, message: str | None = None) -> None:
+        raise ValueError((message or "").strip() or "help is not available in a batch")
+
+
+# Arguments of one batch line: a JSON list of arguments or a JSON string
+# holding a command line.
+def _batch_argv(text: str) -> list[str]:
+    import json
+    import shlex
+
+    try:
+        value = json.loads(text)
+    except json.JSONDecodeError as exc:
+        raise ValueError(f"invalid JSON: {exc.msg}") from exc
+    if isinstance(value, str):
+        value = shlex.split(value)
+    if not isinstance(value, list) or not all(isinstance(item, str) for item in value):
+        raise ValueError("expected a command string or a list of argument strings")
+    return value
+
+
+# Write operation for one batch line, parsed with the CLI's own subcommands.
+def _batch_op(parser: argparse.ArgumentParser, argv: list[str]) -> dict:
+    from . import service
+
+    args = parser.parse_args(argv)
+    if args.command == "add":
+        return service.add_op(**_add_fields(args))
+    if args.command == "edit":
+        return service.edit_op(**_edit_fields(args))
+    if args.command == "delete":
+        return service.delete_op(args.id)
+    raise ValueError(f"batch runs add, edit and delete, not {args.command}")
+
+
+# Status line of one applied batch operation.
+def _batch_status(op: dict, result: dict) -> str:
+    from .models import Expense
+
+    if op["op"] == "delete":
+        return f"Deleted: {op['id']}"
+    label = "Added" if op["op"] == "add" else "Updated"
+    return f"{label}: {_describe(Expense.from_dict(result))}"
+
+
+# Handle batch command: parse every line, then apply them all in one commit.
+def _handle_batch(args: argparse.Namespace) -> int:
+    from . import service
+    from .models import BudgetAlert
+
+    started = time.perf_counter()
+    parser = build_parser(_BatchArgumentParser)
+    ops: list[dict] = []
+    numbers: list[int] = []
+    errors: list[str] = []
+    try:
+        handle = (
+            sys.stdin
+            if args.file in (None, "-")
+            else open(args.file, "r", encoding="utf-8")
+        )
+        with handle:
+            for number, line in enumerate(handle, start=1):
+                text = line.strip()
+                if not text:
+                    continue
+                try:
+                    ops.append(_batch_op(parser, _batch_argv(text)))
+                    numbers.append(number)
+                except ValueError as exc:
+                    errors.append(f"line {number}: {exc}")
+    except OSError as exc:
+        get_logger().error("Batch file error: %s", exc)
+        _print_error(f"cannot read {args.file}: {exc.strerror}")
+        return 1
+
+    if errors:
+        get_logger().error("Validation failure on batch: %d invalid line(s)", len(errors))
+        for message in errors:
+            _print_error(message)
+        _print_error(f"{len(errors)} invalid line(s); nothing was applied")
+        return 1
+    if not ops:
+        print("No operations to apply.")
+        return 0
+
+    try:
+        results = service.apply_batch(ops)
+    except ValueError as exc:
+        get_logger().error("Batch failed: %s", exc)
+        target = getattr(exc, "expense_id", None)
+        lines = [
+            str(number)
+            for number, op in zip(numbers, ops)
+            if op["op"] != "add" and op["id"] == target
+        ]
+        where = f" (line{'s' if len(lines) > 1 else ''} {', '.join(lines)})" if lines else ""
+        _print_error(f"{exc}{where}; nothing was applied")
+        return 1
+
+    for number, op, result in zip(numbers, ops, results):
+        print(f"line {number}: {_batch_status(op, result)}")
+        alerts = [BudgetAlert(**alert) for alert in result.get("alerts", ())]
+        for line in _alert_lines(alerts):
+            print(f"line {number}: {line}")
+    elapsed = time.perf_counter() - started
     print(
-        f"Updated: {expense.id} | {expense.date} | {expense.category} | "
-        f"{format_amount(expense.amount, expense.currency)} | {expense.note}"
+        f"Applied {len(ops)} operation(s) in one commit in {elapsed * 1000:.1f} ms "
+        f"({len(ops) / elapsed:.1f} ops/s)"
     )
     return 0
 
 
-# Build and configure CLI parser.
-def build_parser() -> argparse.ArgumentParser:
-    parser = _LoggingArgumentParser(prog="tracker", description="Expense Tracker CLI")
+# Handle import command.
+def _handle_import(args: argparse.Namespace) -> int:
+    def _progress(count: int) -> None:
+        print(f"\rRead {count} row(s)", end="", file=sys.stderr, flush=True)
+
+    from .service import import_expenses
+
+    started = time.perf_counter()
+    try:
+        report = import_expenses(
+            args.path, skip_invalid=args.skip_invalid, progress=_progress
+        )
+    except ValueError as exc:
+        get_logger().error("Validation failure on import: %s", exc)
+        _print_error(str(exc))
+        return 1
+    elapsed = time.perf_counter() - started
+    print(file=sys.stderr)
+
+    for error in report.errors:
+        _print_error(error)
+    if report.skipped and not args.skip_invalid:
+        _print_error(
+            f"{report.skipped} invalid row(s); nothing imported "
+            "(use --skip-invalid to import the rest)"
+        )
+        return 1
+
+    rate = report.imported / elapsed if elapsed > 0 else float(report.imported)
+    print(
+        f"Imported {report.imported} expense(s), skipped {report.skipped} "
+        f"in {elapsed:.2f}s ({rate:.0f} rows/sec)"
+    )
+    return 0
+
+
+# Handle compact command.
+def _handle_compact(args: argparse.Namespace) -> int:
+    from .service import compact_storage
+
+    count = compact_storage()
+    print(f"Compacted {count} expense(s) into the snapshot")
+    return 0
+
+
+# Handle verify command.
+def _handle_verify(args: argparse.Namespace) -> int:
+    from .service import verify_storage
+
+    differences = verify_storage()
+    if not differences:
+        print("Aggregates match the ledger.")
+        return 0
+    print("Aggregates differed from the ledger and were rebuilt:")
+    for line in differences:
+        print(f"  {line}")
+    return 1
+
+
+# Handle migrate command.
+def _handle_migrate(args: argparse.Namespace) -> int:
+    from .service import migrate_storage
+
+    count = migrate_storage(args.to)
+    print(f"Migrated {count} expense(s) to {args.to}")
+    return 0
+
+
+# Handle serve command.
+def _handle_serve(args: argparse.Namespace) -> int:
+    # Imported here so other commands do not pay for asyncio.
+    from .daemon import serve
+
+    def _ready(path) -> None:
+        print(f"Serving the ledger on {path} (Ctrl+C to stop)", flush=True)
+
+    serve(ready=_ready)
+    return 0
+
+
+# Storage engine names for `migrate --to`, looked up from the storage module
+# only when argparse validates or prints them.
+class _EngineChoices:
+    def __iter__(self):
+        from .storage import ENGINES
+
+        return iter(ENGINES)
+
+    def __contains__(self, name: object) -> bool:
+        from .storage import ENGINES
+
+        return name in ENGINES
+
+
+# Build and configure CLI parser; subcommand parsers share `parser_class`.
+def build_parser(
+    parser_class: type[argparse.ArgumentParser] = _LoggingArgumentParser,
+) -> argparse.ArgumentParser:
+    parser = parser_class(prog="tracker", description="Expense Tracker CLI")
+    parser.add_argument(
+        "--timings",
+        action="store_true",
+        help="Print a per-stage time breakdown to stderr",
+    )
+    parser.add_argument(
+        "--profile", metavar="PATH", help="Run the command under cProfile, saving stats"
+    )
     subparsers = parser.add_subparsers(dest="command", required=True)
 
 
@@ -319,20 +968,111 @@ def build_parser() -> argparse.ArgumentParser:
     list_parser.add_argument("--max", dest="max")
     list_parser.add_argument(
         "--sort",
-        choices=["date", "amount", "category", "created", "id"],
+        choices=["date", "amount", "category", "created", "id", "none"],
         default="date",
     )
     list_parser.add_argument("--desc", action="store_true")
     list_parser.add_argument("--limit")
+    list_parser.add_argument(
+        "--in", dest="in_currency", metavar="CUR", help="Convert amounts to CUR"
+    )
+    list_parser.add_argument(
+        "--explain", action="store_true", help="Print the query plan and row counts"
+    )
+    list_parser.add_argument("--page", metavar="N", help="Show page N (from 1)")
+    list_parser.add_argument(
+        "--page-size", metavar="M", help=f"Rows per page (default: {_PAGE_SIZE})"
+    )
+    list_parser.add_argument(
+        "--format",
+        choices=["box", "tsv", "jsonl"],
+        default="box",
+        help="Table, or plain rows for piping",
+    )
+    list_parser.add_argument(
+        "--max-width", metavar="N", help="Cut table cells to N characters"
+    )
     list_parser.set_defaults(func=_handle_list)
 
+    search_parser = subparsers.add_parser(
+        "search", help="Find expenses by words in their note or category"
+    )
+    search_parser.add_argument(
+        "query", nargs="+", help='Words to match; "OR" between alternatives, "word*" for prefixes'
+    )
+    search_parser.add_argument("--month", help="YYYY-MM")
+    search_parser.add_argument("--category")
+    search_parser.add_argument("--min", dest="min")
+    search_parser.add_argument("--max", dest="max")
+    search_parser.add_argument(
+        "--limit", default=str(_SEARCH_LIMIT), help=f"Best N matches (default: {_SEARCH_LIMIT})"
+    )
+    search_parser.add_argument(
+        "--format",
+        choices=["box", "tsv", "jsonl"],
+        default="box",
+        help="Table, or plain rows for piping",
+    )
+    search_parser.add_argument(
+        "--max-width", metavar="N", help="Cut table cells to N characters"
+    )
+    search_parser.set_defaults(func=_handle_search)
+
     summary_parser = subparsers.add_parser("summary", help="Show totals")
     summary_parser.add_argument("--month", help="YYYY-MM")
     summary_parser.add_argument("--from", dest="from_date", help="YYYY-MM-DD")
     summary_parser.add_argument("--to", dest="to_date", help="YYYY-MM-DD")
     summary_parser.add_argument("--category")
+    summary_parser.add_argument(
+        "--in", dest="in_currency", metavar="CUR", help="Convert totals to CUR"
+    )
+    summary_parser.add_argument(
+        "--workers",
+        metavar="N",
+        help="Processes for totals that need a ledger scan (default: CPU count)",
+    )
     summary_parser.set_defaults(func=_handle_summary)
 
+    trend_parser = subparsers.add_parser(
+        "trend", help="Totals per day, week or month with rolling averages"
+    )
+    trend_parser.add_argument(
+        "--by", choices=["day", "week", "month"], default="month", help="Period (default: month)"
+    )
+    trend_parser.add_argument("--month", help="YYYY-MM")
+    trend_parser.add_argument("--from", dest="from_date", help="YYYY-MM-DD")
+    trend_parser.add_argument("--to", dest="to_date", help="YYYY-MM-DD")
+    trend_parser.add_argument("--category")
+    trend_parser.add_argument(
+        "--window", metavar="N", help="Also show the average per day over the N days to each period's end"
+    )
+    trend_parser.add_argument(
+        "--in", dest="in_currency", metavar="CUR", help="Convert totals to CUR"
+    )
+    trend_parser.set_defaults(func=_handle_trend)
+
+    budget_parser = subparsers.add_parser(
+        "budget", help="Set monthly category budgets and check spend against them"
+    )
+    budget_commands = budget_parser.add_subparsers(dest="budget_command", required=True)
+    budget_set_parser = budget_commands.add_parser(
+        "set", help="Set (or replace) the monthly limit of a category"
+    )
+    budget_set_parser.add_argument("--category", required=True)
+    budget_set_parser.add_argument("--amount", required=True, help="Monthly limit")
+    budget_set_parser.add_argument("--currency", default="BDT")
+    budget_set_parser.add_argument(
+        "--alerts", default="80,100", help="Alert thresholds in percent (default: 80,100)"
+    )
+    budget_set_parser.set_defaults(func=_handle_budget_set)
+    budget_list_parser = budget_commands.add_parser("list", help="List budgets")
+    budget_list_parser.set_defaults(func=_handle_budget_list)
+    budget_status_parser = budget_commands.add_parser(
+        "status", help="Spend against each budget in a month"
+    )
+    budget_status_parser.add_argument("--month", help="YYYY-MM (default: this month)")
+    budget_status_parser.set_defaults(func=_handle_budget_status)
+
     export_parser = subparsers.add_parser("export", help="Export to CSV")
     export_parser.add_argument("--path", default="data/expenses.csv")
     export_parser.add_argument("--month", help="YYYY-MM")
@@ -341,11 +1081,17 @@ def build_parser() -> argparse.ArgumentParser:
     export_parser.add_argument("--max", dest="max")
     export_parser.add_argument(
         "--sort",
-        choices=["date", "amount", "category", "created", "id"],
+        choices=["date", "amount", "category", "created", "id", "none"],
         default="date",
     )
     export_parser.add_argument("--desc", action="store_true")
     export_parser.add_argument("--limit")
+    export_parser.add_argument(
+        "--in", dest="in_currency", metavar="CUR", help="Convert amounts to CUR"
+    )
+    export_parser.add_argument(
+        "--explain", action="store_true", help="Print the query plan and row counts"
+    )
     export_parser.set_defaults(func=_handle_export)
 
     delete_parser = subparsers.add_parser("delete", help="Delete an expense")
@@ -361,14 +1107,129 @@ def build_parser() -> argparse.ArgumentParser:
     edit_parser.add_argument("--currency")
     edit_parser.set_defaults(func=_handle_edit)
 
+    import_parser = subparsers.add_parser(
+        "import", help="Import expenses from CSV or JSONL"
+    )
+    import_parser.add_argument("--path", required=True, help="file.csv or file.jsonl")
+    import_parser.add_argument("--skip-invalid", action="store_true")
+    import_parser.set_defaults(func=_handle_import)
+
+    batch_parser = subparsers.add_parser(
+        "batch", help="Apply add/edit/delete lines in one all-or-nothing commit"
+    )
+    batch_parser.add_argument(
+        "--file", help="JSONL file of commands (default: stdin)"
+    )
+    batch_parser.set_defaults(func=_handle_batch)
+
+    compact_parser = subparsers.add_parser(
+        "compact", help="Fold the journal into the snapshot"
+    )
+    compact_parser.set_defaults(func=_handle_compact)
+
+    verify_parser = subparsers.add_parser(
+        "verify", help="Rebuild summary aggregates and report drift"
+    )
+    verify_parser.set_defaults(func=_handle_verify)
+
+    migrate_parser = subparsers.add_parser(
+        "migrate", help="Copy the ledger to another storage engine"
+    )
+    migrate_parser.add_argument(
+        "--to",
+        required=True,
+        choices=_EngineChoices(),
+        metavar="ENGINE",
+        help="one of: %(choices)s",
+    )
+    migrate_parser.set_defaults(func=_handle_migrate)
+
+    serve_parser = subparsers.add_parser(
+        "serve", help="Keep the ledger in memory and serve it over a Unix socket"
+    )
+    serve_parser.set_defaults(func=_handle_serve)
+
     return parser
 
 
+# Per-stage totals of the spans recorded while a command runs (--timings).
+class _StageTimings:
+    def __init__(self) -> None:
+        self.stages: dict[str, list] = {}
+
+    # Add a finished span to its stage.
+    def add(self, finished: Span) -> None:
+        stage = self.stages.setdefault(finished.name, [0, 0.0, 0.0])
+        stage[0] += finished.calls
+        stage[1] += finished.self_seconds
+        stage[2] += finished.seconds
+
+    # Breakdown by self time; time outside every span is reported as other.
+    def report(self, wall: float) -> str:
+        lines = [
+            f"Timings (wall {wall * 1000:.1f} ms):",
+            f"  {'stage':<20}{'calls':>9}{'self ms':>11}{'total ms':>11}{'self %':>8}",
+        ]
+        ordered = sorted(self.stages.items(), key=lambda item: item[1][1], reverse=True)
+        for name, (calls, own, total) in ordered:
+            share = own / wall * 100 if wall > 0 else 0.0
+            lines.append(
+                f"  {name:<20}{calls:>9}{own * 1000:>11.1f}{total * 1000:>11.1f}{share:>7.0f}%"
+            )
+        other = max(0.0, wall - sum(stage[1] for stage in self.stages.values()))
+        share = other / wall * 100 if wall > 0 else 0.0
+        lines.append(f"  {'(other)':<20}{'':>9}{other * 1000:>11.1f}{'':>11}{share:>7.0f}%")
+        return "\n".join(lines)
+
+
+# Run the command handler, under cProfile when --profile is given.
+def _run(args: argparse.Namespace) -> int:
+    if not args.profile:
+        return args.func(args)
+    import cProfile
+
+    profiler = cProfile.Profile()
+    try:
+        return profiler.runcall(args.func, args)
+    finally:
+        profiler.dump_stats(args.profile)
+        print(
+            f"Profile written to {args.profile} (view with: python -m pstats {args.profile})",
+            file=sys.stderr,
+        )
+
+
 # CLI entrypoint.
 def main(argv: list[str] | None = None) -> None:
     parser = build_parser()
     args = parser.parse_args(argv)
+    from .storage import set_cache_enabled
+
+    # One command per process: stream from disk instead of caching the ledger.
+    set_cache_enabled(False)
     cmd_args = argv if argv is not None else sys.argv[1:]
     get_logger().info("Command called: %s", " ".join(cmd_args) or "(no args)")
-    exit_code = args.func(args)
+    timings = _StageTimings() if args.timings else None
+    if timings is not None:
+        from .spans import add_span_listener
+
+        add_span_listener(timings.add)
+    started = time.perf_counter()
+    try:
+        exit_code = _run(args)
+    except RuntimeError as exc:
+        _print_error(str(exc))
+        exit_code = 1
+    except BrokenPipeError:
+        # The reader of stdout went away (`list ... | head`): stop quietly.
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+        exit_code = 0
+    if timings is not None:
+        print(timings.report(time.perf_counter() - started), file=sys.stderr)
+    get_logger().info(
+        "Command %s exited with %d",
+        args.command,
+        exit_code,
+        extra=operation_fields(args.command, started),
+    )
     raise SystemExit(exit_code)
@@ -0,0 +1,135 @@
+from __future__ import annotations
+
+import json
+import socket
+from pathlib import Path
+from typing import Iterator
+
+from .budgets import take_alerts
+from .logger import get_logger
+from .models import BudgetAlert, Expense, Summary, Trend, TrendPoint
+from .query import QueryPlan
+from .spans import span
+from .storage import sidecar_path
+
+
+_SOCKET_SUFFIX = ".sock"
+_CONNECT_TIMEOUT = 1.0
+
+
+# Resolve path to the daemon socket kept next to the data file.
+def socket_path() -> Path:
+    return sidecar_path(_SOCKET_SUFFIX)
+
+
+# Encode one protocol message as a JSON line.
+def encode_message(message: dict) -> bytes:
+    return json.dumps(message, ensure_ascii=True, separators=(",", ":")).encode() + b"\n"
+
+
+# Client for the `tracker serve` daemon, one request per connection.
+#
+# Methods mirror the service functions the CLI uses and return the same types.
+class DaemonClient:
+    def __init__(self, path: Path) -> None:
+        self.path = path
+
+    # Client for a daemon that answers on `path`, or None when none is running.
+    @classmethod
+    def connect(cls, path: Path | None = None) -> "DaemonClient | None":
+        path = path or socket_path()
+        if not hasattr(socket, "AF_UNIX") or not path.exists():
+            return None
+        client = cls(path)
+        try:
+            client.call("ping")
+        except (OSError, RuntimeError) as exc:
+            get_logger().info("Ignoring daemon socket %s: %s", path, exc)
+            return None
+        return client
+
+    # Send one request and return its result, re-raising daemon-side errors.
+    def call(self, method: str, **params) -> object:
+        try:
+            with span("daemon.call"), socket.socket(
+                socket.AF_UNIX, socket.SOCK_STREAM
+            ) as conn:
+                conn.settimeout(_CONNECT_TIMEOUT)
+                conn.connect(str(self.path))
+                conn.settimeout(None)
+                conn.sendall(encode_message({"method": method, "params": params}))
+                with conn.makefile("rb") as stream:
+                    line = stream.readline()
+        except OSError as exc:
+            raise RuntimeError(f"Tracker daemon unavailable: {exc}") from exc
+        if not line:
+            raise RuntimeError("Tracker daemon closed the connection")
+        response = json.loads(line)
+        if response.get("ok"):
+            return response.get("result")
+        error = response.get("error") or {}
+        message = str(error.get("message", "daemon error"))
+        if error.get("type") == "ValueError":
+            raise ValueError(message)
+        raise RuntimeError(message)
+
+    # Add a new expense through the daemon; budget alerts go into `alerts`.
+    def add_expense(self, alerts: list[BudgetAlert] | None = None, **fields) -> Expense:
+        stored = self.call("add", **fields)
+        take_alerts(stored, alerts)
+        return Expense.from_dict(stored)
+
+    # List expenses through the daemon.
+    def list_expenses(self, plan: QueryPlan | None = None, **filters) -> list[Expense]:
+        if plan is None:
+            return list(Expense.from_dicts(self.call("list", **filters)))
+        result = self.call("list", explain=True, **filters)
+        plan.steps.extend(result["plan"])
+        return list(Expense.from_dicts(result["expenses"]))
+
+    # Expenses through the daemon, as an iterator like service.query_expenses.
+    def query_expenses(self, plan: QueryPlan | None = None, **filters) -> Iterator[Expense]:
+        return iter(self.list_expenses(plan=plan, **filters))
+
+    # Trend series through the daemon.
+    def trend_series(self, **filters) -> Trend:
+        result = self.call("trend", **filters)
+        overall = result.pop("overall")
+        return Trend(
+            points=[TrendPoint(**point) for point in result.pop("points")],
+            overall=TrendPoint(**overall) if overall is not None else None,
+            **result,
+        )
+
+    # Search expenses through the daemon.
+    def search_expenses(self, query: str, **filters) -> list[Expense]:
+        return list(Expense.from_dicts(self.call("search", query=query, **filters)))
+
+    # Summary totals through the daemon.
+    def summary_totals(self, **filters) -> Summary:
+        return Summary(**self.call("summary", **filters))
+
+    # Export to a CSV file written by the daemon; relative paths are resolved here.
+    def export_expenses(
+        self, path: str, plan: QueryPlan | None = None, **filters
+    ) -> tuple[Path, int]:
+        target = str(Path(path).resolve())
+        if plan is None:
+            return Path(path), int(self.call("export", path=target, **filters))
+        result = self.call("export", path=target, explain=True, **filters)
+        plan.steps.extend(result["plan"])
+        return Path(path), int(result["count"])
+
+    # Delete an expense by id through the daemon.
+    def delete_expense(self, expense_id: str) -> bool:
+        return bool(self.call("delete", expense_id=expense_id))
+
+    # Edit an expense through the daemon; budget alerts go into `alerts`.
+    def edit_expense(
+        self, alerts: list[BudgetAlert] | None = None, **fields
+    ) -> Expense | None:
+        item = self.call("edit", **fields)
+        if item is None:
+            return None
+        take_alerts(item, alerts)
+        return Expense.from_dict(item)
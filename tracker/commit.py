@@ -0,0 +1,221 @@
+from __future__ import annotations
+
+import json
+import os
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Iterator
+from uuid import uuid4
+
+from .logger import get_logger
+from .storage import sidecar_path
+
+try:
+    import fcntl
+except ImportError:  # Not available on Windows; writers are then not serialized.
+    fcntl = None
+
+
+_LOCK_SUFFIX = ".lock"
+_SPOOL_SUFFIX = ".pending"
+# Results older than this belong to writers that died while waiting.
+_STALE_RESULT_SECONDS = 3600
+
+Apply = Callable[[list[dict]], list]
+
+
+# Open (creating if needed) the lock file that guards ledger writes.
+def _open_lock():
+    path = sidecar_path(_LOCK_SUFFIX)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    return path.open("a")
+
+
+# Hold the exclusive ledger write lock for the duration of the block.
+#
+# Not reentrant: code inside the block must not take the lock again.
+@contextmanager
+def ledger_lock() -> Iterator[None]:
+    with _open_lock() as handle:
+        if fcntl is not None:
+            fcntl.flock(handle.fileno(), fcntl.LOCK_EX)
+        yield
+
+
+# Write a JSON file through a temp file so readers never see half of it.
+def _write_json(path: Path, payload: object) -> None:
+    tmp_path = path.with_name(f"{path.name}.tmp")
+    with tmp_path.open("w", encoding="utf-8") as handle:
+        json.dump(payload, handle, ensure_ascii=True, separators=(",", ":"))
+    os.replace(tmp_path, path)
+
+
+# Read a JSON file written by _write_json.
+def _read_json(path: Path) -> object:
+    with path.open("r", encoding="utf-8") as handle:
+        return json.load(handle)
+
+
+# Queue operations in the spool directory; returns the request token.
+#
+# Tokens start with the time so name order is arrival order.
+def _spool(spool: Path, ops: list[dict]) -> str:
+    token = f"{time.time_ns():020d}-{os.getpid()}-{uuid4().hex[:8]}"
+    _write_json(spool / f"{token}.ops", ops)
+    return token
+
+
+# Outcome of a request another writer committed, or None when not committed.
+def _take_result(spool: Path, token: str) -> list | None:
+    path = spool / f"{token}.done"
+    try:
+        outcome = _read_json(path)
+    except FileNotFoundError:
+        return None
+    path.unlink()
+    error = outcome.get("error")
+    if error is not None:
+        if error.get("type") == "ValueError":
+            failure = ValueError(error.get("message", ""))
+            if "expense_id" in error:
+                failure.expense_id = error["expense_id"]
+            raise failure
+        raise RuntimeError(error.get("message", ""))
+    return outcome["results"]
+
+
+# Apply each queued request's operations; combined into one call when possible.
+#
+# `apply` raises ValueError or RuntimeError only when storage rejected the
+# operations and wrote nothing, so such a failing combined batch is retried
+# request by request to confine the error to the request that caused it.
+# Any other exception may come after a write, so it is never retried: every
+# request of the batch gets it as its outcome.
+def _apply_batches(
+    batches: list[list[dict]], apply: Apply
+) -> list[list | Exception]:
+    combined = [op for ops in batches for op in ops]
+    try:
+        results = apply(combined)
+    except (ValueError, RuntimeError) as exc:
+        if len(batches) == 1:
+            return [exc]
+        get_logger().error("Group commit failed, retrying one by one: %s", exc)
+    except Exception as exc:
+        get_logger().error("Group commit failed: %s", exc)
+        return [exc] * len(batches)
+    else:
+        outcomes: list[list | Exception] = []
+        start = 0
+        for ops in batches:
+            outcomes.append(results[start : start + len(ops)])
+            start += len(ops)
+        return outcomes
+
+    outcomes = []
+    for ops in batches:
+        try:
+            outcomes.append(apply(ops))
+        except Exception as exc:
+            outcomes.append(exc)
+    return outcomes
+
+
+# Commit our operations and every request queued in the spool, then hand
+# queued writers their results. Must hold the ledger lock.
+#
+# Every queued request gets an outcome and its `.ops` file is removed, also
+# when the commit fails, so the next lock holder never applies it again.
+def _commit_queued(
+    spool: Path, token: str | None, ops: list[dict], apply: Apply
+) -> list:
+    queued = sorted(path.name[: -len(".ops")] for path in spool.glob("*.ops"))
+    if token is None:
+        queued.append(None)
+    elif token not in queued:
+        # Applied by a writer that then died before publishing our result.
+        raise RuntimeError("Outcome of the queued write is unknown; check the ledger")
+
+    try:
+        batches = [
+            ops if name in (None, token) else _read_json(spool / f"{name}.ops")
+            for name in queued
+        ]
+        outcomes = _apply_batches(batches, apply)
+    except BaseException as exc:
+        failure = RuntimeError(f"Group commit failed: {exc}; check the ledger")
+        _publish(spool, token, queued, [failure] * len(queued))
+        raise
+    if len(batches) > 1:
+        get_logger().info(
+            "Group commit of %d op(s) from %d writer(s)",
+            sum(len(batch) for batch in batches),
+            len(batches),
+        )
+    own = _publish(spool, token, queued, outcomes)
+    if isinstance(own, Exception):
+        raise own
+    return own
+
+
+# Hand each queued request its outcome and remove its `.ops` file; returns
+# the outcome of our own request.
+def _publish(
+    spool: Path, token: str | None, queued: list, outcomes: list[list | Exception]
+) -> list | Exception:
+    own: list | Exception = []
+    for name, outcome in zip(queued, outcomes):
+        try:
+            if name in (None, token):
+                own = outcome
+            else:
+                if isinstance(outcome, Exception):
+                    error = {"type": type(outcome).__name__, "message": str(outcome)}
+                    if hasattr(outcome, "expense_id"):
+                        error["expense_id"] = outcome.expense_id
+                    payload = {"error": error}
+                else:
+                    payload = {"results": outcome}
+                _write_json(spool / f"{name}.done", payload)
+        finally:
+            # Without a published outcome the waiting writer reports it unknown.
+            if name is not None:
+                (spool / f"{name}.ops").unlink(missing_ok=True)
+    _sweep_results(spool)
+    return own
+
+
+# Remove results nobody collected.
+def _sweep_results(spool: Path) -> None:
+    cutoff = time.time() - _STALE_RESULT_SECONDS
+    for path in spool.glob("*.done"):
+        try:
+            if path.stat().st_mtime < cutoff:
+                path.unlink()
+        except FileNotFoundError:
+            continue
+
+
+# Apply write operations under the ledger lock with group commit.
+#
+# A writer that finds the lock free commits right away, together with any
+# requests already queued. A writer that has to wait queues its operations
+# in the spool directory first, so whoever holds the lock next applies all
+# of them in one combined write; it then only collects its results.
+def group_commit(ops: list[dict], apply: Apply) -> list:
+    if fcntl is None:
+        return apply(ops)
+    spool = sidecar_path(_SPOOL_SUFFIX)
+    spool.mkdir(parents=True, exist_ok=True)
+    with _open_lock() as handle:
+        token = None
+        try:
+            fcntl.flock(handle.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            token = _spool(spool, ops)
+            fcntl.flock(handle.fileno(), fcntl.LOCK_EX)
+            results = _take_result(spool, token)
+            if results is not None:
+                return results
+        return _commit_queued(spool, token, ops, apply)
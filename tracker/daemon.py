@@ -0,0 +1,238 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import os
+import signal
+import socket
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict
+from pathlib import Path
+from typing import Callable
+
+from .client import DaemonClient, encode_message, socket_path
+from .logger import get_logger, operation_fields
+from .query import QueryPlan
+from .service import (
+    add_op,
+    delete_op,
+    edit_op,
+    export_expenses,
+    list_expenses,
+    search_expenses,
+    summary_totals,
+    trend_series,
+    write_ops,
+)
+from .storage import set_cache_enabled
+
+
+# Requests longer than this are rejected; they are single JSON lines.
+_REQUEST_LIMIT = 1 << 20
+
+
+# List expenses as plain dicts for the JSON protocol; with explain, also
+# return the query plan steps.
+def _list_records(explain: bool = False, **filters) -> list[dict] | dict:
+    plan = QueryPlan() if explain else None
+    records = [exp.to_dict() for exp in list_expenses(plan=plan, **filters)]
+    if plan is None:
+        return records
+    return {"expenses": records, "plan": plan.steps}
+
+
+# Summary totals as a plain dict for the JSON protocol. Worker processes
+# are not used: the daemon answers from its cached columns.
+def _summary_dict(workers: int | None = None, **filters) -> dict:
+    return asdict(summary_totals(**filters))
+
+
+# Trend series as a plain dict for the JSON protocol.
+def _trend_dict(**filters) -> dict:
+    return asdict(trend_series(**filters))
+
+
+# Export to CSV and return the row count; with explain, also the plan steps.
+def _export_count(path: str, explain: bool = False, **filters) -> int | dict:
+    plan = QueryPlan() if explain else None
+    _, count = export_expenses(path, plan=plan, **filters)
+    if plan is None:
+        return count
+    return {"count": count, "plan": plan.steps}
+
+
+# Search matches as plain dicts for the JSON protocol.
+def _search_records(query: str, **filters) -> list[dict]:
+    return [exp.to_dict() for exp in search_expenses(query, **filters)]
+
+
+_READERS = {
+    "list": _list_records,
+    "summary": _summary_dict,
+    "export": _export_count,
+    "search": _search_records,
+    "trend": _trend_dict,
+}
+
+
+# Resident server for the ledger over a Unix domain socket.
+#
+# The ledger stays parsed in the process-wide storage cache between requests.
+# All ledger access runs on one worker thread, so it is serialized; write
+# requests that arrive while a commit is in flight are queued and applied
+# together in the next commit (group commit).
+class LedgerDaemon:
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self.commits = 0
+        self._executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="tracker-ledger"
+        )
+        self._pending: list[tuple[list[dict], asyncio.Future]] = []
+        self._wakeup: asyncio.Event | None = None
+
+    # Serve until SIGINT/SIGTERM, then remove the socket.
+    async def run(self, ready: Callable[[Path], None] | None = None) -> None:
+        loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        stop = asyncio.Event()
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(signum, stop.set)
+        committer = asyncio.create_task(self._commit_loop())
+        server = await asyncio.start_unix_server(
+            self._handle_client, path=str(self.path), limit=_REQUEST_LIMIT
+        )
+        get_logger().info("Daemon listening on %s (pid %d)", self.path, os.getpid())
+        if ready is not None:
+            ready(self.path)
+        try:
+            async with server:
+                await stop.wait()
+        finally:
+            committer.cancel()
+            self._executor.shutdown(wait=True)
+            self.path.unlink(missing_ok=True)
+            get_logger().info("Daemon stopped after %d commit(s)", self.commits)
+
+    # Answer JSON-line requests from one connection until it closes.
+    async def _handle_client(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except ValueError:
+                    writer.write(_error_response(ValueError("request is too large")))
+                    break
+                if not line:
+                    break
+                writer.write(await self._respond(line))
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    # Decode, run and encode one request.
+    async def _respond(self, line: bytes) -> bytes:
+        try:
+            request = json.loads(line)
+            if not isinstance(request, dict):
+                raise ValueError("request must be a JSON object")
+            params = request.get("params") or {}
+            if not isinstance(params, dict):
+                raise ValueError("params must be a JSON object")
+            result = await self._dispatch(str(request.get("method")), params)
+        except (ValueError, TypeError) as exc:
+            return _error_response(ValueError(str(exc)))
+        except RuntimeError as exc:
+            return _error_response(exc)
+        except Exception as exc:
+            get_logger().exception("Daemon request failed")
+            return _error_response(RuntimeError(f"daemon error: {exc}"))
+        return encode_message({"ok": True, "result": result})
+
+    # Route a request to the write queue or the ledger thread.
+    async def _dispatch(self, method: str, params: dict) -> object:
+        if method == "ping":
+            return {"pid": os.getpid(), "commits": self.commits}
+        if method == "add":
+            (stored,) = await self._submit([add_op(**params)])
+            return stored
+        if method == "edit":
+            (item,) = await self._submit([edit_op(**params)])
+            return item
+        if method == "delete":
+            (removed,) = await self._submit([delete_op(**params)])
+            return removed is not None
+        reader = _READERS.get(method)
+        if reader is None:
+            raise ValueError(f"Unknown method: {method}")
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self._executor, lambda: reader(**params)
+        )
+
+    # Queue write operations for the next commit and wait for their results.
+    async def _submit(self, ops: list[dict]) -> list[dict | None]:
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((ops, future))
+        self._wakeup.set()
+        return await future
+
+    # Apply queued writes, one combined commit per wakeup.
+    async def _commit_loop(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            batch, self._pending = self._pending, []
+            if not batch:
+                continue
+            ops = [op for request_ops, _ in batch for op in request_ops]
+            started = time.perf_counter()
+            try:
+                results = await loop.run_in_executor(self._executor, write_ops, ops)
+            except Exception as exc:
+                get_logger().error("Commit of %d op(s) failed: %s", len(ops), exc)
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(exc)
+                continue
+            self.commits += 1
+            get_logger().info(
+                "Committed %d op(s) from %d request(s)",
+                len(ops),
+                len(batch),
+                extra=operation_fields("commit", started),
+            )
+            start = 0
+            for request_ops, future in batch:
+                end = start + len(request_ops)
+                if not future.done():
+                    future.set_result(results[start:end])
+                start = end
+
+
+# Encode an error response carrying the exception type for the client.
+def _error_response(exc: Exception) -> bytes:
+    error = {"type": type(exc).__name__, "message": str(exc)}
+    return encode_message({"ok": False, "error": error})
+
+
+# Run the daemon in the foreground on the ledger's socket.
+def serve(
+    path: Path | None = None, ready: Callable[[Path], None] | None = None
+) -> None:
+    if not hasattr(socket, "AF_UNIX"):
+        raise RuntimeError("Unix domain sockets are not supported on this platform")
+    path = path or socket_path()
+    if path.exists():
+        if DaemonClient.connect(path) is not None:
+            raise RuntimeError(f"A tracker daemon is already serving {path}")
+        path.unlink()
+    path.parent.mkdir(parents=True, exist_ok=True)
+    set_cache_enabled(True)
+    asyncio.run(LedgerDaemon(path).run(ready))
@@ -0,0 +1,286 @@
+from __future__ import annotations
+
+import json
+import mmap
+import os
+import struct
+from bisect import bisect_left, insort
+from pathlib import Path
+from typing import Iterable, Iterator
+
+from .utils import IdAllocator, id_sequence
+
+
+_INDEX_VERSION = 3
+# Table slot: id offset and length in the id heap, snapshot position, and
+# the byte offset and length of the record in the snapshot.
+_SLOT = struct.Struct("<IHIQI")
+# Category row: snapshot position, and the byte offset and length of the
+# record in the snapshot.
+_ROW = struct.Struct("<IQI")
+
+
+# Persisted id table of a snapshot: one slot per record, sorted by id and
+# read through mmap, so a lookup is a binary search that decodes a few
+# slots instead of parsing the whole table. Also holds the row set of each
+# category, in ledger order.
+class IdTable:
+    def __init__(
+        self,
+        buffer,
+        start: int,
+        count: int,
+        categories: dict[str, tuple[int, int]],
+        rows: int,
+    ) -> None:
+        self._buffer = buffer
+        self._start = start
+        self._rows = start + count * _SLOT.size
+        self._heap = self._rows + rows * _ROW.size
+        self._categories = categories
+        self.count = count
+
+    # Id of the slot at `number`.
+    def _id_at(self, number: int) -> bytes:
+        id_offset, id_length, _, _, _ = _SLOT.unpack_from(
+            self._buffer, self._start + number * _SLOT.size
+        )
+        start = self._heap + id_offset
+        return self._buffer[start : start + id_length]
+
+    # Number of the first slot whose id is not below `key`.
+    def _bisect(self, key: bytes) -> int:
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            if self._id_at(middle) < key:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    # (snapshot position, byte offset, byte length) of an id, or None.
+    def lookup(self, expense_id: str) -> tuple[int, int, int] | None:
+        key = expense_id.encode("utf-8")
+        low = self._bisect(key)
+        if low == self.count or self._id_at(low) != key:
+            return None
+        _, _, position, offset, length = _SLOT.unpack_from(
+            self._buffer, self._start + low * _SLOT.size
+        )
+        return position, offset, length
+
+    # Ids of the snapshot that start with `prefix`.
+    def ids_with_prefix(self, prefix: str) -> Iterator[str]:
+        key = prefix.encode("utf-8")
+        number = self._bisect(key)
+        while number < self.count:
+            found = self._id_at(number)
+            if not found.startswith(key):
+                break
+            yield found.decode("utf-8")
+            number += 1
+
+    # (snapshot position, byte offset, byte length) of each record of a
+    # category, in ledger order.
+    def rows(self, category: str) -> list[tuple[int, int, int]]:
+        first, count = self._categories.get(category, (0, 0))
+        start = self._rows + first * _ROW.size
+        return list(_ROW.iter_unpack(self._buffer[start : start + count * _ROW.size]))
+
+
+# Write the id table of a snapshot: a JSON header line (snapshot signature,
+# row count, id sequences, and the first row and row count of each
+# category), then the sorted slots, the category rows and the id heap.
+#
+# `spans` holds the (byte offset, byte length) of each record in the
+# snapshot, in ledger order.
+def write_index(
+    path: Path,
+    snapshot: list[int] | None,
+    records: list[dict],
+    spans: list[tuple[int, int]],
+    sequences: dict[str, int],
+) -> None:
+    keyed = sorted(
+        (str(record["id"]).encode("utf-8"), position)
+        for position, record in enumerate(records)
+    )
+    by_category: dict[str, list[int]] = {}
+    for position, record in enumerate(records):
+        by_category.setdefault(str(record["category"]), []).append(position)
+    categories: dict[str, list[int]] = {}
+    rows = bytearray()
+    for category, positions in by_category.items():
+        categories[category] = [len(rows) // _ROW.size, len(positions)]
+        for position in positions:
+            rows += _ROW.pack(position, *spans[position])
+    header = {
+        "version": _INDEX_VERSION,
+        "snapshot": snapshot,
+        "size": len(records),
+        "sequences": sequences,
+        "rows": len(records),
+        "categories": categories,
+    }
+    slots = bytearray()
+    heap = bytearray()
+    for key, position in keyed:
+        offset, length = spans[position]
+        slots += _SLOT.pack(len(heap), len(key), position, offset, length)
+        heap += key
+    tmp_path = path.with_name(f"{path.name}.tmp")
+    with tmp_path.open("wb") as handle:
+        handle.write(json.dumps(header, separators=(",", ":")).encode("ascii") + b"\n")
+        handle.write(slots)
+        handle.write(rows)
+        handle.write(heap)
+    os.replace(tmp_path, path)
+
+
+# Read an id table written for the snapshot with signature `snapshot`;
+# returns (row count, id sequences, table), or None when the file is
+# missing, unreadable or written for another snapshot.
+def read_index(path: Path, snapshot: list[int] | None) -> tuple[int, dict, IdTable] | None:
+    try:
+        with path.open("rb") as handle:
+            header = json.loads(handle.readline())
+            start = handle.tell()
+            size = os.fstat(handle.fileno()).st_size
+            if not isinstance(header, dict) or header.get("version") != _INDEX_VERSION:
+                return None
+            if header.get("snapshot") != snapshot:
+                return None
+            count = int(header["size"])
+            rows = int(header["rows"])
+            sequences = {str(key): int(value) for key, value in header["sequences"].items()}
+            categories = {
+                str(key): (int(first), int(length))
+                for key, (first, length) in header["categories"].items()
+            }
+            if size - start < count * _SLOT.size + rows * _ROW.size:
+                return None
+            buffer = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError, KeyError, TypeError, AttributeError):
+        return None
+    return count, sequences, IdTable(buffer, start, count, categories, rows)
+
+
+# Id -> position index over the ledger list, and the id allocator.
+#
+# Positions are kept as "raw" slots that never move: ids of the snapshot
+# take theirs from the persisted table, later adds get the next slot, and
+# an id's position is its slot less the removed slots before it (a binary
+# search), so deletes never renumber the rows after them.
+#
+# The allocator holds the highest sequence of each date's ids in the
+# ledger; removing the id that holds it steps back to the highest one left.
+class LedgerIndex:
+    def __init__(
+        self,
+        allocator: IdAllocator,
+        size: int,
+        table: IdTable | None = None,
+    ) -> None:
+        self.allocator = allocator
+        self.size = size
+        self.table = table
+        # Slots of ids added or removed (None) since the table was written.
+        self._slots: dict[str, int | None] = {}
+        self._removed: list[int] = []
+        self._pending: list[int] = []
+        self._next_slot = size
+        # Ids given a slot since the table was written, by id prefix.
+        self._added: dict[str, list[str]] = {}
+
+    # Build the index from scratch.
+    @classmethod
+    def build(cls, expenses: Iterable[dict]) -> "LedgerIndex":
+        index = cls(IdAllocator(), 0)
+        for item in expenses:
+            index.add(item)
+        return index
+
+    # Slot of an id, or None when it is not in the ledger.
+    def _slot(self, expense_id: str) -> int | None:
+        if expense_id in self._slots:
+            return self._slots[expense_id]
+        if self.table is None:
+            return None
+        found = self.table.lookup(expense_id)
+        return None if found is None else found[0]
+
+    # Position of an expense id in the ledger list.
+    def position(self, expense_id: str) -> int | None:
+        slot = self._slot(expense_id)
+        if slot is None:
+            return None
+        return slot - bisect_left(self._removed, slot)
+
+    # Byte offset and length of an id's record in the snapshot, when the
+    # snapshot still holds it unchanged by adds since.
+    def snapshot_span(self, expense_id: str) -> tuple[int, int] | None:
+        if expense_id in self._slots or self.table is None:
+            return None
+        found = self.table.lookup(expense_id)
+        return None if found is None else found[1:]
+
+    # Index a record appended at the end of the list (or replacing its id).
+    def add(self, record: dict) -> int:
+        expense_id = record["id"]
+        self.allocator.observe(expense_id)
+        position = self.position(expense_id)
+        if position is None:
+            slot = self._next_slot
+            self._next_slot += 1
+            self._slots[expense_id] = slot
+            self.size += 1
+            found = id_sequence(expense_id)
+            if found is not None:
+                self._added.setdefault(found[0], []).append(expense_id)
+            # Removed slots all come before a new one.
+            position = slot - len(self._removed)
+        return position
+
+    # Forget a record; positions shift once reindex() applies the removal.
+    def remove(self, expense_id: str) -> int | None:
+        slot = self._slot(expense_id)
+        if slot is None:
+            return None
+        position = slot - bisect_left(self._removed, slot)
+        self._slots[expense_id] = None
+        self._pending.append(slot)
+        self._release(expense_id)
+        return position
+
+    # After removing the id with the highest sequence of its date, continue
+    # that date after the highest id left, reading only the ids with its
+    # prefix.
+    def _release(self, expense_id: str) -> None:
+        found = id_sequence(expense_id)
+        if found is None or self.allocator.last(found[0]) != found[1]:
+            return
+        prefix = found[0]
+        ids = list(self._added.get(prefix, ()))
+        if self.table is not None:
+            ids.extend(self.table.ids_with_prefix(prefix))
+        self.allocator.rewind(
+            prefix, (candidate for candidate in ids if self._slot(candidate) is not None)
+        )
+
+    # Apply the removals once their rows are gone from the list.
+    def reindex(self, expenses: list[dict]) -> None:
+        for slot in self._pending:
+            insort(self._removed, slot)
+        self._pending = []
+        self.size = len(expenses)
+
+    # Apply a resolved journal record without the ledger list at hand.
+    def replay(self, entry: dict) -> None:
+        kind = entry.get("op")
+        if kind == "add":
+            self.add(entry["expense"])
+        elif kind == "delete":
+            if self.remove(entry["id"]) is not None:
+                insort(self._removed, self._pending.pop())
+                self.size -= 1
@@ -1,7 +1,144 @@
 from __future__ import annotations
 
+import atexit
+import json
 import logging
-from pathlib import Path
+import os
+import queue
+import time
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+
+_LOG_FILE = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "logs", "tracker.log"
+)
+_LEVEL_ENV = "TRACKER_LOG_LEVEL"
+_FORMAT_ENV = "TRACKER_LOG_FORMAT"
+_MAX_BYTES = 5 * 1024 * 1024
+_BACKUP_COUNT = 3
+_TEXT_FORMAT = "%(asctime)s | %(levelname)s | %(name)s | %(message)s"
+
+# Queue and background writer shared by every tracker logger in this process.
+_pipeline: tuple[queue.SimpleQueue, QueueListener] | None = None
+_loggers: list[logging.Logger] = []
+
+
+# Rotating file handler that creates logs/ and opens the file on the first
+# record, so commands that never log (and --help) touch no files.
+class _DeferredFileHandler(RotatingFileHandler):
+    def __init__(self, path: str) -> None:
+        super().__init__(
+            path,
+            maxBytes=_MAX_BYTES,
+            backupCount=_BACKUP_COUNT,
+            encoding="utf-8",
+            delay=True,
+        )
+
+    # Open the log file, creating its directory first.
+    def _open(self):
+        os.makedirs(os.path.dirname(self.baseFilename), exist_ok=True)
+        return super()._open()
+
+
+# Text lines as before, with the operation and its duration when present.
+class _TextFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        line = super().format(record)
+        duration = getattr(record, "duration_ms", None)
+        if duration is not None:
+            line += f" | {getattr(record, 'operation', '-')} {duration:.3f} ms"
+        return line
+
+
+# One JSON object per line.
+class _JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        payload = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "pid": record.process,
+            "message": record.getMessage(),
+        }
+        for field in ("operation", "duration_ms"):
+            value = getattr(record, field, None)
+            if value is not None:
+                payload[field] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            payload["exception"] = record.exc_text
+        return json.dumps(payload, ensure_ascii=False)
+
+
+# Log level from TRACKER_LOG_LEVEL (a name such as DEBUG, or a number);
+# INFO when unset or not recognised.
+def log_level() -> int:
+    value = os.environ.get(_LEVEL_ENV, "").strip()
+    if value.isdigit():
+        return int(value)
+    level = getattr(logging, value.upper(), None) if value else None
+    return level if isinstance(level, int) else logging.INFO
+
+
+# File handler writing text, or JSON lines when TRACKER_LOG_FORMAT=json.
+def _file_handler() -> logging.Handler:
+    handler = _DeferredFileHandler(_LOG_FILE)
+    if os.environ.get(_FORMAT_ENV, "").strip().lower() == "json":
+        handler.setFormatter(_JsonFormatter())
+    else:
+        handler.setFormatter(_TextFormatter(_TEXT_FORMAT))
+    return handler
+
+
+# Queue the loggers put records on, starting the writer thread on first use.
+def _log_queue() -> queue.SimpleQueue:
+    global _pipeline
+    if _pipeline is None:
+        records: queue.SimpleQueue = queue.SimpleQueue()
+        listener = QueueListener(records, _file_handler())
+        listener.start()
+        _pipeline = records, listener
+    return _pipeline[0]
+
+
+# Write out queued records and stop the writer thread.
+def shutdown_logging() -> None:
+    global _pipeline
+    if _pipeline is None:
+        return
+    _, listener = _pipeline
+    _pipeline = None
+    listener.stop()
+    for handler in listener.handlers:
+        handler.close()
+
+
+# A forked child has no writer thread and may leave through os._exit,
+# skipping atexit, so it writes its records directly.
+def _after_fork_in_child() -> None:
+    global _pipeline
+    _pipeline = None
+    for logger in _loggers:
+        for handler in list(logger.handlers):
+            if isinstance(handler, QueueHandler):
+                logger.removeHandler(handler)
+                logger.addHandler(_file_handler())
+
+
+atexit.register(shutdown_logging)
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_after_fork_in_child)
+
+
+# Extra fields for the log record of an operation that started at `started`
+# (a time.perf_counter() value).
+def operation_fields(operation: str, started: float) -> dict:
+    return {
+        "operation": operation,
+        "duration_ms": round((time.perf_counter() - started) * 1000, 3),
+    }
 
 
 def get_logger(name: str = "tracker") -> logging.Logger:
@@ -9,16 +146,10 @@ def get_logger(name: str = "tracker") -> logging.Logger:
     if logger.handlers:
         return logger
 
-    log_dir = Path(__file__).resolve().parent.parent / "logs"
-    log_dir.mkdir(parents=True, exist_ok=True)
-    log_file = log_dir / "tracker.log"
-
-    logger.setLevel(logging.INFO)
-    handler = logging.FileHandler(log_file, encoding="utf-8")
-    formatter = logging.Formatter(
-        "%(asctime)s | %(levelname)s | %(name)s | %(message)s"
-    )
-    handler.setFormatter(formatter)
-    logger.addHandler(handler)
+    # Callers only format the record and enqueue it; a background thread
+    # writes it, so log I/O never blocks a command or the daemon.
+    logger.setLevel(log_level())
+    logger.addHandler(QueueHandler(_log_queue()))
     logger.propagate = False
+    _loggers.append(logger)
     return logger
@@ -1,10 +1,14 @@
 from __future__ import annotations
 
-from dataclasses import dataclass
+from dataclasses import dataclass, field
+from sys import intern
+from typing import Iterable, Iterator, NamedTuple
 
 
-@dataclass(frozen=True)
-class Expense:
+# Tuple-backed, immutable expense record. Cheaper to build and smaller than
+# a dataclass instance; category and currency strings are interned so rows
+# share them.
+class Expense(NamedTuple):
     id: str
     date: str
     category: str
@@ -15,16 +19,37 @@ class Expense:
 
     @classmethod
     def from_dict(cls, data: dict) -> "Expense":
-        return cls(
-            id=str(data["id"]),
-            date=str(data["date"]),
-            category=str(data["category"]),
-            amount=float(data["amount"]),
-            currency=str(data.get("currency", "BDT")),
-            note=str(data.get("note", "")),
-            created_at=str(data["created_at"]),
+        return _new_expense(
+            cls,
+            (
+                str(data["id"]),
+                str(data["date"]),
+                intern(str(data["category"])),
+                float(data["amount"]),
+                intern(str(data.get("currency", "BDT"))),
+                str(data.get("note", "")),
+                str(data["created_at"]),
+            ),
         )
 
+    # Build expenses from records the tracker stored itself, skipping the
+    # str()/float() coercion that from_dict applies to untrusted input.
+    @classmethod
+    def from_dicts(cls, rows: Iterable[dict]) -> Iterator["Expense"]:
+        for data in rows:
+            yield _new_expense(
+                cls,
+                (
+                    data["id"],
+                    data["date"],
+                    intern(data["category"]),
+                    data["amount"],
+                    intern(data.get("currency", "BDT")),
+                    data.get("note", ""),
+                    data["created_at"],
+                ),
+            )
+
     def to_dict(self) -> dict:
         return {
             "id": self.id,
@@ -35,3 +60,84 @@ class Expense:
             "note": self.note,
             "created_at": self.created_at,
         }
+
+
+_new_expense = tuple.__new__
+
+
+# Summary totals. `currencies` holds per-currency subtotals in each
+# currency's own units; `currency` is set when the other totals were
+# converted into it.
+@dataclass(frozen=True)
+class Summary:
+    count: int
+    total: float
+    categories: dict[str, float]
+    months: dict[str, float]
+    currencies: dict[str, float] = field(default_factory=dict)
+    currency: str | None = None
+
+
+# One period of a trend: the total and count of the days start..end (YYYY-MM-DD),
+# their average per day, and with a window the average per day over the
+# `window` days ending at `end`.
+@dataclass(frozen=True)
+class TrendPoint:
+    period: str
+    start: str
+    end: str
+    count: int
+    total: float
+    average: float
+    rolling: float | None = None
+
+
+# Trend series with the totals of its whole range. `currencies` lists the
+# currencies of the amounts in range; `currency` is set when they were
+# converted into it.
+@dataclass(frozen=True)
+class Trend:
+    points: list[TrendPoint]
+    overall: TrendPoint | None
+    window: int | None = None
+    currencies: list[str] = field(default_factory=list)
+    currency: str | None = None
+
+
+# Monthly spending limit of one category, in `currency`; an alert is
+# reported when a write takes a month's spend to each threshold (percent
+# of the limit).
+@dataclass(frozen=True)
+class Budget:
+    category: str
+    limit: float
+    currency: str
+    thresholds: list[int] = field(default_factory=lambda: [80, 100])
+
+
+# A threshold a write took a budget's month spend to.
+@dataclass(frozen=True)
+class BudgetAlert:
+    category: str
+    month: str
+    threshold: int
+    limit: float
+    spent: float
+    currency: str
+
+
+# Spend of one budget in a month; `reached` is the highest threshold reached.
+@dataclass(frozen=True)
+class BudgetStatus:
+    budget: Budget
+    month: str
+    spent: float
+    count: int
+    reached: int | None = None
+
+
+@dataclass(frozen=True)
+class ImportReport:
+    imported: int
+    skipped: int
+    errors: list[str]
@@ -0,0 +1,664 @@
+from __future__ import annotations
+
+import heapq
+import math
+import json
+from itertools import count, islice
+from pathlib import Path
+from typing import IO, Iterator
+from uuid import uuid4
+
+from .logger import get_logger
+from .storage import (
+    Change,
+    file_signature,
+    missing_target,
+    op_results,
+    pick_records,
+    write_snapshot,
+)
+from .utils import IdAllocator, day_number
+
+
+_MANIFEST_VERSION = 1
+_MANIFEST_NAME = "manifest.json"
+# Shard for rows whose date is not a canonical YYYY-MM-DD; never pruned by date.
+_MISC_SHARD = "misc"
+# Ledgers with fewer than two of these rows are not split for parallel reads.
+_CHUNK_MIN_ROWS = 50000
+_SORT_FIELDS = {
+    "date": "date",
+    "amount": "amount",
+    "category": "category",
+    "created": "created_at",
+    "id": "id",
+}
+
+
+# File name of a shard as the manifest lists it; layouts written before
+# shard files carried a generation use YYYY-MM.json.
+def _shard_file(manifest: dict, shard: str) -> str:
+    return manifest["shards"][shard].get("file", f"{shard}.json")
+
+
+# Close shard files opened by PartitionedStorage._open_shards().
+def _close(opened: list[tuple[Path, IO]]) -> None:
+    for _, handle in opened:
+        handle.close()
+
+
+# Shard key for a record: its YYYY-MM month, or the misc shard.
+def _shard_of(record: dict) -> str:
+    date_str = record.get("date")
+    if day_number(date_str) is None:
+        return _MISC_SHARD
+    return date_str[:7]
+
+
+# Month encoded in an allocated id (EXP-YYYYMMDD-NNNN), or None.
+def _home_shard(expense_id: str) -> str | None:
+    parts = expense_id.split("-")
+    if len(parts) != 3 or parts[0] != "EXP" or len(parts[1]) != 8:
+        return None
+    return f"{parts[1][:4]}-{parts[1][4:6]}"
+
+
+# Per-shard statistics used to prune shards that cannot match a filter.
+def _shard_stats(rows: list[dict]) -> dict:
+    amounts = [float(item["amount"]) for item in rows]
+    return {
+        "count": len(rows),
+        "min_amount": min(amounts),
+        "max_amount": max(amounts),
+        "categories": sorted({str(item["category"]) for item in rows}),
+    }
+
+
+# True when a row passes the list/summary filters.
+def _matches(
+    item: dict,
+    month: str | None,
+    category: str | None,
+    min_amount: float | None,
+    max_amount: float | None,
+    from_date: str | None,
+    to_date: str | None,
+) -> bool:
+    date_str = str(item["date"])
+    amount = float(item["amount"])
+    return (
+        (month is None or date_str.startswith(month))
+        and (category is None or item["category"] == category)
+        and (min_amount is None or amount >= min_amount)
+        and (max_amount is None or amount <= max_amount)
+        and (from_date is None or date_str >= from_date)
+        and (to_date is None or date_str <= to_date)
+    )
+
+
+# Month-partitioned storage: one snapshot-format shard per YYYY-MM under
+# data/expenses.parts/, plus a manifest with per-shard counts, amount range
+# and categories, and the ids living outside the month their id encodes.
+# Queries read only the shards their filters can match; writes rewrite only
+# the shards they touch.
+#
+# Shard files are never rewritten in place: a write puts the shards it
+# changes in new files named YYYY-MM.<generation>.json, switches to them by
+# replacing the manifest, and only then removes the files they replaced. A
+# write that fails (or a crash) before the manifest leaves the ledger as it
+# was, and the manifest stamp covers every shard.
+class PartitionedStorage:
+    name = "partitioned"
+    supports_queries = True
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self.manifest_path = path / _MANIFEST_NAME
+
+    # Signature of the manifest, which every write rewrites.
+    def stamp(self) -> list:
+        return [file_signature(self.manifest_path)]
+
+    # Path of a shard file in the layout a manifest describes.
+    def _shard_path(self, manifest: dict, shard: str) -> Path:
+        return self.path / _shard_file(manifest, shard)
+
+    # Read the manifest; an empty one when the layout does not exist yet.
+    def _read_manifest(self) -> dict:
+        try:
+            with self.manifest_path.open("r", encoding="utf-8") as handle:
+                manifest = json.load(handle)
+        except FileNotFoundError:
+            return {
+                "version": _MANIFEST_VERSION,
+                "shards": {},
+                "relocated": {},
+            }
+        except json.JSONDecodeError as exc:
+            get_logger().error("Invalid JSON in %s", self.manifest_path)
+            raise RuntimeError("Data file is corrupted") from exc
+        except OSError as exc:
+            get_logger().error(
+                "Failed to read data file %s: %s", self.manifest_path, exc
+            )
+            raise RuntimeError("Unable to read data file") from exc
+        if manifest.get("version") != _MANIFEST_VERSION or "shards" not in manifest:
+            get_logger().error("Unexpected schema in %s", self.manifest_path)
+            raise RuntimeError("Data file has an invalid schema")
+        return manifest
+
+    # Write the manifest last, after the shards it describes.
+    def _write_manifest(self, manifest: dict) -> None:
+        write_snapshot(self.manifest_path, manifest)
+
+    # Open the files of the shards `select` picks from the manifest. A
+    # writer removes the files it replaced once its manifest is in place, so
+    # a file gone missing means a newer manifest: read it again. Open files
+    # stay readable after their removal, so every row read comes from the
+    # layout of one manifest.
+    def _open_shards(self, select) -> tuple[dict, list[tuple[Path, IO]]]:
+        previous = None
+        while True:
+            manifest = self._read_manifest()
+            opened: list[tuple[Path, IO]] = []
+            try:
+                for shard in select(manifest):
+                    path = self._shard_path(manifest, shard)
+                    opened.append((path, path.open("r", encoding="utf-8")))
+            except FileNotFoundError as exc:
+                _close(opened)
+                if manifest == previous:
+                    get_logger().error("Missing shard file %s", exc.filename)
+                    raise RuntimeError("Data file is corrupted") from exc
+                previous = manifest
+                continue
+            except OSError as exc:
+                _close(opened)
+                get_logger().error("Failed to read data file %s: %s", exc.filename, exc)
+                raise RuntimeError("Unable to read data file") from exc
+            return manifest, opened
+
+    # Parse an open shard file.
+    def _parse_shard(self, path: Path, handle: IO) -> dict:
+        try:
+            with handle:
+                data = json.load(handle)
+        except json.JSONDecodeError as exc:
+            get_logger().error("Invalid JSON in %s", path)
+            raise RuntimeError("Data file is corrupted") from exc
+        except OSError as exc:
+            get_logger().error("Failed to read data file %s: %s", path, exc)
+            raise RuntimeError("Unable to read data file") from exc
+        if "version" not in data or "expenses" not in data:
+            get_logger().error("Unexpected schema in %s", path)
+            raise RuntimeError("Data file has an invalid schema")
+        return data
+
+    # Rows of the shards `select` picks, shard by shard.
+    def _read_shards(self, select) -> Iterator[list[dict]]:
+        _, opened = self._open_shards(select)
+        try:
+            for path, handle in opened:
+                yield self._parse_shard(path, handle)["expenses"]
+        finally:
+            _close(opened)
+
+    # Open one shard file; a missing file is an error.
+    def _open_file(self, path: Path) -> tuple[Path, IO]:
+        try:
+            return path, path.open("r", encoding="utf-8")
+        except OSError as exc:
+            get_logger().error("Failed to read data file %s: %s", path, exc)
+            raise RuntimeError("Unable to read data file") from exc
+
+    # Rows of one shard with their insertion numbers; a shard written before
+    # the numbers were kept takes them from `numbers` in ledger order.
+    def _numbered(
+        self, path: Path, handle: IO, numbers: Iterator[int]
+    ) -> tuple[list[dict], list[int]]:
+        data = self._parse_shard(path, handle)
+        rows = data["expenses"]
+        if "order" not in data:
+            return rows, list(islice(numbers, len(rows)))
+        if len(data["order"]) != len(rows):
+            get_logger().error("Unexpected schema in %s", path)
+            raise RuntimeError("Data file has an invalid schema")
+        return rows, data["order"]
+
+    # Write the rows of each shard to a new file of this write's generation;
+    # returns the manifest entries of the shards. Files already written are
+    # removed again when one fails.
+    def _write_shards(
+        self, shards: dict[str, list[dict]], orders: dict[str, list[int]]
+    ) -> dict[str, dict]:
+        generation = uuid4().hex
+        listing: dict[str, dict] = {}
+        try:
+            for shard, rows in sorted(shards.items()):
+                name = f"{shard}.{generation}.json"
+                listing[shard] = {**_shard_stats(rows), "file": name}
+                write_snapshot(
+                    self.path / name,
+                    {"version": 1, "expenses": rows, "order": orders[shard]},
+                )
+        except RuntimeError:
+            self._remove_files(entry["file"] for entry in listing.values())
+            raise
+        return listing
+
+    # Remove files of the shard directory; failures are logged and the files
+    # left for the next write to remove.
+    def _remove_files(self, names: Iterator[str]) -> None:
+        for name in names:
+            try:
+                (self.path / name).unlink(missing_ok=True)
+            except OSError as exc:
+                get_logger().error("Failed to remove shard file %s: %s", name, exc)
+
+    # Remove the files a manifest just written no longer lists: shards it
+    # replaced, and leftovers of writes that failed before their manifest.
+    # Writers hold the ledger lock, so no other write has files in flight.
+    def _remove_unlisted(self, manifest: dict) -> None:
+        listed = {_shard_file(manifest, shard) for shard in manifest["shards"]}
+        listed.add(_MANIFEST_NAME)
+        try:
+            names = [entry.name for entry in self.path.iterdir()]
+        except OSError as exc:
+            get_logger().error("Failed to list shard files in %s: %s", self.path, exc)
+            return
+        self._remove_files(name for name in names if name not in listed)
+
+    # Shards whose month and statistics can match the filters, in ledger order.
+    def _candidate_shards(
+        self,
+        manifest: dict,
+        *,
+        month: str | None = None,
+        category: str | None = None,
+        min_amount: float | None = None,
+        max_amount: float | None = None,
+        from_date: str | None = None,
+        to_date: str | None = None,
+    ) -> list[str]:
+        selected = []
+        for shard, stats in sorted(manifest["shards"].items()):
+            if shard != _MISC_SHARD and (
+                (month is not None and shard != month[:7])
+                or (from_date is not None and shard < from_date[:7])
+                or (to_date is not None and shard > to_date[:7])
+            ):
+                continue
+            if category is not None and category not in stats["categories"]:
+                continue
+            if min_amount is not None and stats["max_amount"] < min_amount:
+                continue
+            if max_amount is not None and stats["min_amount"] > max_amount:
+                continue
+            selected.append(shard)
+        return selected
+
+    # Load the whole ledger, shard by shard in month order.
+    def load(self) -> dict:
+        return {"version": 1, "expenses": list(self.iter_records())}
+
+    # Stream records shard by shard in month order.
+    def iter_records(self) -> Iterator[dict]:
+        for rows in self._read_shards(lambda manifest: sorted(manifest["shards"])):
+            yield from rows
+
+    # Records with the given ids, in that order; missing ids are skipped.
+    # Reads only the shards the ids live in (see _ShardWriter._locate).
+    def records_by_id(self, ids: list[str]) -> Iterator[dict]:
+        by_shard: dict[str, list[str]] = {}
+
+        def _select(manifest: dict) -> list[str]:
+            relocated = manifest.get("relocated", {})
+            by_shard.clear()
+            for expense_id in ids:
+                shard = relocated.get(expense_id) or _home_shard(expense_id)
+                if shard in manifest["shards"]:
+                    by_shard.setdefault(shard, []).append(expense_id)
+            return list(by_shard)
+
+        _, opened = self._open_shards(_select)
+        found: dict[str, dict] = {}
+        try:
+            for (path, handle), shard_ids in zip(opened, list(by_shard.values())):
+                rows = self._parse_shard(path, handle)["expenses"]
+                for record in pick_records(rows, shard_ids):
+                    found[record["id"]] = record
+        finally:
+            _close(opened)
+        return (found[expense_id] for expense_id in ids if expense_id in found)
+
+    # Up to `count` groups of the files of consecutive candidate shards with
+    # about equal row counts, for other processes to read with read_chunk();
+    # None when there are too few rows to be worth splitting.
+    def chunks(self, count: int, **filters) -> list[tuple[str, ...]] | None:
+        manifest = self._read_manifest()
+        shards = self._candidate_shards(manifest, **filters)
+        sizes = [manifest["shards"][shard]["count"] for shard in shards]
+        total = sum(sizes)
+        count = min(count, total // _CHUNK_MIN_ROWS, len(shards))
+        if count < 2:
+            return None
+        groups: list[tuple[str, ...]] = []
+        current: list[str] = []
+        filled = 0
+        for shard, size in zip(shards, sizes):
+            current.append(_shard_file(manifest, shard))
+            filled += size
+            if len(groups) < count - 1 and filled * count >= total * (len(groups) + 1):
+                groups.append(tuple(current))
+                current = []
+        if current:
+            groups.append(tuple(current))
+        return groups
+
+    # Records of one group of shard files; a file a later write replaced
+    # fails the chunk, and the summary falls back to one process.
+    def read_chunk(self, chunk: tuple[str, ...], seen: set[str]) -> Iterator[dict]:
+        for name in chunk:
+            yield from self._parse_shard(*self._open_file(self.path / name))["expenses"]
+
+    # Every record belongs to a shard, so no chunk misses any.
+    def chunk_tail(self, chunks: list, seen: set[str]) -> Iterator[dict]:
+        return iter(())
+
+    # Replace the whole ledger with a fresh set of shards.
+    def save(self, data: dict) -> None:
+        shards: dict[str, list[dict]] = {}
+        relocated: dict[str, str] = {}
+        for item in data["expenses"]:
+            shard = _shard_of(item)
+            shards.setdefault(shard, []).append(item)
+            if _home_shard(str(item["id"])) != shard:
+                relocated[str(item["id"])] = shard
+        orders: dict[str, list[int]] = {}
+        for order, item in enumerate(data["expenses"]):
+            orders.setdefault(_shard_of(item), []).append(order)
+        listing = self._write_shards(shards, orders)
+        manifest = {
+            "version": _MANIFEST_VERSION,
+            "shards": listing,
+            "relocated": relocated,
+            "next_order": len(data["expenses"]),
+        }
+        self._commit(manifest, [entry["file"] for entry in listing.values()])
+
+    # Switch to the shard files a manifest lists by writing it, then remove
+    # the files it no longer lists. A failed manifest write removes the
+    # files `written` for it instead, leaving the previous layout as it was.
+    def _commit(self, manifest: dict, written: list[str]) -> None:
+        try:
+            self._write_manifest(manifest)
+        except RuntimeError:
+            self._remove_files(iter(written))
+            raise
+        self._remove_unlisted(manifest)
+
+    # Apply operations and return the per-operation results.
+    def apply(self, ops: list[dict]) -> list[dict | None]:
+        return op_results(ops, self.apply_changes(ops))
+
+    # Apply add/edit/delete operations, rewriting only the touched shards.
+    def apply_changes(self, ops: list[dict]) -> list[Change]:
+        manifest = self._read_manifest()
+        writer = _ShardWriter(self, manifest)
+        changes = [writer.apply(op) for op in ops]
+        if writer.dirty:
+            writer.flush()
+        return changes
+
+    # Recompute the manifest from the shard files, dropping empty shards and
+    # files no shard lists; returns the number of expenses.
+    def compact(self) -> int:
+        manifest, opened = self._open_shards(lambda manifest: list(manifest["shards"]))
+        count = 0
+        for shard, (path, handle) in zip(list(manifest["shards"]), opened):
+            rows = self._parse_shard(path, handle)["expenses"]
+            if rows:
+                manifest["shards"][shard] = {
+                    **_shard_stats(rows),
+                    "file": _shard_file(manifest, shard),
+                }
+            else:
+                del manifest["shards"][shard]
+            count += len(rows)
+        self._commit(manifest, [])
+        return count
+
+    # Stream filtered, sorted and limited rows from the matching shards only;
+    # sort_by=None keeps ledger order (month order, then insertion order).
+    # Sorted rows with equal keys keep global insertion order, like the
+    # stable sort of the json engine, in either direction.
+    def query(
+        self,
+        *,
+        month: str | None = None,
+        category: str | None = None,
+        min_amount: float | None = None,
+        max_amount: float | None = None,
+        from_date: str | None = None,
+        to_date: str | None = None,
+        sort_by: str | None = "date",
+        desc: bool = False,
+        limit: int | None = None,
+    ) -> Iterator[dict]:
+        filters = (month, category, min_amount, max_amount, from_date, to_date)
+        _, opened = self._open_shards(
+            lambda manifest: self._candidate_shards(
+                manifest,
+                month=month,
+                category=category,
+                min_amount=min_amount,
+                max_amount=max_amount,
+                from_date=from_date,
+                to_date=to_date,
+            )
+        )
+        get_logger().info("Query reads %d shard(s)", len(opened))
+        try:
+            if sort_by is None:
+                rows = (
+                    item
+                    for path, handle in opened
+                    for item in self._parse_shard(path, handle)["expenses"]
+                    if _matches(item, *filters)
+                )
+                yield from islice(rows, limit)
+                return
+            field = _SORT_FIELDS[sort_by]
+            # Insertion numbers count down when descending, so ties still
+            # come out oldest first.
+            sign = -1 if desc else 1
+            numbers = count()
+            keyed = (
+                ((item[field], sign * order), item)
+                for path, handle in opened
+                for item, order in zip(*self._numbered(path, handle, numbers))
+                if _matches(item, *filters)
+            )
+            if limit is not None:
+                pick = heapq.nlargest if desc else heapq.nsmallest
+                yield from (item for _, item in pick(limit, keyed, key=lambda pair: pair[0]))
+                return
+            keyed_rows = sorted(keyed, key=lambda pair: pair[0], reverse=desc)
+            yield from (item for _, item in keyed_rows)
+        finally:
+            _close(opened)
+
+    # Count, grand total, category totals and month totals from matching shards.
+    def totals(
+        self,
+        *,
+        month: str | None = None,
+        category: str | None = None,
+        from_date: str | None = None,
+        to_date: str | None = None,
+    ) -> tuple[int, float, dict[str, float], dict[str, float], dict[str, float]]:
+        # Added in minor units, like the aggregates and the columns summary.
+        count = 0
+        total = 0
+        categories: dict[str, int] = {}
+        months: dict[str, int] = {}
+        currencies: dict[str, int] = {}
+        rows = self.query(
+            month=month,
+            category=category,
+            from_date=from_date,
+            to_date=to_date,
+            sort_by=None,
+        )
+        for item in rows:
+            minor = float(item["amount"]) * 100
+            if math.isfinite(minor):
+                minor = round(minor)
+            count += 1
+            total += minor
+            categories[item["category"]] = categories.get(item["category"], 0) + minor
+            month_key = str(item["date"])[:7]
+            months[month_key] = months.get(month_key, 0) + minor
+            currency = item.get("currency", "BDT")
+            currencies[currency] = currencies.get(currency, 0) + minor
+        return (
+            count,
+            total / 100,
+            {key: value / 100 for key, value in categories.items()},
+            {key: value / 100 for key, value in months.items()},
+            {key: value / 100 for key, value in currencies.items()},
+        )
+
+
+# Applies operations to the shards of one write, loading each shard at most
+# once and writing back only the shards that changed.
+#
+# Every row keeps an insertion number next to it in its shard ("order"):
+# adds take the next one, edits and re-adds of an id keep theirs, so sorted
+# queries can break ties in global insertion order.
+class _ShardWriter:
+    def __init__(self, storage: PartitionedStorage, manifest: dict) -> None:
+        self.storage = storage
+        self.manifest = manifest
+        self.relocated: dict[str, str] = manifest.setdefault("relocated", {})
+        self.shards: dict[str, list[dict]] = {}
+        self.orders: dict[str, list[int]] = {}
+        self.dirty: set[str] = set()
+        self.numbers = count(manifest.get("next_order", 0))
+        if "next_order" not in manifest:
+            # Shards written before insertion numbers were kept: number
+            # every row in ledger order, once.
+            for shard in sorted(manifest["shards"]):
+                self._rows(shard)
+                self.dirty.add(shard)
+
+    # Rows of a shard, loaded on first use.
+    def _rows(self, shard: str) -> list[dict]:
+        rows = self.shards.get(shard)
+        if rows is None:
+            rows, orders = [], []
+            if shard in self.manifest["shards"]:
+                path = self.storage._shard_path(self.manifest, shard)
+                rows, orders = self.storage._numbered(
+                    *self.storage._open_file(path), self.numbers
+                )
+            self.shards[shard] = rows
+            self.orders[shard] = orders
+        return rows
+
+    # Shard and position of an id, looking in the shard its id encodes
+    # unless the manifest records that it moved.
+    def _locate(self, expense_id: str) -> tuple[str, int] | None:
+        shard = self.relocated.get(expense_id) or _home_shard(expense_id)
+        if shard is None:
+            return None
+        for position, item in enumerate(self._rows(shard)):
+            if item["id"] == expense_id:
+                return shard, position
+        return None
+
+    # Next id for a date: one past the highest sequence of the ids with its
+    # prefix, which live in the month shard their id encodes unless the
+    # manifest records that they moved.
+    def _allocate(self, date_str: str) -> str:
+        allocator = IdAllocator()
+        prefix = f"EXP-{date_str.replace('-', '')}-"
+        home = _home_shard(f"{prefix}0")
+        if home is not None:
+            for item in self._rows(home):
+                if str(item["id"]).startswith(prefix):
+                    allocator.observe(item["id"])
+        for expense_id in self.relocated:
+            if expense_id.startswith(prefix):
+                allocator.observe(expense_id)
+        return allocator.allocate(date_str)
+
+    # Put a record into the shard its date belongs to.
+    def _place(self, record: dict, located: tuple[str, int] | None) -> None:
+        shard = _shard_of(record)
+        if located is not None and located[0] == shard:
+            self._rows(shard)[located[1]] = record
+        else:
+            if located is not None:
+                order = self.orders[located[0]][located[1]]
+                self._remove(located)
+            else:
+                order = next(self.numbers)
+            self._rows(shard).append(record)
+            self.orders[shard].append(order)
+        self.dirty.add(shard)
+        if _home_shard(record["id"]) == shard:
+            self.relocated.pop(record["id"], None)
+        else:
+            self.relocated[record["id"]] = shard
+
+    # Remove the row at a located position.
+    def _remove(self, located: tuple[str, int]) -> dict:
+        shard, position = located
+        self.dirty.add(shard)
+        self.orders[shard].pop(position)
+        return self._rows(shard).pop(position)
+
+    # Apply one operation with the same semantics as storage.apply_ops().
+    def apply(self, op: dict) -> Change:
+        kind = op.get("op")
+        if kind == "add":
+            record = dict(op["expense"])
+            if not record.get("id"):
+                record.pop("id", None)
+                record = {"id": self._allocate(record["date"]), **record}
+            located = self._locate(record["id"])
+            before = self.shards[located[0]][located[1]] if located else None
+            self._place(record, located)
+            return before, record
+        if kind == "edit":
+            located = self._locate(op["id"])
+            if located is None:
+                return missing_target(op)
+            before = self.shards[located[0]][located[1]]
+            record = {**before, **op["changes"]}
+            self._place(record, located)
+            return before, record
+        if kind == "delete":
+            located = self._locate(op["id"])
+            if located is None:
+                return missing_target(op)
+            self.relocated.pop(op["id"], None)
+            return self._remove(located), None
+        raise ValueError(f"Unknown operation: {kind}")
+
+    # Write changed shards to new files, then the manifest that switches to
+    # them; the shards' previous files are removed after that.
+    def flush(self) -> None:
+        changed = {shard: self.shards[shard] for shard in self.dirty if self.shards[shard]}
+        listing = self.storage._write_shards(changed, self.orders)
+        shards = {
+            shard: entry
+            for shard, entry in self.manifest["shards"].items()
+            if shard not in self.dirty
+        }
+        self.manifest["shards"] = dict(sorted({**shards, **listing}.items()))
+        self.manifest.pop("sequences", None)
+        self.manifest["next_order"] = next(self.numbers)
+        self.storage._commit(self.manifest, [entry["file"] for entry in listing.values()])
+        get_logger().info("Rewrote %d shard(s)", len(self.dirty))
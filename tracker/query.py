@@ -0,0 +1,324 @@
+from __future__ import annotations
+
+import heapq
+import math
+from bisect import bisect_left, bisect_right
+from dataclasses import dataclass
+from itertools import islice
+from typing import Callable, Iterable, Iterator
+
+from .models import Expense
+from .spans import span, timed_iter
+
+
+SORT_KEYS: dict[str, Callable[[Expense], object]] = {
+    "date": lambda exp: exp.date,
+    "amount": lambda exp: exp.amount,
+    "category": lambda exp: exp.category,
+    "created": lambda exp: exp.created_at,
+    "id": lambda exp: exp.id,
+}
+# Keys kept presorted: range access on date/amount, and the common orders.
+ORDERED_KEYS = ("date", "created", "id", "amount")
+
+
+# Filters of a list/export/summary query.
+@dataclass(frozen=True)
+class FilterSpec:
+    month: str | None = None
+    category: str | None = None
+    min_amount: float | None = None
+    max_amount: float | None = None
+    from_date: str | None = None
+    to_date: str | None = None
+
+    # True when an expense passes every filter.
+    def matches(self, exp: Expense) -> bool:
+        return (
+            (self.month is None or exp.date.startswith(self.month))
+            and (self.category is None or exp.category == self.category)
+            and (self.min_amount is None or exp.amount >= self.min_amount)
+            and (self.max_amount is None or exp.amount <= self.max_amount)
+            and (self.from_date is None or exp.date >= self.from_date)
+            and (self.to_date is None or exp.date <= self.to_date)
+        )
+
+    # Inclusive/exclusive date-string range [low, high) covering the month
+    # and from/to filters, or None when dates are not filtered.
+    def date_range(self) -> tuple[str | None, str | None] | None:
+        low = self.from_date
+        high = self.to_date + "\0" if self.to_date is not None else None
+        if self.month is not None:
+            low = self.month if low is None else max(low, self.month)
+            month_end = self.month + "~"
+            high = month_end if high is None else min(high, month_end)
+        if low is None and high is None:
+            return None
+        return low, high
+
+    # Query keyword arguments for engines with their own query support.
+    def as_kwargs(self) -> dict:
+        return {
+            "month": self.month,
+            "category": self.category,
+            "min_amount": self.min_amount,
+            "max_amount": self.max_amount,
+            "from_date": self.from_date,
+            "to_date": self.to_date,
+        }
+
+
+# Chosen plan as steps of [description, rows], filled in while it runs.
+class QueryPlan:
+    def __init__(self) -> None:
+        self.steps: list[list] = []
+
+    # Add a step; returns its number for later row counts.
+    def add(self, description: str, rows: int | None = None) -> int:
+        self.steps.append([description, rows])
+        return len(self.steps) - 1
+
+    # Record the number of rows a step produced.
+    def count(self, step: int, rows: int) -> None:
+        self.steps[step][1] = rows
+
+    # Printable lines, one per step.
+    def lines(self) -> list[str]:
+        return [
+            f"{number}. {description}" + ("" if rows is None else f" -> {rows} row(s)")
+            for number, (description, rows) in enumerate(self.steps, start=1)
+        ]
+
+
+# Secondary access paths over an in-memory ledger, built on first use:
+# positions presorted by a key (stable, so ties keep ledger order) with
+# the key values alongside for range lookups, and category -> positions.
+class LedgerAccess:
+    def __init__(self, expenses: list[Expense]) -> None:
+        self.expenses = expenses
+        self._orderings: dict[str, tuple[list[int], list]] = {}
+        self._categories: dict[str, list[int]] | None = None
+
+    # Positions sorted by `key` and the matching sorted key values.
+    def ordering(self, key: str) -> tuple[list[int], list]:
+        built = self._orderings.get(key)
+        if built is None:
+            getter = SORT_KEYS[key]
+            values = [getter(exp) for exp in self.expenses]
+            positions = sorted(range(len(values)), key=values.__getitem__)
+            built = positions, [values[position] for position in positions]
+            self._orderings[key] = built
+        return built
+
+    # Slice bounds of the ordering for values in [low, high] (or [low, high)).
+    def range_bounds(
+        self, key: str, low: object, high: object, high_inclusive: bool = True
+    ) -> tuple[int, int]:
+        _, values = self.ordering(key)
+        start = 0 if low is None else bisect_left(values, low)
+        if high is None:
+            stop = len(values)
+        elif high_inclusive:
+            stop = bisect_right(values, high)
+        else:
+            stop = bisect_left(values, high)
+        return start, max(start, stop)
+
+    # Positions of one category, in ledger order.
+    def category_positions(self, category: str) -> list[int]:
+        if self._categories is None:
+            categories: dict[str, list[int]] = {}
+            for position, exp in enumerate(self.expenses):
+                categories.setdefault(exp.category, []).append(position)
+            self._categories = categories
+        return self._categories.get(category, [])
+
+
+# Walk an ascending ordering from the top while keeping tied keys in
+# ascending position order, like sorted(..., reverse=True).
+def _descending(positions: list[int], values: list, start: int, stop: int) -> Iterator[int]:
+    end = stop
+    while end > start:
+        run_start = bisect_left(values, values[end - 1], start, end)
+        yield from positions[run_start:end]
+        end = run_start
+
+
+# Candidate access paths as (estimated rows, description, ordered_by,
+# producer). A producer returns candidate positions; `ordered_by` names the
+# sort key they already come out in, if any. Range estimates are exact
+# (bisect on the ordering), so the smallest estimate is the cheapest path.
+def _access_paths(
+    spec: FilterSpec, access: LedgerAccess
+) -> list[tuple[int, str, str | None, Callable[[bool], Iterator[int]]]]:
+    total = len(access.expenses)
+    paths: list = [(total, "full scan", None, lambda desc: iter(range(total)))]
+
+    date_range = spec.date_range()
+    if date_range is not None:
+        start, stop = access.range_bounds("date", *date_range, high_inclusive=False)
+
+        def _dates(desc: bool, start=start, stop=stop) -> Iterator[int]:
+            positions, values = access.ordering("date")
+            if desc:
+                return _descending(positions, values, start, stop)
+            return iter(positions[start:stop])
+
+        paths.append((stop - start, "date range on date ordering", "date", _dates))
+
+    if spec.min_amount is not None or spec.max_amount is not None:
+        start, stop = access.range_bounds("amount", spec.min_amount, spec.max_amount)
+
+        def _amounts(desc: bool, start=start, stop=stop) -> Iterator[int]:
+            positions, values = access.ordering("amount")
+            if desc:
+                return _descending(positions, values, start, stop)
+            return iter(positions[start:stop])
+
+        paths.append((stop - start, "amount range on amount ordering", "amount", _amounts))
+
+    if spec.category is not None:
+        positions = access.category_positions(spec.category)
+        paths.append(
+            (len(positions), f"category index ({spec.category})", None,
+             lambda desc: iter(positions))
+        )
+    return paths
+
+
+# Run a query over an in-memory ledger with the cheapest access path.
+#
+# Candidates from the access path are re-checked against every filter.
+# Rows come out already sorted when the path or a built ordering matches
+# the sort key (stopping at `limit`); otherwise a heap keeps the top
+# `limit` rows, or everything is sorted.
+def plan_and_run(
+    access: LedgerAccess,
+    spec: FilterSpec,
+    sort_by: str | None,
+    desc: bool,
+    limit: int | None,
+    plan: QueryPlan | None = None,
+) -> Iterator[Expense]:
+    plan = plan if plan is not None else QueryPlan()
+    expenses = access.expenses
+    total = len(expenses)
+    paths = _access_paths(spec, access)
+    estimate, description, ordered_by, produce = min(paths, key=lambda path: path[0])
+    considered = ", ".join(f"{path[1]} {path[0]}" for path in paths)
+    plan.add(f"ledger: {total} row(s); candidates per access path: {considered}")
+
+    # With an unselective filter, walking the presorted ordering for the
+    # sort key and stopping at `limit` (about total * limit / matches rows)
+    # beats collecting the candidates and keeping a top-k heap.
+    if (
+        sort_by in ORDERED_KEYS
+        and ordered_by != sort_by
+        and limit is not None
+        and total * limit / max(estimate, 1) < estimate * math.log2(limit + 2)
+    ):
+        description, ordered_by = f"walk {sort_by} ordering", sort_by
+
+        def produce(desc: bool) -> Iterator[int]:
+            positions, values = access.ordering(sort_by)
+            if desc:
+                return _descending(positions, values, 0, total)
+            return iter(positions)
+
+    access_step = plan.add(description)
+    filter_step = plan.add("filter")
+    scanned = 0
+    matched = 0
+
+    def _candidates() -> Iterator[Expense]:
+        nonlocal scanned, matched
+        positions = produce(desc if ordered_by == sort_by else False)
+        if ordered_by is not None and ordered_by != sort_by:
+            positions = iter(sorted(positions))
+        for position in positions:
+            scanned += 1
+            exp = expenses[position]
+            if spec.matches(exp):
+                matched += 1
+                yield exp
+
+    def _finish(rows: Iterable[Expense]) -> Iterator[Expense]:
+        produced = 0
+        for exp in rows:
+            produced += 1
+            yield exp
+        plan.count(access_step, scanned)
+        plan.count(filter_step, matched)
+        plan.count(output_step, produced)
+
+    if sort_by is None or ordered_by == sort_by:
+        output_step = plan.add(
+            ("already in storage order" if sort_by is None else f"already sorted by {sort_by}")
+            + (f", stop at {limit}" if limit is not None else "")
+        )
+        return _finish(islice(timed_iter("query.filter", _candidates()), limit))
+
+    key = SORT_KEYS[sort_by]
+    if limit is not None:
+        output_step = plan.add(f"heap top-{limit} by {sort_by}{' desc' if desc else ''}")
+        pick = heapq.nlargest if desc else heapq.nsmallest
+        with span("query.sort"):
+            rows = pick(limit, timed_iter("query.filter", _candidates()), key=key)
+        return _finish(iter(rows))
+    output_step = plan.add(f"sort by {sort_by}{' desc' if desc else ''}")
+    with span("query.sort"):
+        rows = sorted(timed_iter("query.filter", _candidates()), key=key, reverse=desc)
+    return _finish(iter(rows))
+
+
+# Stream a query over expenses that have no access paths (a streamed
+# ledger, or rows converted to another currency; `origin` names the source
+# in the plan): filter while reading, then heap top-k or sort.
+def scan_and_run(
+    source: Iterable[Expense],
+    spec: FilterSpec,
+    sort_by: str | None,
+    desc: bool,
+    limit: int | None,
+    plan: QueryPlan | None = None,
+    origin: str = "full scan (streamed from storage)",
+) -> Iterator[Expense]:
+    plan = plan if plan is not None else QueryPlan()
+    scan_step = plan.add(origin)
+    filter_step = plan.add("filter")
+    scanned = 0
+    matched = 0
+
+    def _candidates() -> Iterator[Expense]:
+        nonlocal scanned, matched
+        for exp in source:
+            scanned += 1
+            if spec.matches(exp):
+                matched += 1
+                yield exp
+
+    def _finish(rows: Iterable[Expense]) -> Iterator[Expense]:
+        produced = 0
+        for exp in rows:
+            produced += 1
+            yield exp
+        plan.count(scan_step, scanned)
+        plan.count(filter_step, matched)
+        plan.count(output_step, produced)
+
+    if sort_by is None:
+        output_step = plan.add(
+            "storage order" + (f", stop at {limit}" if limit is not None else "")
+        )
+        return _finish(islice(timed_iter("query.filter", _candidates()), limit))
+    key = SORT_KEYS[sort_by]
+    if limit is not None:
+        output_step = plan.add(f"heap top-{limit} by {sort_by}{' desc' if desc else ''}")
+        pick = heapq.nlargest if desc else heapq.nsmallest
+        with span("query.sort"):
+            rows = pick(limit, timed_iter("query.filter", _candidates()), key=key)
+        return _finish(iter(rows))
+    output_step = plan.add(f"sort by {sort_by}{' desc' if desc else ''}")
+    with span("query.sort"):
+        rows = sorted(timed_iter("query.filter", _candidates()), key=key, reverse=desc)
+    return _finish(iter(rows))
@@ -0,0 +1,175 @@
+from __future__ import annotations
+
+import json
+import math
+from bisect import bisect_right
+from datetime import date as date_cls
+from pathlib import Path
+from typing import Iterable, Iterator
+
+from .models import Expense
+from .storage import data_file, file_signature
+from .utils import day_bounds, day_number
+
+DEFAULT_BASE = "BDT"
+_RATES_FILE = "rates.json"
+
+# Last table read, with the path and file signature it was read from.
+_loaded: tuple[Path, list[int] | None, "RateTable"] | None = None
+
+
+# Date-effective exchange rates as a dense lookup table.
+#
+# `points` maps a currency to {day ordinal: units of the base currency per
+# unit}, each rate holding from its day until the next one. Every currency
+# gets one row over the days between the first and last rate change: slot 0
+# stands for "before the first change" and the last slot for "from the last
+# change on", so any day maps to a slot with one comparison. Rows of factors
+# between currency pairs are built once per table and reused.
+class RateTable:
+    def __init__(
+        self, base: str, points: dict[str, dict[int, float]], path: Path | None = None
+    ) -> None:
+        self.base = base
+        self.path = path
+        self.changes = {currency: sorted(days) for currency, days in points.items()}
+        self._points = points
+        all_days = [day for days in self.changes.values() for day in days]
+        self.first_day = min(all_days, default=0)
+        self.slots = max(all_days, default=0) - self.first_day + 2
+        self._rows: dict[str, list[float]] = {}
+        self._factors: dict[tuple[str, str], list[float]] = {}
+
+    # Slot of the rate rows that holds a day.
+    def slot(self, day: int) -> int:
+        return min(max(day - self.first_day + 1, 0), self.slots - 1)
+
+    # Base-currency rate of one unit of `currency` per slot (NaN where unknown).
+    def _row(self, currency: str) -> list[float]:
+        row = self._rows.get(currency)
+        if row is not None:
+            return row
+        if currency == self.base:
+            row = [1.0] * self.slots
+        else:
+            row = [math.nan] * self.slots
+            points = self._points.get(currency, {})
+            days = self.changes.get(currency, [])
+            for position, day in enumerate(days):
+                end = (
+                    self.slot(days[position + 1])
+                    if position + 1 < len(days)
+                    else self.slots
+                )
+                start = self.slot(day)
+                row[start:end] = [points[day]] * (end - start)
+        self._rows[currency] = row
+        return row
+
+    # Factors converting `source` amounts into `target`, per slot; currency
+    # codes match case-insensitively.
+    def factors(self, source: str, target: str) -> list[float]:
+        source, target = source.upper(), target.upper()
+        key = (source, target)
+        row = self._factors.get(key)
+        if row is None:
+            if source == target:
+                row = [1.0] * self.slots
+            else:
+                row = [
+                    rate / other
+                    for rate, other in zip(self._row(source), self._row(target))
+                ]
+            self._factors[key] = row
+        return row
+
+    # Factor converting `source` into `target` on a day ordinal.
+    def factor(self, source: str, target: str, day: int) -> float:
+        value = self.factors(source, target)[self.slot(day)]
+        if value != value:
+            self.missing(source, target, day)
+        return value
+
+    # Factor for a whole month, or None when a rate changes within it.
+    def month_factor(self, source: str, target: str, month: str) -> float | None:
+        source, target = source.upper(), target.upper()
+        if source == target:
+            return 1.0
+        bounds = day_bounds(month, None, None)
+        if bounds is None:
+            return None
+        low, high = bounds
+        for currency in (source, target):
+            days = self.changes.get(currency, [])
+            if bisect_right(days, low) != bisect_right(days, high):
+                return None
+        return self.factor(source, target, low)
+
+    # Raise the error for a conversion the table has no rate for.
+    def missing(self, source: str, target: str, day: int) -> None:
+        where = self.path or data_file(_RATES_FILE)
+        raise ValueError(
+            f"no {source} to {target} rate on {date_cls.fromordinal(day).isoformat()} "
+            f"(rates file: {where})"
+        )
+
+    # Expenses with amounts in `target`, one factor lookup per currency and day.
+    def convert(self, expenses: Iterable[Expense], target: str) -> Iterator[Expense]:
+        cached: dict[tuple[str, str], float] = {}
+        for expense in expenses:
+            if expense.currency == target:
+                yield expense
+                continue
+            key = (expense.currency, expense.date)
+            factor = cached.get(key)
+            if factor is None:
+                day = day_number(expense.date)
+                if day is None:
+                    raise ValueError(f"cannot convert {expense.id}: bad date {expense.date}")
+                factor = cached[key] = self.factor(expense.currency, target, day)
+            yield expense._replace(amount=expense.amount * factor, currency=target)
+
+
+# Path of the rates file in the data directory.
+def rates_path() -> Path:
+    return data_file(_RATES_FILE)
+
+
+# Parse a rates file:
+# {"base": "BDT", "rates": {"USD": {"2024-01-01": 110.0, ...}, ...}}
+def _read_rates(path: Path) -> RateTable:
+    try:
+        with path.open("r", encoding="utf-8") as handle:
+            payload = json.load(handle)
+    except (OSError, json.JSONDecodeError) as exc:
+        raise RuntimeError(f"Failed to read rates file {path}: {exc}") from exc
+    if not isinstance(payload, dict) or not isinstance(payload.get("rates"), dict):
+        raise RuntimeError(f"Invalid rates file {path}: expected a 'rates' object")
+    base = str(payload.get("base") or DEFAULT_BASE).strip().upper()
+    points: dict[str, dict[int, float]] = {}
+    for currency, changes in payload["rates"].items():
+        if not isinstance(changes, dict):
+            raise RuntimeError(f"Invalid rates file {path}: {currency} needs date: rate")
+        for date_str, rate in changes.items():
+            day = day_number(date_str)
+            if day is None or isinstance(rate, bool) or not isinstance(rate, (int, float)):
+                raise RuntimeError(
+                    f"Invalid rates file {path}: bad {currency} rate {date_str!r}: {rate!r}"
+                )
+            if rate <= 0:
+                raise RuntimeError(f"Invalid rates file {path}: {currency} rate must be > 0")
+            points.setdefault(str(currency).strip().upper(), {})[day] = float(rate)
+    return RateTable(base, points, path)
+
+
+# Current rate table, re-read only when the rates file changes; without a
+# file only same-currency conversions succeed.
+def load_rates() -> RateTable:
+    global _loaded
+    path = rates_path()
+    signature = file_signature(path)
+    if _loaded is not None and _loaded[0] == path and _loaded[1] == signature:
+        return _loaded[2]
+    table = _read_rates(path) if signature is not None else RateTable(DEFAULT_BASE, {})
+    _loaded = (path, signature, table)
+    return table
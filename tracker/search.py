@@ -0,0 +1,416 @@
+from __future__ import annotations
+
+import json
+import math
+import mmap
+import os
+import re
+import struct
+import sys
+from array import array
+from pathlib import Path
+from typing import Iterable, Iterator
+from uuid import uuid4
+
+from .logger import get_logger
+from .storage import Change, file_signature, last_line, read_log, sidecar_path
+
+_BASE_SUFFIX = ".search.bin"
+_LOG_SUFFIX = ".search.jsonl"
+_MAGIC = b"TSIX"
+_VERSION = 1
+# magic, version, documents, tokens, metadata bytes
+_HEADER = struct.Struct("<4sIIII")
+# Changed documents kept in the log before the next search rebuilds the base.
+_DELTA_LIMIT = 5000
+# Weight of a prefix expansion relative to an exact token match.
+_PREFIX_WEIGHT = 0.5
+_TOKEN = re.compile(r"[^\W_]+")
+
+# Last index read, with the file signatures it was read from.
+_loaded: tuple[tuple, "SearchIndex"] | None = None
+
+# One AND group of a query: (term, is_prefix) pairs.
+Group = list[tuple[str, bool]]
+
+
+# Lower-cased word tokens of a text.
+def tokenize(text: str) -> list[str]:
+    return _TOKEN.findall(text.lower())
+
+
+# Distinct tokens of an expense's note and category.
+def record_tokens(record: dict) -> list[str]:
+    return sorted(set(tokenize(f"{record.get('note', '')} {record.get('category', '')}")))
+
+
+# Parse a query into OR-separated groups of ANDed terms.
+#
+# Terms are whitespace separated and all must match; "OR" starts another
+# alternative, "AND" is accepted and ignored. A trailing "*" matches any
+# token starting with the term. Punctuation splits a term into words that
+# must all match (the prefix applies to the last one).
+def parse_query(query: str) -> list[Group]:
+    groups: list[Group] = [[]]
+    for word in query.split():
+        if word == "OR":
+            groups.append([])
+            continue
+        if word == "AND":
+            continue
+        prefix = word.endswith("*")
+        parts = tokenize(word.rstrip("*"))
+        for position, part in enumerate(parts):
+            groups[-1].append((part, prefix and position == len(parts) - 1))
+    groups = [group for group in groups if group]
+    if not groups:
+        raise ValueError("search query has no words")
+    return groups
+
+
+# u32 array over a byte range, without copying on little-endian hosts.
+def _u32(buffer, start: int, count: int):
+    view = memoryview(buffer)[start : start + 4 * count]
+    if sys.byteorder == "little":
+        return view.cast("I")
+    values = array("I", view)
+    values.byteswap()
+    return values
+
+
+# Inverted index over note and category tokens.
+#
+# The base is a file of sorted expense ids, sorted tokens and each token's
+# posting list of id numbers, read through mmap so a query touches only the
+# postings of its terms. Writes append the tokens of changed expenses to a
+# JSON-lines log; `delta` holds them (None for a deleted id) and overrides
+# the base until the next rebuild.
+class SearchIndex:
+    def __init__(
+        self,
+        buffer,
+        stamp: list,
+        generation: str,
+        delta: dict[str, list[str] | None] | None = None,
+    ) -> None:
+        self.stamp = stamp
+        self.generation = generation
+        self.delta = delta if delta is not None else {}
+        _, _, self.docs, self.tokens, meta = _HEADER.unpack_from(buffer, 0)
+        start = _HEADER.size + meta + (-meta % 4)
+        self._doc_offsets = _u32(buffer, start, self.docs + 1)
+        start += 4 * (self.docs + 1)
+        self._token_offsets = _u32(buffer, start, self.tokens + 1)
+        start += 4 * (self.tokens + 1)
+        self._posting_offsets = _u32(buffer, start, self.tokens + 1)
+        start += 4 * (self.tokens + 1)
+        self._postings = _u32(buffer, start, self._posting_offsets[-1])
+        start += 4 * self._posting_offsets[-1]
+        self._doc_blob = memoryview(buffer)[start : start + self._doc_offsets[-1]]
+        start += self._doc_offsets[-1]
+        self._token_blob = memoryview(buffer)[start : start + self._token_offsets[-1]]
+        self._excluded: set[int] | None = None
+
+    # Index file bytes for the given records.
+    @staticmethod
+    def encode(records: Iterable[dict], stamp: list, generation: str) -> bytes:
+        docs = {str(record["id"]): record_tokens(record) for record in records}
+        ids = sorted(docs)
+        postings: dict[str, list[int]] = {}
+        for number, expense_id in enumerate(ids):
+            for token in docs[expense_id]:
+                postings.setdefault(token, []).append(number)
+        tokens = sorted(postings)
+
+        def _offsets(parts: list[bytes]) -> tuple[bytes, bytes]:
+            offsets = array("I", [0])
+            for part in parts:
+                offsets.append(offsets[-1] + len(part))
+            if sys.byteorder != "little":
+                offsets.byteswap()
+            return offsets.tobytes(), b"".join(parts)
+
+        meta = json.dumps({"stamp": stamp, "generation": generation}).encode("ascii")
+        doc_offsets, doc_blob = _offsets([expense_id.encode("utf-8") for expense_id in ids])
+        token_offsets, token_blob = _offsets([token.encode("utf-8") for token in tokens])
+        counts = array("I", [0])
+        numbers = array("I")
+        for token in tokens:
+            numbers.extend(postings[token])
+            counts.append(len(numbers))
+        if sys.byteorder != "little":
+            counts.byteswap()
+            numbers.byteswap()
+        return b"".join(
+            [
+                _HEADER.pack(_MAGIC, _VERSION, len(ids), len(tokens), len(meta)),
+                meta,
+                b"\0" * (-len(meta) % 4),
+                doc_offsets,
+                token_offsets,
+                counts.tobytes(),
+                numbers.tobytes(),
+                doc_blob,
+                token_blob,
+            ]
+        )
+
+    # Expense id number `number` of the base.
+    def doc_id(self, number: int) -> str:
+        offsets = self._doc_offsets
+        return bytes(self._doc_blob[offsets[number] : offsets[number + 1]]).decode("utf-8")
+
+    # Token number `number` of the base.
+    def token(self, number: int) -> str:
+        offsets = self._token_offsets
+        return bytes(self._token_blob[offsets[number] : offsets[number + 1]]).decode("utf-8")
+
+    # First position in a sorted table at which `value` could be inserted.
+    @staticmethod
+    def _lower_bound(size: int, value: str, at) -> int:
+        low, high = 0, size
+        while low < high:
+            middle = (low + high) // 2
+            if at(middle) < value:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    # Base number of an expense id, or None when the base does not hold it.
+    def doc_number(self, expense_id: str) -> int | None:
+        position = self._lower_bound(self.docs, expense_id, self.doc_id)
+        if position < self.docs and self.doc_id(position) == expense_id:
+            return position
+        return None
+
+    # Base numbers of the ids the log changed; their base postings are stale.
+    def _stale(self) -> set[int]:
+        if self._excluded is None:
+            numbers = (self.doc_number(expense_id) for expense_id in self.delta)
+            self._excluded = {number for number in numbers if number is not None}
+        return self._excluded
+
+    # Token numbers a term matches: the token itself, or every token with
+    # the term as prefix.
+    def _token_range(self, term: str, prefix: bool) -> range:
+        start = self._lower_bound(self.tokens, term, self.token)
+        if not prefix:
+            found = start < self.tokens and self.token(start) == term
+            return range(start, start + 1 if found else start)
+        end = start
+        while end < self.tokens and self.token(end).startswith(term):
+            end += 1
+        return range(start, end)
+
+    # Weight of a token found in `count` documents (rarer words weigh more).
+    def _weight(self, count: int) -> float:
+        return math.log(1 + (self.docs + len(self.delta)) / max(count, 1))
+
+    # Best weight per base number and per logged id of the documents that
+    # match one term.
+    def _term_matches(self, term: str, prefix: bool) -> tuple[dict[int, float], dict[str, float]]:
+        offsets = self._posting_offsets
+        weights: dict[str, float] = {}
+        weighted = []
+        for number in self._token_range(term, prefix):
+            token = self.token(number)
+            start, end = offsets[number], offsets[number + 1]
+            weights[token] = self._weight(end - start)
+            if token != term:
+                weights[token] *= _PREFIX_WEIGHT
+            weighted.append((weights[token], start, end))
+        # Lightest first, so a document in several postings keeps its best.
+        base: dict[int, float] = {}
+        for weight, start, end in sorted(weighted):
+            base.update(dict.fromkeys(self._postings[start:end], weight))
+        for number in self._stale():
+            base.pop(number, None)
+        # Logged documents weigh their tokens like the base does; a token
+        # only the log has counts as rare.
+        logged: dict[str, float] = {}
+        for expense_id, tokens in self.delta.items():
+            for token in tokens or ():
+                if token == term or (prefix and token.startswith(term)):
+                    weight = weights.get(token)
+                    if weight is None:
+                        weight = self._weight(1)
+                        if token != term:
+                            weight *= _PREFIX_WEIGHT
+                    logged[expense_id] = max(weight, logged.get(expense_id, 0.0))
+        return base, logged
+
+    # Ids of the matching expenses, best match first; ties go to the newer
+    # (higher) id.
+    def search(self, query: str) -> Iterator[str]:
+        base: dict[int, float] = {}
+        logged: dict[str, float] = {}
+        for group in parse_query(query):
+            group_base, group_logged = self._term_matches(*group[0])
+            for term, prefix in group[1:]:
+                term_base, term_logged = self._term_matches(term, prefix)
+                group_base = {
+                    doc: group_base[doc] + term_base[doc]
+                    for doc in group_base.keys() & term_base.keys()
+                }
+                group_logged = {
+                    key: group_logged[key] + term_logged[key]
+                    for key in group_logged.keys() & term_logged.keys()
+                }
+            base = _best_of(base, group_base)
+            logged = _best_of(logged, group_logged)
+
+        # (score, position in id order[, id]): logged ids the base does not
+        # hold sit between their neighbours at half positions.
+        ranked = list(zip(base.values(), base.keys()))
+        for expense_id, score in logged.items():
+            number = self.doc_number(expense_id)
+            if number is None:
+                number = self._lower_bound(self.docs, expense_id, self.doc_id) - 0.5
+            ranked.append((score, number, expense_id))
+        ranked.sort(reverse=True)
+        return (item[2] if len(item) == 3 else self.doc_id(item[1]) for item in ranked)
+
+
+# Higher score per key of two score maps.
+def _best_of(left: dict, right: dict) -> dict:
+    merged = {**right, **left}
+    for key in left.keys() & right.keys():
+        merged[key] = max(left[key], right[key])
+    return merged
+
+
+# Paths of the base file and the change log.
+def _paths() -> tuple[Path, Path]:
+    return sidecar_path(_BASE_SUFFIX), sidecar_path(_LOG_SUFFIX)
+
+
+# Map the base file; None when it is missing or not an index.
+def _map_base(path: Path):
+    try:
+        with path.open("rb") as handle:
+            buffer = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+    except (FileNotFoundError, ValueError):
+        return None
+    except OSError as exc:
+        get_logger().error("Ignoring unreadable search index %s: %s", path, exc)
+        return None
+    if len(buffer) < _HEADER.size:
+        return None
+    magic, version, _, _, meta = _HEADER.unpack_from(buffer, 0)
+    if magic != _MAGIC or version != _VERSION:
+        return None
+    return buffer
+
+
+# Stamp and generation stored in a mapped base.
+def _base_meta(buffer) -> dict:
+    meta = _HEADER.unpack_from(buffer, 0)[4]
+    return json.loads(bytes(buffer[_HEADER.size : _HEADER.size + meta]))
+
+
+# Ledger stamp the stored index describes, with its generation; None when
+# there is no usable index.
+def _stored_state(base_path: Path, log_path: Path) -> tuple[list, str] | None:
+    buffer = _map_base(base_path)
+    if buffer is None:
+        return None
+    with buffer:
+        meta = _base_meta(buffer)
+    stamp, generation = meta["stamp"], meta["generation"]
+    last = last_line(log_path)
+    if last is not None:
+        try:
+            entry = json.loads(last)
+        except json.JSONDecodeError:
+            entry = None
+        if isinstance(entry, dict) and entry.get("generation") == generation:
+            stamp = entry["stamp"]
+    return stamp, generation
+
+
+# Read the stored index, reusing the last one while its files are unchanged.
+def _read(base_path: Path, log_path: Path) -> SearchIndex | None:
+    global _loaded
+    key = (base_path, file_signature(base_path), file_signature(log_path))
+    if _loaded is not None and _loaded[0] == key:
+        return _loaded[1]
+    buffer = _map_base(base_path)
+    if buffer is None:
+        return None
+    meta = _base_meta(buffer)
+    stamp = meta["stamp"]
+    delta: dict[str, list[str] | None] = {}
+    for entry in read_log(log_path, meta["generation"]):
+        delta.update(entry["docs"])
+        stamp = entry["stamp"]
+    index = SearchIndex(buffer, stamp, meta["generation"], delta)
+    _loaded = (key, index)
+    return index
+
+
+# Write a new base for the records and drop the log of the previous one.
+def _write(base_path: Path, log_path: Path, records: Iterable[dict], stamp: list) -> None:
+    generation = uuid4().hex
+    payload = SearchIndex.encode(records, stamp, generation)
+    tmp_path = base_path.with_name(f"{base_path.name}.tmp")
+    try:
+        tmp_path.write_bytes(payload)
+        os.replace(tmp_path, base_path)
+        log_path.unlink(missing_ok=True)
+    except OSError as exc:
+        get_logger().error("Failed to write search index %s: %s", base_path, exc)
+
+
+# Search index for the current ledger, rebuilt by a scan when missing,
+# stale, or carrying more than _DELTA_LIMIT logged changes.
+def load_search_index(store) -> SearchIndex:
+    base_path, log_path = _paths()
+    stamp = store.stamp()
+    index = _read(base_path, log_path)
+    if index is not None and index.stamp == stamp and len(index.delta) <= _DELTA_LIMIT:
+        return index
+    get_logger().info("Rebuilding search index %s", base_path)
+    _write(base_path, log_path, store.iter_records(), stamp)
+    index = _read(base_path, log_path)
+    if index is None:
+        raise RuntimeError(f"Unable to read search index {base_path}")
+    return index
+
+
+# Log the tokens of changed expenses; `stamp` is the ledger stamp taken
+# before the write.
+#
+# An index that was already stale, or a write larger than the log holds, is
+# left for the next search to rebuild.
+def update_search_index(store, stamp: list, changes: list[Change]) -> None:
+    base_path, log_path = _paths()
+    if len(changes) > _DELTA_LIMIT:
+        return
+    state = _stored_state(base_path, log_path)
+    if state is None or state[0] != stamp:
+        return
+    docs: dict[str, list[str] | None] = {}
+    for before, after in changes:
+        if before is not None:
+            docs[before["id"]] = None
+        if after is not None:
+            docs[after["id"]] = record_tokens(after)
+    new_stamp = store.stamp()
+    if not docs and new_stamp == stamp:
+        return
+    entry = {"generation": state[1], "stamp": new_stamp, "docs": docs}
+    try:
+        with log_path.open("a", encoding="utf-8") as handle:
+            handle.write(json.dumps(entry, ensure_ascii=True, separators=(",", ":")) + "\n")
+    except OSError as exc:
+        get_logger().error("Failed to update search index %s: %s", log_path, exc)
+
+
+# Remove the index files, so the next search rebuilds them.
+def discard_search_index() -> None:
+    for path in _paths():
+        try:
+            path.unlink(missing_ok=True)
+        except OSError as exc:
+            get_logger().error("Failed to remove search index %s: %s", path, exc)
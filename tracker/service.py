@@ -1,16 +1,139 @@
 from __future__ import annotations
 
 import csv
+import json
+import math
+import time
+from dataclasses import asdict
+from datetime import date as date_cls
+from itertools import islice, repeat
 from pathlib import Path
-from typing import Iterable
+from typing import Callable, Iterable, Iterator
 
-from .logger import get_logger
-from .models import Expense
-from .storage import load_data, save_data
-from .utils import generate_id, now_iso
+from .aggregates import (
+    Aggregates,
+    discard_aggregates,
+    load_aggregates,
+    update_aggregates,
+    verify_aggregates,
+)
+from .analytics import LedgerColumns
+from .budgets import (
+    budget_statuses,
+    load_budgets,
+    load_counters,
+    save_budgets,
+    take_alerts,
+    write_alerts,
+)
+from .commit import group_commit, ledger_lock
+from .logger import get_logger, operation_fields
+from .models import (
+    Budget,
+    BudgetAlert,
+    BudgetStatus,
+    Expense,
+    ImportReport,
+    Summary,
+    Trend,
+    TrendPoint,
+)
+from .query import FilterSpec, LedgerAccess, QueryPlan, plan_and_run, scan_and_run
+from .rates import load_rates
+from .search import discard_search_index, load_search_index, update_search_index
+# add_span_listener/remove_span_listener are re-exported for library users.
+from .spans import add_span_listener, remove_span_listener, span, timed_iter
+from .storage import cache_enabled, get_storage, op_results, set_engine
+from .utils import checked_date, day_bounds, now_iso, parse_month, periods, today_str
 
 
-# Add a new expense and persist it.
+# Apply write operations and keep derived data in step with them. Results
+# of writes that took a budget to a threshold carry the alerts under
+# "alerts".
+#
+# Raises only when storage rejected the operations and nothing was written
+# (group commit then retries them request by request). Once they are
+# stored, a failing aggregates or search index update discards that file
+# for the next read to rebuild instead of failing the write.
+def _apply_write(ops: list[dict]) -> list[dict | None]:
+    store = get_storage()
+    stamp = store.stamp()
+    changes = store.apply_changes(ops)
+    try:
+        update_aggregates(store, stamp, changes)
+    except Exception as exc:
+        get_logger().error("Aggregates update failed; discarding them: %s", exc)
+        discard_aggregates()
+    try:
+        update_search_index(store, stamp, changes)
+    except Exception as exc:
+        get_logger().error("Search index update failed; discarding it: %s", exc)
+        discard_search_index()
+    results = op_results(ops, changes)
+    for position, found in enumerate(write_alerts(store, stamp, changes)):
+        if found and results[position] is not None:
+            results[position] = {
+                **results[position],
+                "alerts": [asdict(alert) for alert in found],
+            }
+    return results
+
+
+# Apply write operations under the ledger lock, combined with the writes of
+# other processes queued behind it.
+def write_ops(ops: list[dict]) -> list[dict | None]:
+    with span("write.commit"):
+        return group_commit(ops, _apply_write)
+
+
+# Build the operation that adds a new expense.
+def add_op(
+    *,
+    date: str,
+    category: str,
+    amount: float,
+    note: str,
+    currency: str,
+) -> dict:
+    record = {
+        "date": date,
+        "category": category,
+        "amount": amount,
+        "currency": currency,
+        "note": note,
+        "created_at": now_iso(),
+    }
+    return {"op": "add", "expense": record}
+
+
+# Build the operation that changes the given fields of an expense.
+def edit_op(
+    *,
+    expense_id: str,
+    date: str | None = None,
+    category: str | None = None,
+    amount: float | None = None,
+    note: str | None = None,
+    currency: str | None = None,
+) -> dict:
+    fields = {
+        "date": date,
+        "category": category,
+        "amount": amount,
+        "note": note,
+        "currency": currency,
+    }
+    changes = {key: value for key, value in fields.items() if value is not None}
+    return {"op": "edit", "id": expense_id, "changes": changes}
+
+
+# Build the operation that deletes an expense.
+def delete_op(expense_id: str) -> dict:
+    return {"op": "delete", "id": expense_id}
+
+
+# Add a new expense and persist it; budget thresholds it reaches are
+# added to `alerts`, when given.
 def add_expense(
     *,
     date: str,
@@ -18,24 +141,166 @@ def add_expense(
     amount: float,
     note: str,
     currency: str,
+    alerts: list[BudgetAlert] | None = None,
 ) -> Expense:
-    data = load_data()
-    expense_id = generate_id(data["expenses"], date)
-    expense = Expense(
-        id=expense_id,
-        date=date,
-        category=category,
-        amount=amount,
-        currency=currency,
-        note=note,
-        created_at=now_iso(),
+    started = time.perf_counter()
+    (stored,) = write_ops(
+        [
+            add_op(
+                date=date,
+                category=category,
+                amount=amount,
+                note=note,
+                currency=currency,
+            )
+        ]
+    )
+    expense = Expense.from_dict(stored)
+    take_alerts(stored, alerts)
+    get_logger().info(
+        "Added expense %s", expense.id, extra=operation_fields("add", started)
     )
-    data["expenses"].append(expense.to_dict())
-    save_data(data)
-    get_logger().info("Added expense %s", expense_id)
     return expense
 
 
+# Expenses to scan for a filter, in storage order: with a category, only
+# that category's rows when the engine reads them through its index (json
+# and journal without the ledger cache), otherwise the whole ledger.
+def _scan_source(store, category: str | None) -> tuple[Iterator[Expense], str | None]:
+    rows = store.iter_category(category) if category is not None else None
+    if rows is None:
+        return store.iter_expenses(), None
+    return (
+        timed_iter("load.decode", Expense.from_dicts(rows)),
+        f"category {category!r} rows from the index (streamed from storage)",
+    )
+
+
+# Stream expenses matching the filters, in storage order.
+def iter_expenses(
+    *,
+    month: str | None = None,
+    category: str | None = None,
+    min_amount: float | None = None,
+    max_amount: float | None = None,
+    from_date: str | None = None,
+    to_date: str | None = None,
+) -> Iterator[Expense]:
+    spec = FilterSpec(month, category, min_amount, max_amount, from_date, to_date)
+    store = get_storage()
+    if store.supports_queries:
+        rows = timed_iter("storage.query", store.query(**spec.as_kwargs(), sort_by=None))
+        yield from timed_iter("load.decode", Expense.from_dicts(rows))
+        return
+    source, _ = _scan_source(store, category)
+    yield from filter(spec.matches, source)
+
+
+# Stream filtered expenses in the requested order.
+#
+# Engines with their own query support get the whole query pushed down.
+# With the ledger cache on, the planner picks an access path over cached
+# orderings and category lists; otherwise the ledger is streamed and
+# limited sorts keep a bounded heap. `plan` is filled with the chosen
+# steps and their row counts as the result is consumed.
+#
+# With `currency`, amounts are converted into it; amount filters and
+# amount ordering then apply to the converted amounts. `offset` skips the
+# first rows of the result (for pages), with `limit` counted after it.
+def query_expenses(
+    *,
+    month: str | None = None,
+    category: str | None = None,
+    min_amount: float | None = None,
+    max_amount: float | None = None,
+    sort_by: str | None = "date",
+    desc: bool = False,
+    limit: int | None = None,
+    plan: QueryPlan | None = None,
+    currency: str | None = None,
+    offset: int = 0,
+) -> Iterator[Expense]:
+    if offset:
+        # Top-k of offset + limit rows, then skip the first `offset`.
+        rows = query_expenses(
+            month=month,
+            category=category,
+            min_amount=min_amount,
+            max_amount=max_amount,
+            sort_by=sort_by,
+            desc=desc,
+            limit=None if limit is None else offset + limit,
+            plan=plan,
+            currency=currency,
+        )
+        if plan is None:
+            return islice(rows, offset, None)
+        return _skip_counted(rows, offset, plan, plan.add(f"skip the first {offset} row(s)"))
+
+    if currency is not None:
+        rates = load_rates()
+        if sort_by != "amount" and min_amount is None and max_amount is None:
+            rows = query_expenses(
+                month=month,
+                category=category,
+                sort_by=sort_by,
+                desc=desc,
+                limit=limit,
+                plan=plan,
+            )
+            if plan is not None:
+                plan.add(f"convert amounts to {currency}")
+            return rates.convert(rows, currency)
+        rows = query_expenses(month=month, category=category, sort_by=None, plan=plan)
+        spec = FilterSpec(min_amount=min_amount, max_amount=max_amount)
+        return scan_and_run(
+            rates.convert(rows, currency),
+            spec,
+            sort_by,
+            desc,
+            limit,
+            plan,
+            origin=f"convert amounts to {currency}",
+        )
+
+    spec = FilterSpec(month, category, min_amount, max_amount)
+    store = get_storage()
+    if store.supports_queries:
+        rows = timed_iter(
+            "storage.query",
+            store.query(**spec.as_kwargs(), sort_by=sort_by, desc=desc, limit=limit),
+        )
+        if plan is None:
+            return timed_iter("load.decode", Expense.from_dicts(rows))
+        step = plan.add(
+            f"{store.name} engine query (filters, sort and limit pushed down)"
+        )
+        results = list(timed_iter("load.decode", Expense.from_dicts(rows)))
+        plan.count(step, len(results))
+        return iter(results)
+
+    if cache_enabled():
+        access = store.derived("access", lambda records: LedgerAccess(store.expenses()))
+        return plan_and_run(access, spec, sort_by, desc, limit, plan)
+    source, origin = _scan_source(store, category)
+    if origin is None:
+        return scan_and_run(source, spec, sort_by, desc, limit, plan)
+    return scan_and_run(source, spec, sort_by, desc, limit, plan, origin=origin)
+
+
+# Rows after the first `offset`, counted into a plan step as they are read.
+def _skip_counted(
+    rows: Iterator[Expense], offset: int, plan: QueryPlan, step: int
+) -> Iterator[Expense]:
+    produced = 0
+    try:
+        for expense in islice(rows, offset, None):
+            produced += 1
+            yield expense
+    finally:
+        plan.count(step, produced)
+
+
 # List expenses with optional filters, sorting, and limit.
 def list_expenses(
     *,
@@ -43,35 +308,86 @@ def list_expenses(
     category: str | None = None,
     min_amount: float | None = None,
     max_amount: float | None = None,
-    sort_by: str = "date",
+    sort_by: str | None = "date",
     desc: bool = False,
     limit: int | None = None,
+    plan: QueryPlan | None = None,
+    currency: str | None = None,
+    offset: int = 0,
 ) -> list[Expense]:
-    data = load_data()
-    expenses = [Expense.from_dict(item) for item in data["expenses"]]
-
-    filtered = [
-        exp
-        for exp in expenses
-        if (month is None or exp.date.startswith(month))
-        and (category is None or exp.category == category)
-        and (min_amount is None or exp.amount >= min_amount)
-        and (max_amount is None or exp.amount <= max_amount)
-    ]
-
-    sort_keys = {
-        "date": lambda exp: exp.date,
-        "amount": lambda exp: exp.amount,
-        "category": lambda exp: exp.category,
-        "created": lambda exp: exp.created_at,
-        "id": lambda exp: exp.id,
-    }
-    filtered.sort(key=sort_keys[sort_by], reverse=desc)
+    return list(
+        query_expenses(
+            month=month,
+            category=category,
+            min_amount=min_amount,
+            max_amount=max_amount,
+            sort_by=sort_by,
+            desc=desc,
+            limit=limit,
+            plan=plan,
+            currency=currency,
+            offset=offset,
+        )
+    )
 
-    if limit is not None:
-        filtered = filtered[:limit]
 
-    return filtered
+# Matches fetched by id per round when searching; each round fetches four
+# times as many as the last until the limit is filled.
+_SEARCH_BATCH = 50
+
+
+# Expenses whose note or category match a search query, best match first
+# (see tracker.search for the query syntax).
+#
+# Ranked ids come from the search index; their records are fetched by id
+# in growing rounds and filtered until `limit` rows pass.
+def search_expenses(
+    query: str,
+    *,
+    month: str | None = None,
+    category: str | None = None,
+    min_amount: float | None = None,
+    max_amount: float | None = None,
+    limit: int | None = None,
+) -> list[Expense]:
+    started = time.perf_counter()
+    spec = FilterSpec(month, category, min_amount, max_amount)
+    store = get_storage()
+    batch = max(limit or 0, _SEARCH_BATCH)
+    with span("search.match"):
+        ids = load_search_index(store).search(query)
+    results: list[Expense] = []
+    while limit is None or len(results) < limit:
+        wanted = list(islice(ids, batch))
+        if not wanted:
+            break
+        with span("search.fetch"):
+            records = list(store.records_by_id(wanted))
+        results.extend(filter(spec.matches, Expense.from_dicts(records)))
+        batch *= 4
+    results = results[:limit]
+    get_logger().info(
+        "Searched %r: %d match(es)",
+        query,
+        len(results),
+        extra=operation_fields("search", started),
+    )
+    return results
+
+
+# Add expenses into category and month totals.
+def _accumulate(
+    expenses: Iterable[Expense],
+    category_totals: dict[str, float],
+    month_totals: dict[str, float],
+) -> Iterator[Expense]:
+    for expense in expenses:
+        category_totals[expense.category] = (
+            category_totals.get(expense.category, 0.0) + expense.amount
+        )
+        month_key = expense.date[:7]
+        month_totals[month_key] = month_totals.get(month_key, 0.0) + expense.amount
+        yield expense
 
 
 # Build summary totals from filtered expenses.
@@ -82,36 +398,356 @@ def summary(
     from_date: str | None = None,
     to_date: str | None = None,
 ) -> tuple[list[Expense], dict[str, float], dict[str, float]]:
-    data = load_data()
-    expenses = [Expense.from_dict(item) for item in data["expenses"]]
-
-    filtered = [
-        exp
-        for exp in expenses
-        if (month is None or exp.date.startswith(month))
-        and (category is None or exp.category == category)
-        and (from_date is None or exp.date >= from_date)
-        and (to_date is None or exp.date <= to_date)
-    ]
+    category_totals: dict[str, float] = {}
+    month_totals: dict[str, float] = {}
+    matches = iter_expenses(
+        month=month, category=category, from_date=from_date, to_date=to_date
+    )
+    filtered = list(_accumulate(matches, category_totals, month_totals))
+    return filtered, category_totals, month_totals
+
 
+# Add expenses into per-currency totals of their own amounts.
+def _tally_currencies(
+    expenses: Iterable[Expense], currency_totals: dict[str, float]
+) -> Iterator[Expense]:
+    for expense in expenses:
+        currency_totals[expense.currency] = (
+            currency_totals.get(expense.currency, 0.0) + expense.amount
+        )
+        yield expense
+
+
+# Summary totals of filtered expenses, added up row by row.
+def _scan_summary(
+    expenses: Iterable[Expense], currency: str | None, rates
+) -> Summary:
     category_totals: dict[str, float] = {}
     month_totals: dict[str, float] = {}
+    currency_totals: dict[str, float] = {}
+    matches = _tally_currencies(expenses, currency_totals)
+    if rates is not None:
+        matches = rates.convert(matches, currency)
+    count = 0
+    total = 0.0
+    with span("summary.scan"):
+        for expense in _accumulate(matches, category_totals, month_totals):
+            count += 1
+            total += expense.amount
+    return Summary(
+        count, total, category_totals, month_totals, currency_totals, currency
+    )
 
-    for expense in filtered:
-        category_totals[expense.category] = (
-            category_totals.get(expense.category, 0.0) + expense.amount
+
+# Summary of records read once: from ledger columns when they describe the
+# records exactly, otherwise by the row scan over the same records. The
+# flag tells whether the totals came from the columns (whole minor units).
+def _records_summary(
+    records: list[dict], filters: dict, currency: str | None
+) -> tuple[Summary, bool]:
+    rates = load_rates() if currency is not None else None
+    with span("summary.columns"):
+        columns = LedgerColumns.from_records(records)
+        result = (
+            columns.summarize(**filters, currency=currency, rates=rates)
+            if columns is not None
+            else None
         )
-        month_key = expense.date[:7]
-        month_totals[month_key] = month_totals.get(month_key, 0.0) + expense.amount
+    if result is not None:
+        return result, True
+    spec = FilterSpec(**filters)
+    return _scan_summary(filter(spec.matches, Expense.from_dicts(records)), currency, rates), False
 
-    return filtered, category_totals, month_totals
 
+# Summary of one ledger chunk, run in a worker process, with the journal
+# ids the chunk held.
+def _chunk_summary(
+    chunk: object, filters: dict, currency: str | None
+) -> tuple[Summary, bool, set[str]]:
+    store = get_storage()
+    seen: set[str] = set()
+    records = list(store.read_chunk(chunk, seen))
+    result, exact = _records_summary(records, filters, currency)
+    return result, exact, seen
 
-# Export expenses to a CSV file.
-def export_csv(path: str, expenses: Iterable[Expense]) -> Path:
-    csv_path = Path(path)
+
+# Add up chunk summaries. Unconverted column totals are added in minor
+# units, so the result equals the single-process summary exactly; scanned
+# (`exact` False) totals are added as they are.
+def _merge_summaries(parts: list[Summary], currency: str | None, exact: bool) -> Summary:
+    scale = 100 if currency is None and exact else 1
+    currency_scale = 100 if exact else 1
+
+    def _units(value: float) -> float:
+        return round(value * 100) if scale == 100 else value
+
+    count = 0
+    total: float = 0
+    category_totals: dict[str, float] = {}
+    month_totals: dict[str, float] = {}
+    currency_totals: dict[str, int] = {}
+    for part in parts:
+        count += part.count
+        total += _units(part.total)
+        for key, value in part.categories.items():
+            category_totals[key] = category_totals.get(key, 0) + _units(value)
+        for key, value in part.months.items():
+            month_totals[key] = month_totals.get(key, 0) + _units(value)
+        for key, value in part.currencies.items():
+            currency_totals[key] = currency_totals.get(key, 0) + (
+                round(value * 100) if exact else value
+            )
+    return Summary(
+        count,
+        total / scale,
+        {key: value / scale for key, value in category_totals.items()},
+        {key: value / scale for key, value in month_totals.items()},
+        {key: value / currency_scale for key, value in currency_totals.items()},
+        currency,
+    )
+
+
+# Summary from ledger chunks summarized in up to `workers` processes; None
+# when the engine does not split the ledger.
+def _parallel_summary(
+    store, filters: dict, currency: str | None, workers: int
+) -> Summary | None:
+    # Twice as many chunks as workers evens out chunks of unequal cost.
+    chunks = store.chunks(workers * 2, **filters)
+    if not chunks:
+        return None
+    from concurrent.futures import ProcessPoolExecutor
+
+    processes = min(workers, len(chunks))
+    with span("summary.parallel"):
+        try:
+            with ProcessPoolExecutor(max_workers=processes) as pool:
+                results = list(
+                    pool.map(_chunk_summary, chunks, repeat(filters), repeat(currency))
+                )
+        except RuntimeError as exc:
+            get_logger().info("Summary falls back to one process: %s", exc)
+            return None
+    seen: set[str] = set().union(*(held for _, _, held in results))
+    parts = [(part, exact) for part, exact, _ in results]
+    tail = list(store.chunk_tail(chunks, seen))
+    if tail:
+        parts.append(_records_summary(tail, filters, currency))
+    get_logger().info("Summarized %d chunk(s) in %d process(es)", len(chunks), processes)
+    return _merge_summaries(
+        [part for part, _ in parts], currency, all(exact for _, exact in parts)
+    )
+
+
+# Build summary totals without returning the matching rows.
+#
+# Any month/category/date range is answered from the running totals of the
+# day aggregates. Ledgers they cannot describe exactly (sub-cent amounts,
+# non-canonical dates) are read once and summarized from ledger columns, or
+# scanned row by row when the columns cannot describe them either;
+# per-currency subtotals then come from the same pass as the category and
+# month totals. With `currency`, totals
+# are converted into it using the rates file: per stretch between rate
+# changes from the aggregates, otherwise per (currency, day) over the
+# ledger columns. With `workers` above 1, scans are run over chunks of the
+# ledger in a process pool, when the engine splits it.
+def summary_totals(
+    *,
+    month: str | None = None,
+    category: str | None = None,
+    from_date: str | None = None,
+    to_date: str | None = None,
+    currency: str | None = None,
+    workers: int | None = None,
+) -> Summary:
+    store = get_storage()
+    filters = {
+        "month": month,
+        "category": category,
+        "from_date": from_date,
+        "to_date": to_date,
+    }
+    rates = load_rates() if currency is not None else None
+    with span("summary.aggregates"):
+        result = load_aggregates(store).summarize(
+            **filters, currency=currency, rates=rates
+        )
+    if result is not None:
+        return result
+
+    if workers is not None and workers > 1:
+        result = _parallel_summary(store, filters, currency, workers)
+        if result is not None:
+            return result
+
+    if store.supports_queries and currency is None:
+        with span("storage.totals"):
+            count, total, category_totals, month_totals, currency_totals = (
+                store.totals(**filters)
+            )
+        return Summary(count, total, category_totals, month_totals, currency_totals)
+
+    if cache_enabled() and not store.supports_queries:
+        # Columns are kept with the cached ledger; the scan reads it too.
+        with span("summary.columns"):
+            columns = store.derived("columns", LedgerColumns.from_records)
+            if columns is not None:
+                result = columns.summarize(**filters, currency=currency, rates=rates)
+        if result is not None:
+            return result
+        return _scan_summary(iter_expenses(**filters), currency, rates)
+
+    if store.supports_queries:
+        spec = FilterSpec(**filters)
+        with span("storage.query"):
+            records = list(store.query(**spec.as_kwargs(), sort_by=None))
+    else:
+        records = list(store.iter_records())
+    return _records_summary(records, filters, currency)[0]
+
+
+# Trend point for the days low..high from the aggregates.
+def _trend_point(
+    aggregates: Aggregates,
+    label: str,
+    low: int,
+    high: int,
+    category: str | None,
+    currency: str | None,
+    rates,
+    window: int | None,
+) -> TrendPoint:
+    total, count = aggregates.span(low, high, category, currency, rates)
+    rolling = None
+    if window is not None:
+        window_total, _ = aggregates.span(high - window + 1, high, category, currency, rates)
+        rolling = window_total / 100 / window
+    return TrendPoint(
+        label,
+        date_cls.fromordinal(low).isoformat(),
+        date_cls.fromordinal(high).isoformat(),
+        count,
+        total / 100,
+        total / 100 / (high - low + 1),
+        rolling,
+    )
+
+
+# Totals per day, week or month over a date range, without reading the
+# ledger: each period, and each rolling `window` of days, is two lookups
+# per category and currency in the day aggregates. Averages divide by the
+# days in the period, with or without expenses. The range defaults to the
+# first and last day with expenses (of `category`).
+def trend_series(
+    *,
+    by: str = "month",
+    month: str | None = None,
+    from_date: str | None = None,
+    to_date: str | None = None,
+    category: str | None = None,
+    window: int | None = None,
+    currency: str | None = None,
+) -> Trend:
+    started = time.perf_counter()
+    bounds = day_bounds(month, from_date, to_date)
+    if bounds is None:
+        raise ValueError("dates must be YYYY-MM-DD and months YYYY-MM")
+    store = get_storage()
+    rates = load_rates() if currency is not None else None
+    with span("trend.aggregates"):
+        aggregates = load_aggregates(store)
+        if not aggregates.exact:
+            # Sub-cent amounts: add them up unrounded from a ledger scan.
+            get_logger().info("Aggregates are inexact; building trend from the ledger")
+            aggregates = Aggregates.build(store.iter_records(), rounded=False)
+    low, high = bounds
+    known = aggregates.bounds(category)
+    if known is None and (low is None or high is None):
+        return Trend([], None, window, [], currency)
+    low = known[0] if low is None else low
+    high = known[1] if high is None else high
+    if low > high:
+        return Trend([], None, window, [], currency)
+
+    with span("trend.series"):
+        points = [
+            _trend_point(aggregates, label, first, last, category, currency, rates, window)
+            for label, first, last in periods(low, high, by)
+        ]
+        overall = _trend_point(aggregates, "all", low, high, category, currency, rates, None)
+    get_logger().info(
+        "Built %s trend with %d point(s)",
+        by,
+        len(points),
+        extra=operation_fields("trend", started),
+    )
+    return Trend(points, overall, window, aggregates.currencies(low, high, category), currency)
+
+
+# Set the monthly limit of a category, replacing any previous one.
+def set_budget(
+    *,
+    category: str,
+    limit: float,
+    currency: str = "BDT",
+    thresholds: Iterable[int] = (80, 100),
+) -> Budget:
+    started = time.perf_counter()
+    levels = sorted(set(thresholds))
+    if limit <= 0:
+        raise ValueError("limit must be > 0")
+    if not levels or levels[0] <= 0:
+        raise ValueError("thresholds must be percentages > 0")
+    budget = Budget(category, float(limit), currency, levels)
+    with ledger_lock():
+        budgets = dict(load_budgets())
+        budgets[category] = budget
+        save_budgets(budgets)
+    get_logger().info(
+        "Set %s budget to %.2f %s",
+        category,
+        budget.limit,
+        currency,
+        extra=operation_fields("budget", started),
+    )
+    return budget
+
+
+# All budgets, by category.
+def list_budgets() -> list[Budget]:
+    return [budget for _, budget in sorted(load_budgets().items())]
+
+
+# Spend of every budget in a month (default: this month), read from the
+# budget counters that each write keeps current; they are rebuilt from the
+# day totals when missing or stale.
+def budget_status(month: str | None = None) -> list[BudgetStatus]:
+    started = time.perf_counter()
+    month = month or today_str()[:7]
+    parse_month(month)
+    budgets = load_budgets()
+    if not budgets:
+        return []
+    with span("budget.counters"):
+        counters = load_counters(get_storage(), budgets, load_rates())
+    statuses = budget_statuses(counters, budgets, month)
+    get_logger().info(
+        "Read %d budget(s) for %s",
+        len(statuses),
+        month,
+        extra=operation_fields("budget-status", started),
+    )
+    return statuses
+
+
+# Write expenses to a CSV file as they arrive; returns the row count.
+def _write_csv(csv_path: Path, expenses: Iterable[Expense]) -> int:
+    started = time.perf_counter()
     csv_path.parent.mkdir(parents=True, exist_ok=True)
-    with csv_path.open("w", encoding="utf-8", newline="") as handle:
+    count = 0
+    with span("export.write"), csv_path.open(
+        "w", encoding="utf-8", newline=""
+    ) as handle:
         writer = csv.writer(handle)
         writer.writerow(
             ["id", "date", "category", "amount", "currency", "note", "created_at"]
@@ -128,24 +764,66 @@ def export_csv(path: str, expenses: Iterable[Expense]) -> Path:
                     exp.created_at,
                 ]
             )
-    get_logger().info("Exported expenses to %s", csv_path)
+            count += 1
+    get_logger().info(
+        "Exported %d expense(s) to %s",
+        count,
+        csv_path,
+        extra=operation_fields("export", started),
+    )
+    return count
+
+
+# Export expenses to a CSV file.
+def export_csv(path: str, expenses: Iterable[Expense]) -> Path:
+    csv_path = Path(path)
+    _write_csv(csv_path, expenses)
     return csv_path
 
 
+# Stream filtered expenses straight into a CSV file.
+def export_expenses(
+    path: str,
+    *,
+    month: str | None = None,
+    category: str | None = None,
+    min_amount: float | None = None,
+    max_amount: float | None = None,
+    sort_by: str | None = "date",
+    desc: bool = False,
+    limit: int | None = None,
+    plan: QueryPlan | None = None,
+    currency: str | None = None,
+) -> tuple[Path, int]:
+    csv_path = Path(path)
+    expenses = query_expenses(
+        month=month,
+        category=category,
+        min_amount=min_amount,
+        max_amount=max_amount,
+        sort_by=sort_by,
+        desc=desc,
+        limit=limit,
+        plan=plan,
+        currency=currency,
+    )
+    return csv_path, _write_csv(csv_path, expenses)
+
+
 # Delete an expense by id.
 def delete_expense(expense_id: str) -> bool:
-    data = load_data()
-    expenses = data["expenses"]
-    original_len = len(expenses)
-    data["expenses"] = [item for item in expenses if item.get("id") != expense_id]
-    if len(data["expenses"]) == original_len:
+    started = time.perf_counter()
+    (removed,) = write_ops([delete_op(expense_id)])
+    if removed is None:
         return False
-    save_data(data)
-    get_logger().info("Deleted expense %s", expense_id)
+    get_logger().info(
+        "Deleted expense %s", expense_id, extra=operation_fields("delete", started)
+    )
     return True
 
 
-# Edit an expense by id and return the updated model.
+# Edit an expense by id and return the updated model; budget thresholds
+# the edit reaches are added to `alerts`, when given.
 def edit_expense(
     *,
     expense_id: str,
@@ -154,24 +832,188 @@ def edit_expense(
     amount: float | None = None,
     note: str | None = None,
     currency: str | None = None,
+    alerts: list[BudgetAlert] | None = None,
 ) -> Expense | None:
-    data = load_data()
-    expenses = data["expenses"]
-    for item in expenses:
-        if item.get("id") == expense_id:
-            if date is not None:
-                item["date"] = date
-            if category is not None:
-                item["category"] = category
-            if amount is not None:
-                item["amount"] = amount
-            if note is not None:
-                item["note"] = note
-            if currency is not None:
-                item["currency"] = currency
-            save_data(data)
-            get_logger().info("Edited expense %s", expense_id)
-            return Expense.from_dict(item)
-    return None
+    started = time.perf_counter()
+    op = edit_op(
+        expense_id=expense_id,
+        date=date,
+        category=category,
+        amount=amount,
+        note=note,
+        currency=currency,
+    )
+    (item,) = write_ops([op])
+    if item is None:
+        return None
+    take_alerts(item, alerts)
+    get_logger().info(
+        "Edited expense %s", expense_id, extra=operation_fields("edit", started)
+    )
+    return Expense.from_dict(item)
+
+
+# Apply add/edit/delete operations in one commit, all or nothing: an edit
+# or delete of a missing id raises ValueError and nothing is written.
+def apply_batch(ops: list[dict]) -> list[dict]:
+    started = time.perf_counter()
+    required = [op if op["op"] == "add" else {**op, "required": True} for op in ops]
+    results = write_ops(required)
+    get_logger().info(
+        "Applied batch of %d op(s)", len(ops), extra=operation_fields("batch", started)
+    )
+    return results
+
+
+# Fold pending journal records into the snapshot.
+def compact_storage() -> int:
+    started = time.perf_counter()
+    store = get_storage()
+    with ledger_lock():
+        stamp = store.stamp()
+        count = store.compact()
+        update_aggregates(store, stamp, [])
+        update_search_index(store, stamp, [])
+    get_logger().info(
+        "Compacted storage with %d expense(s)",
+        count,
+        extra=operation_fields("compact", started),
+    )
+    return count
+
+
+# Copy the ledger from the configured engine into another one and switch to it.
+def migrate_storage(target: str) -> int:
+    started = time.perf_counter()
+    source = get_storage()
+    destination = get_storage(target)
+    with ledger_lock():
+        stamp = source.stamp()
+        data = source.load()
+        destination.save(data)
+        update_aggregates(destination, stamp, [])
+        update_search_index(destination, stamp, [])
+        set_engine(target)
+    count = len(data["expenses"])
+    get_logger().info(
+        "Migrated %d expense(s) from %s to %s",
+        count,
+        source.name,
+        target,
+        extra=operation_fields("migrate", started),
+    )
+    return count
+
+
+_IMPORT_PROGRESS_EVERY = 10000
+# Errors listed in an import report before the rest are only counted.
+_IMPORT_MAX_ERRORS = 20
+
+
+# Stream (line number, row) pairs from a CSV or JSONL import file.
+def _read_import_rows(path: Path) -> Iterator[tuple[int, object]]:
+    suffix = path.suffix.lower()
+    if suffix not in (".csv", ".jsonl"):
+        raise ValueError("import file must be .csv or .jsonl")
+    try:
+        with path.open("r", encoding="utf-8", newline="") as handle:
+            if suffix == ".csv":
+                reader = csv.DictReader(handle)
+                for row in reader:
+                    yield reader.line_num, row
+                return
+            for line_no, line in enumerate(handle, start=1):
+                if not line.strip():
+                    continue
+                try:
+                    yield line_no, json.loads(line)
+                except json.JSONDecodeError:
+                    yield line_no, None
+    except FileNotFoundError as exc:
+        raise ValueError(f"import file not found: {path}") from exc
+    except OSError as exc:
+        get_logger().error("Failed to read import file %s: %s", path, exc)
+        raise RuntimeError("Unable to read import file") from exc
+
+
+# Validate one import row and turn it into an expense record without an id.
+def _import_record(row: object, created_at: str) -> dict:
+    if not isinstance(row, dict):
+        raise ValueError("row must be a JSON object")
+    date = str(row.get("date") or "").strip()
+    if not date:
+        raise ValueError("date is required")
+    checked_date(date)
+    category = str(row.get("category") or "").strip().lower()
+    if not category:
+        raise ValueError("category is required")
+    try:
+        amount = float(row.get("amount"))
+    except (TypeError, ValueError) as exc:
+        raise ValueError("amount must be a number") from exc
+    if not math.isfinite(amount):
+        raise ValueError("amount must be a number")
+    if amount <= 0:
+        raise ValueError("amount must be > 0")
+    return {
+        "date": date,
+        "category": category,
+        "amount": amount,
+        "currency": str(row.get("currency") or "BDT").strip(),
+        "note": str(row.get("note") or ""),
+        "created_at": str(row.get("created_at") or created_at),
+    }
+
+
+# Import expenses from a CSV or JSONL file and persist them in one write.
+#
+# Ids in the file are ignored; new ids come from the engine's per-date
+# counter. Invalid rows abort the import unless skip_invalid is set.
+def import_expenses(
+    path: str,
+    *,
+    skip_invalid: bool = False,
+    progress: Callable[[int], None] | None = None,
+) -> ImportReport:
+    started = time.perf_counter()
+    created_at = now_iso()
+    ops: list[dict] = []
+    errors: list[str] = []
+    invalid = 0
+    for line_no, row in _read_import_rows(Path(path)):
+        try:
+            record = _import_record(row, created_at)
+        except ValueError as exc:
+            invalid += 1
+            if len(errors) < _IMPORT_MAX_ERRORS:
+                errors.append(f"line {line_no}: {exc}")
+            continue
+        ops.append({"op": "add", "expense": record})
+        if progress is not None and len(ops) % _IMPORT_PROGRESS_EVERY == 0:
+            progress(len(ops))
+
+    if invalid and not skip_invalid:
+        get_logger().error("Import of %s aborted: %d invalid row(s)", path, invalid)
+        return ImportReport(0, invalid, errors)
+
+    if ops:
+        write_ops(ops)
+    if progress is not None:
+        progress(len(ops))
+    get_logger().info(
+        "Imported %d expense(s) from %s, skipped %d",
+        len(ops),
+        path,
+        invalid,
+        extra=operation_fields("import", started),
+    )
+    return ImportReport(len(ops), invalid, errors)
 
 
+# Rebuild the materialized summary aggregates and report any drift.
+def verify_storage() -> list[str]:
+    with ledger_lock():
+        differences = verify_aggregates(get_storage())
+    if differences:
+        get_logger().error("Aggregates drifted: %d difference(s)", len(differences))
+    return differences
@@ -0,0 +1,104 @@
+from __future__ import annotations
+
+import threading
+from contextlib import contextmanager, nullcontext
+from time import perf_counter
+from typing import Callable, ContextManager, Iterable, Iterator, NamedTuple, TypeVar
+
+T = TypeVar("T")
+
+
+# Time spent in one stage: `seconds` includes nested spans, `self_seconds`
+# does not; `calls` counts the timed blocks (or items of a timed iterator).
+class Span(NamedTuple):
+    name: str
+    seconds: float
+    self_seconds: float
+    calls: int
+
+
+_listeners: list[Callable[[Span], None]] = []
+_local = threading.local()
+
+
+# Register a callback that receives every finished Span in this process.
+def add_span_listener(callback: Callable[[Span], None]) -> None:
+    _listeners.append(callback)
+
+
+# Unregister a span callback.
+def remove_span_listener(callback: Callable[[Span], None]) -> None:
+    if callback in _listeners:
+        _listeners.remove(callback)
+
+
+# Open spans of this thread, innermost last; each frame holds the time of
+# its finished children.
+def _stack() -> list[list[float]]:
+    stack = getattr(_local, "stack", None)
+    if stack is None:
+        stack = _local.stack = []
+    return stack
+
+
+# Send a finished span to every listener.
+def _emit(span: Span) -> None:
+    for callback in list(_listeners):
+        callback(span)
+
+
+@contextmanager
+def _timed_block(name: str) -> Iterator[None]:
+    stack = _stack()
+    frame = [0.0]
+    stack.append(frame)
+    started = perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = perf_counter() - started
+        stack.pop()
+        if stack:
+            stack[-1][0] += elapsed
+        _emit(Span(name, elapsed, elapsed - frame[0], 1))
+
+
+# Time a block as stage `name`; a no-op unless a listener is registered.
+def span(name: str) -> ContextManager[None]:
+    if not _listeners:
+        return nullcontext()
+    return _timed_block(name)
+
+
+def _timed_items(name: str, iterator: Iterator[T]) -> Iterator[T]:
+    stack = _stack()
+    total = own = 0.0
+    calls = 0
+    try:
+        while True:
+            frame = [0.0]
+            stack.append(frame)
+            started = perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                elapsed = perf_counter() - started
+                stack.pop()
+                if stack:
+                    stack[-1][0] += elapsed
+                total += elapsed
+                own += elapsed - frame[0]
+            calls += 1
+            yield item
+    finally:
+        _emit(Span(name, total, own, calls))
+
+
+# Time the work of producing each item of a lazy pipeline stage (not the
+# consumer's work between items); one Span is sent when it is exhausted.
+def timed_iter(name: str, items: Iterable[T]) -> Iterator[T]:
+    if not _listeners:
+        return iter(items)
+    return _timed_items(name, iter(items))
@@ -0,0 +1,324 @@
+from __future__ import annotations
+
+import sqlite3
+from contextlib import closing
+from pathlib import Path
+from typing import Iterator
+
+from .logger import get_logger
+from .storage import Change, file_signature, missing_target, op_results
+from .utils import IdAllocator
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS expenses (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    id TEXT NOT NULL,
+    date TEXT NOT NULL,
+    category TEXT NOT NULL,
+    amount REAL NOT NULL,
+    currency TEXT NOT NULL,
+    note TEXT NOT NULL,
+    created_at TEXT NOT NULL
+);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_expenses_id ON expenses(id);
+CREATE INDEX IF NOT EXISTS idx_expenses_date ON expenses(date);
+CREATE INDEX IF NOT EXISTS idx_expenses_category ON expenses(category, date);
+CREATE INDEX IF NOT EXISTS idx_expenses_amount ON expenses(amount);
+"""
+
+_COLUMNS = ("id", "date", "category", "amount", "currency", "note", "created_at")
+_SELECT = f"SELECT {', '.join(_COLUMNS)} FROM expenses"
+_UPSERT = (
+    f"INSERT INTO expenses ({', '.join(_COLUMNS)}) VALUES (?, ?, ?, ?, ?, ?, ?) "
+    "ON CONFLICT(id) DO UPDATE SET date = excluded.date, "
+    "category = excluded.category, amount = excluded.amount, "
+    "currency = excluded.currency, note = excluded.note, "
+    "created_at = excluded.created_at"
+)
+# Ids per IN (...) lookup, below SQLite's bound-parameter limit.
+_ID_BATCH = 500
+# Sort columns; ties fall back to insertion order like the stable Python sort.
+_SORT_COLUMNS = {
+    "date": "date",
+    "amount": "amount",
+    "category": "category",
+    "created": "created_at",
+    "id": "id",
+}
+
+
+# Convert a row to the dict shape stored in expenses.json.
+def _row_to_dict(row: sqlite3.Row) -> dict:
+    return {column: row[column] for column in _COLUMNS}
+
+
+# Convert an expense dict to insert parameters.
+def _dict_to_params(record: dict) -> tuple:
+    return (
+        str(record["id"]),
+        str(record["date"]),
+        str(record["category"]),
+        float(record["amount"]),
+        str(record.get("currency", "BDT")),
+        str(record.get("note", "")),
+        str(record["created_at"]),
+    )
+
+
+# Build a WHERE clause from list/summary filters.
+def _where(
+    *,
+    month: str | None = None,
+    category: str | None = None,
+    min_amount: float | None = None,
+    max_amount: float | None = None,
+    from_date: str | None = None,
+    to_date: str | None = None,
+) -> tuple[str, list]:
+    clauses: list[str] = []
+    params: list = []
+    if month is not None:
+        # Range form of startswith() so the date index can be used.
+        clauses.append("date >= ? AND date < ?")
+        params.extend([month, month + "~"])
+    if category is not None:
+        clauses.append("category = ?")
+        params.append(category)
+    if min_amount is not None:
+        clauses.append("amount >= ?")
+        params.append(min_amount)
+    if max_amount is not None:
+        clauses.append("amount <= ?")
+        params.append(max_amount)
+    if from_date is not None:
+        clauses.append("date >= ?")
+        params.append(from_date)
+    if to_date is not None:
+        clauses.append("date <= ?")
+        params.append(to_date)
+    if not clauses:
+        return "", params
+    return " WHERE " + " AND ".join(clauses), params
+
+
+# SQLite storage: filters, sorting, limits and totals run as indexed queries.
+class SqliteStorage:
+    name = "sqlite"
+    supports_queries = True
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+
+    # Open a connection and make sure the schema exists.
+    def _connect(self) -> sqlite3.Connection:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        try:
+            conn = sqlite3.connect(self.path)
+            conn.row_factory = sqlite3.Row
+            conn.executescript(_SCHEMA)
+        except sqlite3.Error as exc:
+            get_logger().error("Failed to open database %s: %s", self.path, exc)
+            raise RuntimeError("Unable to read data file") from exc
+        return conn
+
+    # Signature of the database file, for derived data to check.
+    def stamp(self) -> list:
+        return [file_signature(self.path)]
+
+    # Load the whole ledger in insertion order.
+    def load(self) -> dict:
+        if not self.path.exists():
+            return {"version": 1, "expenses": []}
+        with closing(self._connect()) as conn:
+            rows = conn.execute(f"{_SELECT} ORDER BY seq").fetchall()
+        return {"version": 1, "expenses": [_row_to_dict(row) for row in rows]}
+
+    # Stream rows in insertion order.
+    def iter_records(self) -> Iterator[dict]:
+        # Reads never create the database: that would change its stamp.
+        if not self.path.exists():
+            return
+        with closing(self._connect()) as conn:
+            for row in conn.execute(f"{_SELECT} ORDER BY seq"):
+                yield _row_to_dict(row)
+
+    # Rows with the given ids, in that order; missing ids are skipped.
+    def records_by_id(self, ids: list[str]) -> Iterator[dict]:
+        if not self.path.exists():
+            return iter(())
+        found: dict[str, dict] = {}
+        with closing(self._connect()) as conn:
+            for start in range(0, len(ids), _ID_BATCH):
+                batch = ids[start : start + _ID_BATCH]
+                marks = ", ".join("?" * len(batch))
+                for row in conn.execute(f"{_SELECT} WHERE id IN ({marks})", batch):
+                    found[row["id"]] = _row_to_dict(row)
+        return (found[expense_id] for expense_id in ids if expense_id in found)
+
+    # Replace the whole ledger.
+    def save(self, data: dict) -> None:
+        try:
+            with closing(self._connect()) as conn, conn:
+                conn.execute("DELETE FROM expenses")
+                conn.executemany(
+                    _UPSERT, (_dict_to_params(item) for item in data["expenses"])
+                )
+        except sqlite3.Error as exc:
+            get_logger().error("Failed to write database %s: %s", self.path, exc)
+            raise RuntimeError("Unable to write data file") from exc
+
+    # Apply operations and return the per-operation results.
+    def apply(self, ops: list[dict]) -> list[dict | None]:
+        return op_results(ops, self.apply_changes(ops))
+
+    # Apply add/edit/delete operations in one transaction and return what changed.
+    def apply_changes(self, ops: list[dict]) -> list[Change]:
+        changes: list[Change] = []
+        try:
+            with closing(self._connect()) as conn, conn:
+                for op in ops:
+                    changes.append(self._apply_one(conn, op))
+        except sqlite3.Error as exc:
+            get_logger().error("Failed to write database %s: %s", self.path, exc)
+            raise RuntimeError("Unable to write data file") from exc
+        return changes
+
+    # Fetch one expense by id.
+    def _get(self, conn: sqlite3.Connection, expense_id: str) -> dict | None:
+        row = conn.execute(f"{_SELECT} WHERE id = ?", (expense_id,)).fetchone()
+        return _row_to_dict(row) if row else None
+
+    # Apply a single operation on an open transaction.
+    def _apply_one(self, conn: sqlite3.Connection, op: dict) -> Change:
+        kind = op.get("op")
+        if kind == "add":
+            record = dict(op["expense"])
+            before = None
+            if not record.get("id"):
+                record.pop("id", None)
+                record = {"id": self._next_id(conn, record["date"]), **record}
+            else:
+                before = self._get(conn, record["id"])
+            conn.execute(_UPSERT, _dict_to_params(record))
+            return before, record
+        if kind == "edit":
+            before = self._get(conn, op["id"])
+            if before is None:
+                return missing_target(op)
+            changes = {
+                key: value for key, value in op["changes"].items() if key in _COLUMNS
+            }
+            if changes:
+                assignments = ", ".join(f"{key} = ?" for key in changes)
+                conn.execute(
+                    f"UPDATE expenses SET {assignments} WHERE id = ?",
+                    [*changes.values(), op["id"]],
+                )
+            return before, self._get(conn, op["id"])
+        if kind == "delete":
+            before = self._get(conn, op["id"])
+            if before is None:
+                return missing_target(op)
+            conn.execute("DELETE FROM expenses WHERE id = ?", (op["id"],))
+            return before, None
+        raise ValueError(f"Unknown operation: {kind}")
+
+    # Allocate the next id for a date from the ids it has now (an index
+    # range), so a delete earlier in the transaction frees its id like in
+    # the other engines.
+    def _next_id(self, conn: sqlite3.Connection, date_str: str) -> str:
+        prefix = f"EXP-{date_str.replace('-', '')}-"
+        allocator = IdAllocator()
+        rows = conn.execute(
+            "SELECT id FROM expenses WHERE id >= ? AND id < ?",
+            (prefix, prefix + "~"),
+        )
+        for row in rows:
+            allocator.observe(row["id"])
+        return allocator.allocate(date_str)
+
+    # Rebuild the database file; returns the number of expenses.
+    def compact(self) -> int:
+        with closing(self._connect()) as conn:
+            conn.execute("VACUUM")
+            (count,) = conn.execute("SELECT COUNT(*) FROM expenses").fetchone()
+        return count
+
+    # Stream filtered, sorted and limited rows; sort_by=None keeps insertion order.
+    def query(
+        self,
+        *,
+        month: str | None = None,
+        category: str | None = None,
+        min_amount: float | None = None,
+        max_amount: float | None = None,
+        from_date: str | None = None,
+        to_date: str | None = None,
+        sort_by: str | None = "date",
+        desc: bool = False,
+        limit: int | None = None,
+    ) -> Iterator[dict]:
+        where, params = _where(
+            month=month,
+            category=category,
+            min_amount=min_amount,
+            max_amount=max_amount,
+            from_date=from_date,
+            to_date=to_date,
+        )
+        if sort_by is None:
+            order = "seq"
+        else:
+            direction = "DESC" if desc else "ASC"
+            order = f"{_SORT_COLUMNS[sort_by]} {direction}, seq"
+        sql = f"{_SELECT}{where} ORDER BY {order}"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
+        if not self.path.exists():
+            return
+        with closing(self._connect()) as conn:
+            for row in conn.execute(sql, params):
+                yield _row_to_dict(row)
+
+    # Never split for parallel reads: totals run inside SQLite.
+    def chunks(self, count: int, **filters) -> None:
+        return None
+
+    # Count, grand total, category totals and month totals via GROUP BY.
+    def totals(
+        self,
+        *,
+        month: str | None = None,
+        category: str | None = None,
+        from_date: str | None = None,
+        to_date: str | None = None,
+    ) -> tuple[int, float, dict[str, float], dict[str, float], dict[str, float]]:
+        where, params = _where(
+            month=month, category=category, from_date=from_date, to_date=to_date
+        )
+        if not self.path.exists():
+            return 0, 0.0, {}, {}, {}
+        with closing(self._connect()) as conn:
+            category_rows = conn.execute(
+                "SELECT category, SUM(amount) AS total, COUNT(*) AS count "
+                f"FROM expenses{where} GROUP BY category",
+                params,
+            ).fetchall()
+            month_rows = conn.execute(
+                "SELECT substr(date, 1, 7) AS month, SUM(amount) AS total "
+                f"FROM expenses{where} GROUP BY month",
+                params,
+            ).fetchall()
+            currency_rows = conn.execute(
+                "SELECT currency, SUM(amount) AS total "
+                f"FROM expenses{where} GROUP BY currency",
+                params,
+            ).fetchall()
+        count = sum(row["count"] for row in category_rows)
+        total = sum(row["total"] for row in category_rows)
+        categories = {row["category"]: row["total"] for row in category_rows}
+        months = {row["month"]: row["total"] for row in month_rows}
+        currencies = {row["currency"]: row["total"] for row in currency_rows}
+        return count, total, categories, months, currencies
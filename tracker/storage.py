@@ -1,30 +1,237 @@
 from __future__ import annotations
 
 import json
+import mmap
+import os
+import re
+import threading
 from pathlib import Path
+from typing import Callable, Iterable, Iterator
 
 from .logger import get_logger
+from .index import LedgerIndex, read_index, write_index
+from .models import Expense
+from .spans import span, timed_iter
+from .utils import IdAllocator
 
 
 _DEFAULT_DATA = {"version": 1, "expenses": []}
+_ENGINE_ENV = "TRACKER_STORAGE"
+_DATA_DIR_ENV = "TRACKER_DATA_DIR"
+# Number of journal records tolerated before they are folded into the snapshot.
+_COMPACT_EVERY = 1000
+_READ_CHUNK = 1 << 16
+_WHITESPACE = re.compile(r"\s*")
+# Snapshots smaller than two of these are not split for parallel reads.
+_CHUNK_MIN_BYTES = 8 << 20
+_ARRAY_HEAD = re.compile(rb'\s*\{\s*"version"\s*:\s*\d+\s*,\s*"expenses"\s*:\s*\[')
+_RECORD_LEAD = re.compile(rb"\s*\n([ \t]*)\{")
+# Stands in for the expense list while the rest of a snapshot is encoded.
+_LIST_PLACEHOLDER = "\x00expenses\x00"
+_RECORD_ENCODER = json.JSONEncoder(indent=2, ensure_ascii=True)
 
 
-# Resolve path to the data file.
+# Resolve path to the data file (in TRACKER_DATA_DIR when set).
 def _data_path() -> Path:
+    data_dir = os.environ.get(_DATA_DIR_ENV)
+    if data_dir:
+        return Path(data_dir) / "expenses.json"
     return Path(__file__).resolve().parent.parent / "data" / "expenses.json"
 
 
-# Load data from json file with validation.
-def load_data() -> dict:
-    path = _data_path()
+# Resolve path to a derived file kept next to the data file (e.g. ".agg.json").
+def sidecar_path(suffix: str) -> Path:
+    return _data_path().with_suffix(suffix)
+
+
+# Resolve path to another file in the data directory (e.g. "rates.json").
+def data_file(name: str) -> Path:
+    return _data_path().with_name(name)
+
+
+# Size and mtime of a file, or None when it does not exist.
+def file_signature(path: Path) -> list[int] | None:
+    try:
+        stat = path.stat()
+    except FileNotFoundError:
+        return None
+    return [stat.st_mtime_ns, stat.st_size]
+
+
+# Entries of a sidecar change log that belong to the base `generation`,
+# oldest first; entries of an older base and a torn final line are skipped.
+def read_log(path: Path, generation: str) -> list[dict]:
+    try:
+        with path.open("r", encoding="utf-8") as handle:
+            lines = handle.readlines()
+    except FileNotFoundError:
+        return []
+    entries = []
+    for line in lines:
+        try:
+            entry = json.loads(line)
+        except json.JSONDecodeError:
+            continue
+        if isinstance(entry, dict) and entry.get("generation") == generation:
+            entries.append(entry)
+    return entries
+
+
+# Last complete line of a file, read from the end; None when empty.
+def last_line(path: Path) -> bytes | None:
+    try:
+        with path.open("rb") as handle:
+            size = handle.seek(0, os.SEEK_END)
+            block = 4096
+            while True:
+                start = max(size - block, 0)
+                handle.seek(start)
+                tail = handle.read(size - start)
+                lines = tail.rstrip(b"\n").split(b"\n")
+                if len(lines) > 1 or start == 0:
+                    return lines[-1] or None
+                block *= 4
+    except FileNotFoundError:
+        return None
+
+
+# Inode, mtime and size of a file, or None when it does not exist.
+def _file_identity(path: Path) -> tuple[int, int, int] | None:
+    try:
+        stat = path.stat()
+    except FileNotFoundError:
+        return None
+    return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+
+# One cached ledger: the parsed data, the journal records it includes, and
+# values derived from it (such as the decoded Expense list).
+class _CacheEntry:
+    def __init__(self, key: tuple, data: dict, entries: list[dict]) -> None:
+        self.key = key
+        self.data = data
+        self.entries = entries
+        self.derived: dict[str, object] = {}
+
+
+# Process-wide cache of parsed ledgers, keyed on data file path and the
+# inode/mtime/size of the snapshot and journal. A lookup costs two stat()
+# calls; any change to the files, ours or external, misses.
+#
+# Cached records are shared between callers and must not be mutated.
+class LedgerCache:
+    def __init__(self) -> None:
+        self.enabled = True
+        self.hits = 0
+        self.misses = 0
+        self._entries: dict[Path, _CacheEntry] = {}
+        self._lock = threading.Lock()
+
+    # Cached entry for `key`, counting the hit or miss.
+    def get(self, path: Path, key: tuple) -> _CacheEntry | None:
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is not None and entry.key == key:
+                self.hits += 1
+                return entry
+            self.misses += 1
+            return None
+
+    # Store a freshly parsed or written ledger.
+    def put(self, path: Path, key: tuple, data: dict, entries: list[dict]) -> None:
+        if not self.enabled:
+            return
+        with self._lock:
+            self._entries[path] = _CacheEntry(key, data, entries)
+
+    # Move an entry forward over journal records we appended ourselves.
+    def advance(
+        self, path: Path, old_key: tuple, new_key: tuple, entries: list[dict]
+    ) -> None:
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is None or entry.key != old_key:
+                return
+            data = {**entry.data, "expenses": list(entry.data["expenses"])}
+            # The index moves forward with the data, so it is built only once.
+            index = entry.derived.get("index") or LedgerIndex.build(data["expenses"])
+            apply_ops(data, entries, index)
+            advanced = _CacheEntry(new_key, data, entry.entries + entries)
+            advanced.derived["index"] = index
+            self._entries[path] = advanced
+
+    # Value derived from a cached ledger, built once per entry.
+    def derived(self, entry: _CacheEntry, name: str, build: Callable[[], object]):
+        if name in entry.derived:
+            return entry.derived[name]
+        value = build()
+        with self._lock:
+            entry.derived[name] = value
+        return value
+
+    # Drop one ledger (or all of them).
+    def invalidate(self, path: Path | None = None) -> None:
+        with self._lock:
+            if path is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(path, None)
+
+    # Hit/miss counters and the number of cached ledgers.
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "hits": self.hits,
+                "misses": self.misses,
+                "entries": len(self._entries),
+            }
+
+
+_CACHE = LedgerCache()
+
+
+# Hit/miss counters of the process-wide ledger cache.
+def cache_stats() -> dict:
+    return _CACHE.stats()
+
+
+# Whether the process-wide ledger cache is on.
+def cache_enabled() -> bool:
+    return _CACHE.enabled
+
+
+# Turn the process-wide ledger cache on or off (off also empties it).
+def set_cache_enabled(enabled: bool) -> None:
+    _CACHE.enabled = enabled
+    if not enabled:
+        _CACHE.invalidate()
+
+
+# Empty the process-wide ledger cache.
+def clear_cache() -> None:
+    _CACHE.invalidate()
+
+
+# Resolve path to the append-only journal that sits next to the data file.
+def _journal_path(path: Path) -> Path:
+    return path.with_suffix(".journal")
+
+
+# Fresh empty ledger (never share the default's expenses list).
+def _empty_data() -> dict:
+    return {"version": _DEFAULT_DATA["version"], "expenses": []}
+
+
+# Read the JSON snapshot with validation.
+def read_snapshot(path: Path) -> dict:
     logger = get_logger()
+    # Reads never create the file: that would change the ledger's stamp.
     if not path.exists():
-        path.parent.mkdir(parents=True, exist_ok=True)
-        save_data(_DEFAULT_DATA)
-        return dict(_DEFAULT_DATA)
+        return _empty_data()
 
     try:
-        with path.open("r", encoding="utf-8") as handle:
+        with span("load.parse"), path.open("r", encoding="utf-8") as handle:
             data = json.load(handle)
     except json.JSONDecodeError as exc:
         logger.error("Invalid JSON in %s", path)
@@ -40,14 +247,991 @@ def load_data() -> dict:
     return data
 
 
-# Save data to json file.
-def save_data(data: dict) -> None:
-    path = _data_path()
+# Flush a directory entry change (rename, unlink) to disk where supported.
+def fsync_dir(path: Path) -> None:
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+# Write a snapshot in the layout of json.dump(data, indent=2), one record at
+# a time, appending the (byte offset, byte length) of each record to `spans`.
+def _dump_records(handle, data: dict, spans: list[tuple[int, int]]) -> None:
+    text = json.dumps({**data, "expenses": _LIST_PLACEHOLDER}, indent=2, ensure_ascii=True)
+    head, _, tail = text.partition(json.dumps(_LIST_PLACEHOLDER))
+    handle.write(head)
+    written = len(head)
+    records = data["expenses"]
+    if not records:
+        handle.write("[]")
+    else:
+        handle.write("[\n")
+        written += 2
+        for position, record in enumerate(records):
+            lead = "    " if position == 0 else ",\n    "
+            body = _RECORD_ENCODER.encode(record).replace("\n", "\n    ")
+            handle.write(lead + body)
+            spans.append((written + len(lead), len(body)))
+            written += len(lead) + len(body)
+        handle.write("\n  ]")
+    handle.write(tail)
+
+
+# Write the JSON snapshot through a temp file so readers never see half a
+# file; the data is on disk before it replaces the old snapshot. With
+# `spans`, the byte range of every record is appended to it (the file is
+# ASCII, so characters and bytes match).
+#
+# Returns the inode of the written file.
+def write_snapshot(
+    path: Path, data: dict, spans: list[tuple[int, int]] | None = None
+) -> int:
     path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(f"{path.name}.tmp")
     try:
-        with path.open("w", encoding="utf-8") as handle:
-            json.dump(data, handle, indent=2, ensure_ascii=True)
+        with tmp_path.open("w", encoding="utf-8") as handle:
+            if spans is None:
+                json.dump(data, handle, indent=2, ensure_ascii=True)
+            else:
+                _dump_records(handle, data, spans)
             handle.write("\n")
+            handle.flush()
+            os.fsync(handle.fileno())
+            inode = os.fstat(handle.fileno()).st_ino
+        os.replace(tmp_path, path)
+        fsync_dir(path.parent)
+        return inode
     except OSError as exc:
         get_logger().error("Failed to write data file %s: %s", path, exc)
         raise RuntimeError("Unable to write data file") from exc
+
+
+# Incremental reader over the "expenses" array of a JSON snapshot.
+class _SnapshotReader:
+    def __init__(self, handle) -> None:
+        self._handle = handle
+        self._decoder = json.JSONDecoder()
+        self._buffer = ""
+        self._pos = 0
+        self._eof = False
+
+    # Read another chunk; returns False at end of file.
+    def _fill(self) -> bool:
+        if self._eof:
+            return False
+        chunk = self._handle.read(_READ_CHUNK)
+        if not chunk:
+            self._eof = True
+            return False
+        self._buffer = self._buffer[self._pos :] + chunk
+        self._pos = 0
+        return True
+
+    # Next non-whitespace character without consuming it ("" at end of file).
+    def _peek(self) -> str:
+        while True:
+            self._pos = _WHITESPACE.match(self._buffer, self._pos).end()
+            if self._pos < len(self._buffer):
+                return self._buffer[self._pos]
+            if not self._fill():
+                return ""
+
+    # Consume an expected punctuation character.
+    def _expect(self, char: str) -> None:
+        if self._peek() != char:
+            raise ValueError(f"expected {char!r}")
+        self._pos += 1
+
+    # Decode one JSON value, reading more input until it is complete.
+    def _value(self) -> object:
+        self._peek()
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self._buffer, self._pos)
+            except json.JSONDecodeError:
+                if not self._fill():
+                    raise
+                continue
+            # A number may continue in the next chunk.
+            if end == len(self._buffer) and self._fill():
+                continue
+            self._pos = end
+            return value
+
+    # Yield each expense while walking the top-level object.
+    def records(self) -> Iterator[dict]:
+        seen_version = seen_expenses = False
+        self._expect("{")
+        if self._peek() == "}":
+            raise KeyError("expenses")
+        while True:
+            key = self._value()
+            self._expect(":")
+            if key == "expenses":
+                seen_expenses = True
+                self._expect("[")
+                if self._peek() == "]":
+                    self._pos += 1
+                else:
+                    while True:
+                        yield self._value()
+                        if self._peek() == "]":
+                            self._pos += 1
+                            break
+                        self._expect(",")
+            else:
+                seen_version = seen_version or key == "version"
+                self._value()
+            if self._peek() == "}":
+                break
+            self._expect(",")
+        if not (seen_version and seen_expenses):
+            raise KeyError("version" if seen_expenses else "expenses")
+
+
+# Stream expenses from a JSON snapshot without loading the whole file.
+def _iter_snapshot(path: Path) -> Iterator[dict]:
+    logger = get_logger()
+    if not path.exists():
+        return
+    try:
+        with path.open("r", encoding="utf-8") as handle:
+            yield from _SnapshotReader(handle).records()
+    except (json.JSONDecodeError, ValueError) as exc:
+        logger.error("Invalid JSON in %s", path)
+        raise RuntimeError("Data file is corrupted") from exc
+    except KeyError as exc:
+        logger.error("Unexpected schema in %s", path)
+        raise RuntimeError("Data file has an invalid schema") from exc
+    except OSError as exc:
+        logger.error("Failed to read data file %s: %s", path, exc)
+        raise RuntimeError("Unable to read data file") from exc
+
+
+# Lay journal records over streamed snapshot records.
+#
+# Produces the same rows in the same order as apply_ops() on the loaded
+# snapshot: edited rows stay in place, new or re-added rows go to the end.
+def _overlay_journal(records: Iterable[dict], entries: list[dict]) -> Iterator[dict]:
+    events = _journal_events(entries)
+    tail: list[tuple[int, dict]] = []
+    for record in records:
+        history = events.pop(record.get("id"), None)
+        if history is None:
+            yield record
+            continue
+        record, moved_at = _resolve_history(record, history)
+        if record is None:
+            continue
+        if moved_at is None:
+            yield record
+        else:
+            tail.append((moved_at, record))
+
+    for history in events.values():
+        record, moved_at = _resolve_history(None, history)
+        if record is not None:
+            tail.append((moved_at, record))
+    tail.sort(key=lambda pair: pair[0])
+    for _, record in tail:
+        yield record
+
+
+# Journal records grouped by expense id, with their journal order.
+def _journal_events(entries: list[dict]) -> dict[str, list[tuple[int, dict]]]:
+    events: dict[str, list[tuple[int, dict]]] = {}
+    for order, entry in enumerate(entries):
+        expense_id = entry["expense"]["id"] if entry["op"] == "add" else entry["id"]
+        events.setdefault(expense_id, []).append((order, entry))
+    return events
+
+
+# Final record for an id after its journal history, and the journal order at
+# which it moved to the end of the ledger (None when it stayed in place).
+def _resolve_history(
+    record: dict | None, history: list[tuple[int, dict]]
+) -> tuple[dict | None, int | None]:
+    moved_at = None
+    for order, entry in history:
+        if entry["op"] == "add":
+            if record is None:
+                moved_at = order
+            record = dict(entry["expense"])
+        elif entry["op"] == "edit":
+            if record is not None:
+                record = {**record, **entry["changes"]}
+        else:
+            record = None
+    return record, moved_at
+
+
+# First occurrence of `marker` at or after `offset` and before `end`.
+def _find(handle, marker: bytes, offset: int, end: int) -> int | None:
+    handle.seek(offset)
+    carried = b""
+    base = offset
+    while base < end:
+        block = handle.read(_READ_CHUNK)
+        if not block:
+            return None
+        found = (carried + block).find(marker)
+        if found >= 0:
+            position = base - len(carried) + found
+            return position if position < end else None
+        carried = block[-(len(marker) - 1) :]
+        base += len(block)
+    return None
+
+
+# Byte ranges splitting a snapshot's expense array into up to `count` parts
+# that can be parsed on their own, for reads in other processes.
+#
+# Cuts go where a record starts a line at the indentation of the first
+# record; JSON strings cannot hold a raw newline, so only records start
+# there. Snapshots written by the tracker and by benchmarks.generator are
+# laid out this way. None when the file is too small to be worth splitting
+# or has another layout.
+def snapshot_chunks(path: Path, count: int) -> list[tuple[int, int]] | None:
+    try:
+        size = path.stat().st_size
+    except FileNotFoundError:
+        return None
+    count = min(count, size // _CHUNK_MIN_BYTES)
+    if count < 2:
+        return None
+    with path.open("rb") as handle:
+        head = handle.read(_READ_CHUNK)
+        match = _ARRAY_HEAD.match(head)
+        lead = _RECORD_LEAD.match(head, match.end()) if match else None
+        if lead is None:
+            return None
+        marker = b"\n" + lead.group(1) + b"{"
+        tail_start = max(0, size - 64)
+        handle.seek(tail_start)
+        tail = handle.read().rstrip()
+        if not tail.endswith(b"}") or not tail[:-1].rstrip().endswith(b"]"):
+            return None
+        end = tail_start + len(tail[:-1].rstrip()) - 1
+
+        cuts = [match.end()]
+        for part in range(1, count):
+            offset = cuts[0] + (end - cuts[0]) * part // count
+            found = _find(handle, marker, max(offset, cuts[-1] + 1), end)
+            if found is None:
+                break
+            cuts.append(found)
+        cuts.append(end)
+    return list(zip(cuts, cuts[1:])) if len(cuts) > 2 else None
+
+
+# Records in one byte range from snapshot_chunks(); `identity` is the
+# snapshot's (inode, mtime, size) when it was split.
+def read_snapshot_chunk(
+    path: Path, start: int, end: int, identity: tuple[int, int, int]
+) -> list[dict]:
+    logger = get_logger()
+    try:
+        with path.open("rb") as handle:
+            stat = os.fstat(handle.fileno())
+            if (stat.st_ino, stat.st_mtime_ns, stat.st_size) != identity:
+                raise RuntimeError("Data file changed while it was read")
+            handle.seek(start)
+            text = handle.read(end - start).decode("utf-8").strip()
+    except OSError as exc:
+        logger.error("Failed to read data file %s: %s", path, exc)
+        raise RuntimeError("Unable to read data file") from exc
+    if text.endswith(","):
+        text = text[:-1]
+    try:
+        with span("load.parse"):
+            return json.loads(f"[{text}]")
+    except (json.JSONDecodeError, UnicodeDecodeError) as exc:
+        logger.error("Invalid JSON in %s", path)
+        raise RuntimeError("Data file is corrupted") from exc
+
+
+# A change is the (before, after) pair of records for one operation: an add
+# of a new id is (None, record), a delete is (record, None), and an
+# operation on a missing id is (None, None).
+Change = tuple[dict | None, dict | None]
+
+
+# Change for an edit/delete of a missing id. Operations marked "required"
+# raise instead, before anything is written, so their batch fails whole;
+# the error carries the id as `expense_id`.
+def missing_target(op: dict) -> Change:
+    if op.get("required"):
+        error = ValueError(f"Expense not found: {op['id']}")
+        error.expense_id = op["id"]
+        raise error
+    return None, None
+
+
+# Apply add/edit/delete operations to loaded data in place.
+#
+# Each operation is a dict: {"op": "add", "expense": {...}},
+# {"op": "edit", "id": ..., "changes": {...}} or {"op": "delete", "id": ...}.
+# Adds without an id get one allocated; see missing_target for "required".
+# Returns one Change per operation.
+# Replaying the same operations twice yields the same ledger, which keeps
+# journal replay safe after an interrupted compaction. A persisted index
+# can be passed in; it is updated incrementally alongside the data.
+def apply_ops(
+    data: dict, ops: list[dict], index: LedgerIndex | None = None
+) -> list[Change]:
+    expenses = data["expenses"]
+    if index is None:
+        index = LedgerIndex.build(expenses)
+    changes: list[Change] = []
+    removed = False
+
+    for op in ops:
+        kind = op.get("op")
+        if kind == "add":
+            record = dict(op["expense"])
+            if not record.get("id"):
+                record.pop("id", None)
+                record = {"id": index.allocator.allocate(record["date"]), **record}
+            position = index.add(record)
+            if position == len(expenses):
+                expenses.append(record)
+                changes.append((None, record))
+            else:
+                changes.append((expenses[position], record))
+                expenses[position] = record
+        elif kind == "edit":
+            position = index.position(op["id"])
+            if position is None:
+                changes.append(missing_target(op))
+                continue
+            # Copy on write: the old dict may be shared with the ledger cache.
+            before = expenses[position]
+            record = {**before, **op["changes"]}
+            expenses[position] = record
+            changes.append((before, record))
+        elif kind == "delete":
+            position = index.remove(op["id"])
+            if position is None:
+                changes.append(missing_target(op))
+                continue
+            changes.append((expenses[position], None))
+            expenses[position] = None
+            removed = True
+        else:
+            raise ValueError(f"Unknown operation: {kind}")
+
+    if removed:
+        expenses[:] = [item for item in expenses if item is not None]
+        index.reindex(expenses)
+    return changes
+
+
+# Per-operation results: the stored record for add/edit, the removed record
+# for delete, or None when the target id does not exist.
+def op_results(ops: list[dict], changes: list[Change]) -> list[dict | None]:
+    return [
+        before if op.get("op") == "delete" else after
+        for op, (before, after) in zip(ops, changes)
+    ]
+
+
+# Records with the given ids, in the order of `ids`, picked out of one pass
+# over `records`; ids that no record has are skipped.
+def pick_records(records: Iterable[dict], ids: list[str]) -> Iterator[dict]:
+    wanted = set(ids)
+    found: dict[str, dict] = {}
+    for record in records:
+        if record.get("id") in wanted:
+            found[record["id"]] = record
+            if len(found) == len(wanted):
+                break
+    return (found[expense_id] for expense_id in ids if expense_id in found)
+
+
+# Turn applied operations into the records that describe what changed.
+def _resolved_ops(ops: list[dict], changes: list[Change]) -> list[dict]:
+    entries = []
+    for op, (before, after) in zip(ops, changes):
+        if op["op"] == "add":
+            entries.append({"op": "add", "expense": after})
+        elif after is not None:
+            entries.append({"op": "edit", "id": op["id"], "changes": op["changes"]})
+        elif before is not None:
+            entries.append({"op": "delete", "id": op["id"]})
+    return entries
+
+
+# Plain JSON storage: every write rewrites the whole snapshot.
+class JsonStorage:
+    name = "json"
+    supports_queries = False
+
+    def __init__(self, path: Path | None = None) -> None:
+        self.path = path or _data_path()
+        self.journal_path = _journal_path(self.path)
+        self.index_path = self.path.with_suffix(".idx")
+        self.journal_len = 0
+        self._journal_entries: list[dict] = []
+
+    # Identity of the ledger files, used as the cache key.
+    def _cache_key(self) -> tuple:
+        return _file_identity(self.path), _file_identity(self.journal_path)
+
+    # Parsed ledger shared with the process-wide cache; records must not be
+    # mutated. Replays any journal left behind by the journal engine.
+    def _load_shared(self) -> _CacheEntry:
+        # Key before reading: a file replaced mid-read then never matches.
+        key = self._cache_key()
+        entry = _CACHE.get(self.path, key)
+        if entry is None:
+            data = read_snapshot(self.path)
+            entries = self._read_journal()
+            if entries:
+                # The persisted index describes the snapshot before the journal.
+                index = self._read_index([])
+                if index is not None and index.size != len(data["expenses"]):
+                    index = None
+                with span("load.journal"):
+                    apply_ops(data, entries, index)
+            entry = _CacheEntry(key, data, entries)
+            _CACHE.put(self.path, key, data, entries)
+        self.journal_len = len(entry.entries)
+        self._journal_entries = entry.entries
+        return entry
+
+    # Load the ledger as a private copy the caller may change.
+    def load(self) -> dict:
+        data = self._load_shared().data
+        return {**data, "expenses": [dict(item) for item in data["expenses"]]}
+
+    # Stream expense records in ledger order.
+    #
+    # Served from the cache when it is enabled or already holds the ledger;
+    # otherwise read incrementally without holding the ledger.
+    def iter_records(self) -> Iterator[dict]:
+        entry = _CACHE.get(self.path, self._cache_key())
+        if entry is None and _CACHE.enabled:
+            entry = self._load_shared()
+        if entry is not None:
+            return iter(entry.data["expenses"])
+        entries = self._read_journal()
+        records = timed_iter("load.parse", _iter_snapshot(self.path))
+        if entries:
+            records = timed_iter("load.journal", _overlay_journal(records, entries))
+        return records
+
+    # Decoded expenses, built once per cached ledger.
+    def expenses(self) -> list[Expense]:
+        entry = self._load_shared()
+        return _CACHE.derived(
+            entry,
+            "expenses",
+            lambda: list(
+                timed_iter("load.decode", Expense.from_dicts(entry.data["expenses"]))
+            ),
+        )
+
+    # Decoded expenses in ledger order: cached objects when the cache is on,
+    # otherwise decoded while streaming.
+    def iter_expenses(self) -> Iterator[Expense]:
+        if _CACHE.enabled:
+            return iter(self.expenses())
+        return timed_iter("load.decode", Expense.from_dicts(self.iter_records()))
+
+    # Value derived from the cached ledger records (e.g. analytics columns).
+    def derived(self, name: str, build: Callable[[list[dict]], object]):
+        entry = self._load_shared()
+        return _CACHE.derived(entry, name, lambda: build(entry.data["expenses"]))
+
+    # Records with the given ids, in that order; missing ids are skipped.
+    # Looked up in a cached id map when the cache is on, otherwise picked out
+    # of one streamed pass.
+    def records_by_id(self, ids: list[str]) -> Iterator[dict]:
+        if not _CACHE.enabled:
+            return pick_records(self.iter_records(), ids)
+        by_id = self.derived(
+            "by_id", lambda records: {record["id"]: record for record in records}
+        )
+        return (by_id[expense_id] for expense_id in ids if expense_id in by_id)
+
+    # Records of one category in ledger order, read through the category row
+    # set of the persisted index: only those records of the snapshot are
+    # parsed, with the snapshot records of ids the journal touches (it may
+    # move them into the category) and the journal laid over them.
+    #
+    # None when the ledger cache is on (it keeps category lists of its own)
+    # or the index does not describe the snapshot.
+    def iter_category(self, category: str) -> Iterator[dict] | None:
+        if _CACHE.enabled:
+            return None
+        # Journal first, like iter_records(): a compaction in between only
+        # replays records the snapshot already holds.
+        entries = self._read_journal()
+        try:
+            handle = self.path.open("rb")
+        except FileNotFoundError:
+            return None
+        except OSError as exc:
+            get_logger().error("Failed to read data file %s: %s", self.path, exc)
+            raise RuntimeError("Unable to read data file") from exc
+        with handle:
+            stat = os.fstat(handle.fileno())
+            stored = read_index(self.index_path, [stat.st_mtime_ns, stat.st_size])
+            if stored is None or stat.st_size == 0:
+                return None
+            buffer = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+        table = stored[2]
+        rows = {position: (offset, length) for position, offset, length in table.rows(category)}
+        for expense_id in _journal_events(entries):
+            found = table.lookup(expense_id)
+            if found is not None:
+                rows[found[0]] = found[1:]
+        get_logger().info("Category %s reads %d snapshot record(s)", category, len(rows))
+
+        def _records() -> Iterator[dict]:
+            with buffer:
+                for position in sorted(rows):
+                    offset, length = rows[position]
+                    try:
+                        yield json.loads(buffer[offset : offset + length])
+                    except (json.JSONDecodeError, UnicodeDecodeError) as exc:
+                        get_logger().error("Invalid JSON in %s", self.path)
+                        raise RuntimeError("Data file is corrupted") from exc
+
+        records = timed_iter("load.parse", _records())
+        if entries:
+            records = timed_iter("load.journal", _overlay_journal(records, entries))
+        return (record for record in records if record["category"] == category)
+
+    # Up to `count` parts of the ledger that other processes can read with
+    # read_chunk(): byte ranges of the snapshot, each with the journal.
+    # None when the snapshot is not worth splitting.
+    def chunks(self, count: int, **filters) -> list[tuple] | None:
+        identity = _file_identity(self.path)
+        ranges = snapshot_chunks(self.path, count) if identity is not None else None
+        if ranges is None:
+            return None
+        entries = self._read_journal()
+        return [(identity, start, end, entries) for start, end in ranges]
+
+    # Records of one chunk with the journal laid over them; ids the journal
+    # touches that the chunk holds are added to `seen`.
+    def read_chunk(self, chunk: tuple, seen: set[str]) -> Iterator[dict]:
+        identity, start, end, entries = chunk
+        records = read_snapshot_chunk(self.path, start, end, identity)
+        if not entries:
+            return iter(records)
+        events = _journal_events(entries)
+
+        def _overlaid() -> Iterator[dict]:
+            for record in records:
+                history = events.get(record.get("id"))
+                if history is None:
+                    yield record
+                    continue
+                seen.add(record["id"])
+                resolved, _ = _resolve_history(record, history)
+                if resolved is not None:
+                    yield resolved
+
+        return _overlaid()
+
+    # Records no chunk holds: journal adds of ids missing from `seen`.
+    def chunk_tail(self, chunks: list[tuple], seen: set[str]) -> Iterator[dict]:
+        for expense_id, history in _journal_events(chunks[0][3]).items():
+            if expense_id not in seen:
+                record, _ = _resolve_history(None, history)
+                if record is not None:
+                    yield record
+
+    # Replace the snapshot and drop the journal it now contains; the id
+    # index is rewritten for the new snapshot, keeping the id sequences of
+    # `index` when given so deleted ids are not handed out again.
+    def save(self, data: dict, index: LedgerIndex | None = None) -> None:
+        spans: list[tuple[int, int]] = []
+        inode = write_snapshot(self.path, data, spans)
+        self._write_index(data["expenses"], spans, index)
+        if self.journal_path.exists():
+            try:
+                self.journal_path.unlink()
+            except OSError as exc:
+                _CACHE.invalidate(self.path)
+                get_logger().error(
+                    "Failed to remove journal %s: %s", self.journal_path, exc
+                )
+                raise RuntimeError("Unable to write data file") from exc
+        self.journal_len = 0
+        self._journal_entries = []
+        key = self._cache_key()
+        # Only cache what we wrote, not a file another process swapped in.
+        if key[0] is not None and key[0][0] == inode and key[1] is None:
+            _CACHE.put(self.path, key, data, [])
+        else:
+            _CACHE.invalidate(self.path)
+
+    # Apply operations and return the per-operation results.
+    def apply(self, ops: list[dict]) -> list[dict | None]:
+        return op_results(ops, self.apply_changes(ops))
+
+    # Apply operations, persist the result, and return what changed.
+    def apply_changes(self, ops: list[dict]) -> list[Change]:
+        data = self._load_private()
+        index = self._index_for(data)
+        changes = apply_ops(data, ops, index)
+        if any(after is not None or before is not None for before, after in changes):
+            self.save(data, index)
+        return changes
+
+    # Ledger whose list (not records) the caller may change, for apply_ops.
+    def _load_private(self) -> dict:
+        data = self._load_shared().data
+        return {**data, "expenses": list(data["expenses"])}
+
+    # Fold the journal into the snapshot; returns the number of expenses.
+    def compact(self) -> int:
+        data = self._load_private()
+        self.save(data, self._index_for(data))
+        return len(data["expenses"])
+
+    # Size and mtime of the snapshot, used to tell whether the index is stale.
+    def _snapshot_signature(self) -> list[int] | None:
+        return file_signature(self.path)
+
+    # Signature of every file the ledger lives in, for derived data to check.
+    def stamp(self) -> list:
+        return [file_signature(self.path), file_signature(self.journal_path)]
+
+    # Open the persisted index of the snapshot and catch it up with the
+    # journal `entries`: reads its header and maps its id table, so the cost
+    # does not grow with the ledger.
+    #
+    # Returns None when the index is missing, unreadable, or was written
+    # for a different snapshot.
+    def _read_index(self, entries: list[dict]) -> LedgerIndex | None:
+        stored = read_index(self.index_path, self._snapshot_signature())
+        if stored is None:
+            return None
+        size, sequences, table = stored
+        index = LedgerIndex(IdAllocator(sequences=sequences), size, table)
+        for entry in entries:
+            index.replay(entry)
+        return index
+
+    # Index for freshly loaded data; rebuilt when missing or stale.
+    def _index_for(self, data: dict) -> LedgerIndex:
+        index = self._read_index(self._journal_entries)
+        if index is None or index.size != len(data["expenses"]):
+            get_logger().info("Rebuilding index %s", self.index_path)
+            return LedgerIndex.build(data["expenses"])
+        return index
+
+    # Persist the id index of a snapshot just written; `spans` are the byte
+    # ranges of its records.
+    #
+    # The index is derived data, so a failed write is logged and left for
+    # the next load to rebuild.
+    def _write_index(
+        self, records: list[dict], spans: list[tuple[int, int]], index: LedgerIndex | None
+    ) -> None:
+        allocator = index.allocator if index is not None else IdAllocator(records)
+        try:
+            write_index(
+                self.index_path,
+                self._snapshot_signature(),
+                records,
+                spans,
+                allocator.sequences,
+            )
+        except OSError as exc:
+            get_logger().error("Failed to write index %s: %s", self.index_path, exc)
+
+    # Read journal records, skipping a torn final line (a crashed write, or an
+    # append in progress); the next append cuts it off.
+    def _read_journal(self) -> list[dict]:
+        if not self.journal_path.exists():
+            return []
+        logger = get_logger()
+        try:
+            with self.journal_path.open("r", encoding="utf-8") as handle:
+                lines = handle.read().splitlines(keepends=True)
+        except OSError as exc:
+            logger.error("Failed to read journal %s: %s", self.journal_path, exc)
+            raise RuntimeError("Unable to read data file") from exc
+
+        entries = []
+        with span("load.journal"):
+            for number, line in enumerate(lines, start=1):
+                if not line.strip():
+                    continue
+                try:
+                    entries.append(json.loads(line))
+                except json.JSONDecodeError as exc:
+                    if number == len(lines) and not line.endswith("\n"):
+                        logger.warning(
+                            "Skipping torn journal record in %s", self.journal_path
+                        )
+                        break
+                    logger.error(
+                        "Invalid journal record %d in %s", number, self.journal_path
+                    )
+                    raise RuntimeError("Journal file is corrupted") from exc
+        return entries
+
+
+# Append-only storage: writes add one journal line per change and the
+# snapshot is only rewritten when the journal grows past _COMPACT_EVERY.
+class JournalStorage(JsonStorage):
+    name = "journal"
+
+    # Apply operations by appending them to the journal.
+    #
+    # Served from the persisted id index without loading the ledger: the
+    # records an operation touches are read from their byte ranges in the
+    # snapshot and brought up to date with the journal. Without a usable
+    # index the ledger is replayed and the index rebuilt.
+    def apply_changes(self, ops: list[dict]) -> list[Change]:
+        cached = _CACHE.get(self.path, self._cache_key())
+        entries = cached.entries if cached else self._read_journal()
+        index = self._read_index(entries)
+        changes = None
+        if index is not None:
+            self.journal_len = len(entries)
+            self._journal_entries = entries
+            changes = self._apply_indexed(index, entries, ops)
+        if changes is None:
+            data = self._load_private()
+            index = LedgerIndex.build(data["expenses"])
+            changes = apply_ops(data, ops, index)
+            if any(after is not None or before is not None for before, after in changes):
+                get_logger().info("Rebuilt index %s", self.index_path)
+                self.save(data, index)
+            return changes
+
+        resolved = _resolved_ops(ops, changes)
+        if resolved:
+            self._append_journal(resolved)
+        if self.journal_len >= _COMPACT_EVERY:
+            self.compact()
+            get_logger().info("Compacted journal into %s", self.path)
+        return changes
+
+    # Changes of `ops` worked out from the index and the records they touch;
+    # None when a snapshot record does not match the index.
+    def _apply_indexed(
+        self, index: LedgerIndex, entries: list[dict], ops: list[dict]
+    ) -> list[Change] | None:
+        events = _journal_events(entries)
+        targets = {
+            op["expense"].get("id") if op.get("op") == "add" else op.get("id")
+            for op in ops
+        }
+        current: dict[str, dict | None] = {}
+        spans = {}
+        for expense_id in targets:
+            if not expense_id or index.position(expense_id) is None:
+                continue
+            spans[expense_id] = index.snapshot_span(expense_id)
+        snapshot = self._snapshot_records(spans)
+        if snapshot is None:
+            return None
+        for expense_id in spans:
+            current[expense_id], _ = _resolve_history(
+                snapshot.get(expense_id), events.get(expense_id, [])
+            )
+
+        changes: list[Change] = []
+        for op in ops:
+            kind = op.get("op")
+            if kind == "add":
+                record = dict(op["expense"])
+                if not record.get("id"):
+                    record.pop("id", None)
+                    record = {"id": index.allocator.allocate(record["date"]), **record}
+                before = current.get(record["id"])
+                index.add(record)
+                current[record["id"]] = record
+                changes.append((before, record))
+            elif kind == "edit":
+                before = current.get(op["id"])
+                if before is None:
+                    changes.append(missing_target(op))
+                    continue
+                current[op["id"]] = record = {**before, **op["changes"]}
+                changes.append((before, record))
+            elif kind == "delete":
+                before = current.get(op["id"])
+                if before is None:
+                    changes.append(missing_target(op))
+                    continue
+                index.remove(op["id"])
+                current[op["id"]] = None
+                changes.append((before, None))
+            else:
+                raise ValueError(f"Unknown operation: {kind}")
+        return changes
+
+    # Snapshot records at the byte ranges in `spans` (id -> (offset, length),
+    # or None for ids the snapshot does not hold); None when a range does
+    # not hold the record of its id.
+    def _snapshot_records(
+        self, spans: dict[str, tuple[int, int] | None]
+    ) -> dict[str, dict] | None:
+        wanted = {key: value for key, value in spans.items() if value is not None}
+        if not wanted:
+            return {}
+        records = {}
+        try:
+            with self.path.open("rb") as handle:
+                for expense_id, (offset, length) in wanted.items():
+                    handle.seek(offset)
+                    record = json.loads(handle.read(length))
+                    if not isinstance(record, dict) or record.get("id") != expense_id:
+                        raise ValueError(f"index points past {expense_id}")
+                    records[expense_id] = record
+        except (OSError, ValueError) as exc:
+            get_logger().error("Ignoring stale index %s: %s", self.index_path, exc)
+            return None
+        return records
+
+    # Append records to the journal and flush them to disk.
+    #
+    # `data` is the ledger with the records already applied, when the caller
+    # has it; the cache is moved forward either way.
+    def _append_journal(self, entries: list[dict], data: dict | None = None) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        payload = "".join(
+            json.dumps(entry, ensure_ascii=True, separators=(",", ":")) + "\n"
+            for entry in entries
+        )
+        old_key = self._cache_key()
+        try:
+            with self.journal_path.open("a+b") as handle:
+                _cut_torn_tail(handle)
+                handle.write(payload.encode("ascii"))
+                handle.flush()
+                os.fsync(handle.fileno())
+        except OSError as exc:
+            get_logger().error(
+                "Failed to append journal %s: %s", self.journal_path, exc
+            )
+            raise RuntimeError("Unable to write data file") from exc
+        self.journal_len += len(entries)
+        self._journal_entries = self._journal_entries + entries
+
+        # The journal grew by exactly our bytes, so nobody else wrote in between.
+        new_key = self._cache_key()
+        old_size = old_key[1][2] if old_key[1] else 0
+        if new_key[1] is None or new_key[1][2] != old_size + len(payload):
+            _CACHE.invalidate(self.path)
+        elif data is not None:
+            _CACHE.put(self.path, new_key, data, self._journal_entries)
+        else:
+            _CACHE.advance(self.path, old_key, new_key, entries)
+
+
+# End a journal opened in "a+b" on a complete line before appending: a
+# final record without its newline is terminated when it parses and cut off
+# (torn by a crashed write) when it does not.
+def _cut_torn_tail(handle) -> None:
+    size = handle.seek(0, os.SEEK_END)
+    if size == 0:
+        return
+    handle.seek(size - 1)
+    if handle.read(1) == b"\n":
+        return
+    keep = size - 1
+    while keep > 0:
+        start = max(0, keep - _READ_CHUNK)
+        handle.seek(start)
+        newline = handle.read(keep - start).rfind(b"\n")
+        if newline != -1:
+            keep = start + newline + 1
+            break
+        keep = start
+    handle.seek(keep)
+    try:
+        json.loads(handle.read(size - keep))
+    except (json.JSONDecodeError, UnicodeDecodeError):
+        get_logger().error("Dropping torn journal record in %s", handle.name)
+        handle.truncate(keep)
+    else:
+        handle.write(b"\n")
+
+
+ENGINES = ("json", "journal", "sqlite", "partitioned", "binary")
+
+
+# Resolve path to the file that records the engine chosen by `migrate`.
+def _engine_path() -> Path:
+    return _data_path().parent / "engine"
+
+
+# Name of the configured engine: TRACKER_STORAGE, then data/engine, then json.
+def configured_engine() -> str:
+    name = os.environ.get(_ENGINE_ENV, "").strip().lower()
+    if not name:
+        path = _engine_path()
+        try:
+            name = path.read_text(encoding="utf-8").strip().lower()
+        except FileNotFoundError:
+            name = ""
+        except OSError as exc:
+            get_logger().error("Failed to read engine file %s: %s", path, exc)
+            raise RuntimeError("Unable to read data file") from exc
+    return name or JsonStorage.name
+
+
+# Persist the engine used when TRACKER_STORAGE is not set.
+def set_engine(name: str) -> None:
+    path = _engine_path()
+    path.parent.mkdir(parents=True, exist_ok=True)
+    try:
+        path.write_text(name + "\n", encoding="utf-8")
+    except OSError as exc:
+        get_logger().error("Failed to write engine file %s: %s", path, exc)
+        raise RuntimeError("Unable to write data file") from exc
+
+
+# Build a storage engine by name, defaulting to the configured one.
+def get_storage(name: str | None = None):
+    name = name or configured_engine()
+    if name == JsonStorage.name:
+        return JsonStorage()
+    if name == JournalStorage.name:
+        return JournalStorage()
+    if name == "sqlite":
+        from .sqlite_storage import SqliteStorage
+
+        return SqliteStorage(_data_path().with_suffix(".db"))
+    if name == "partitioned":
+        from .partitioned_storage import PartitionedStorage
+
+        return PartitionedStorage(_data_path().with_suffix(".parts"))
+    if name == "binary":
+        from .binary_storage import BinaryStorage
+
+        return BinaryStorage(_data_path().with_suffix(".bin"))
+    get_logger().error("Unknown storage engine: %s", name)
+    raise RuntimeError(f"Unknown storage engine: {name}")
+
+
+# Stream expense records from the configured storage engine.
+def iter_records() -> Iterator[dict]:
+    return get_storage().iter_records()
+
+
+# Load data from the configured storage engine.
+def load_data() -> dict:
+    return get_storage().load()
+
+
+# Save data through the configured storage engine.
+def save_data(data: dict) -> None:
+    get_storage().save(data)
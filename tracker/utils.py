@@ -1,6 +1,10 @@
 from __future__ import annotations
 
+import calendar
+import math
 from datetime import date as date_cls, datetime
+from functools import lru_cache
+from typing import Iterable, Iterator
 
 
 DATE_FMT = "%Y-%m-%d"
@@ -15,6 +19,91 @@ def parse_date(date_str: str) -> date_cls:
         raise ValueError("date must be YYYY-MM-DD") from exc
 
 
+# Validate a YYYY-MM-DD date, caching results since bulk data repeats dates.
+@lru_cache(maxsize=8192)
+def checked_date(date_str: str) -> str:
+    parse_date(date_str)
+    return date_str
+
+
+# Day ordinal for a canonical YYYY-MM-DD string, or None for anything else.
+def day_number(date_str: object) -> int | None:
+    if not isinstance(date_str, str) or len(date_str) != 10:
+        return None
+    try:
+        parsed = date_cls.fromisoformat(date_str)
+    except ValueError:
+        return None
+    if parsed.isoformat() != date_str:
+        return None
+    return parsed.toordinal()
+
+
+# Inclusive day-number bounds for month/from/to filters, or None when a
+# filter is not in canonical form (callers then compare date strings).
+def day_bounds(
+    month: str | None, from_date: str | None, to_date: str | None
+) -> tuple[int | None, int | None] | None:
+    low: int | None = None
+    high: int | None = None
+    if month is not None:
+        if day_number(f"{month}-01") is None or len(month) != 7:
+            return None
+        low, high = month_bounds(month)
+    for value, is_low in ((from_date, True), (to_date, False)):
+        if value is None:
+            continue
+        day = day_number(value)
+        if day is None:
+            return None
+        if is_low:
+            low = day if low is None else max(low, day)
+        else:
+            high = day if high is None else min(high, day)
+    return low, high
+
+
+# First and last day number of a YYYY-MM month.
+def month_bounds(month: str) -> tuple[int, int]:
+    year, month_number = int(month[:4]), int(month[5:7])
+    first = date_cls(year, month_number, 1).toordinal()
+    return first, first + calendar.monthrange(year, month_number)[1] - 1
+
+
+# (label, first day, last day) of each day, week or month overlapping the
+# days low..high, clipped to them. Weeks start on Monday and are labelled
+# by their first day in range, days by their date and months as YYYY-MM.
+def periods(low: int, high: int, by: str) -> Iterator[tuple[str, int, int]]:
+    day = low
+    while day <= high:
+        start = date_cls.fromordinal(day)
+        if by == "day":
+            last = day
+            label = start.isoformat()
+        elif by == "week":
+            last = day + 6 - start.weekday()
+            label = start.isoformat()
+        elif by == "month":
+            last = month_bounds(start.isoformat())[1]
+            label = start.isoformat()[:7]
+        else:
+            raise ValueError(f"Unknown period: {by}")
+        yield label, day, min(last, high)
+        day = last + 1
+
+
+# Amount in integer minor units (cents), or None when it has sub-cent digits
+# or is not finite.
+def minor_units(amount: object) -> int | None:
+    scaled = float(amount) * 100
+    if not math.isfinite(scaled):
+        return None
+    minor = round(scaled)
+    if abs(scaled - minor) > 1e-6:
+        return None
+    return minor
+
+
 # Parse YYYY-MM month.
 def parse_month(month_str: str) -> tuple[int, int]:
     try:
@@ -51,3 +140,59 @@ def generate_id(expenses: list[dict], date_str: str) -> str:
     if existing:
         seq = max(existing) + 1
     return f"{prefix}{seq:04d}"
+
+
+# Id prefix (EXP-YYYYMMDD-) and sequence of an allocated-style id, or None.
+def id_sequence(expense_id: object) -> tuple[str, int] | None:
+    if not isinstance(expense_id, str) or not expense_id.startswith("EXP-"):
+        return None
+    prefix, _, seq = expense_id.rpartition("-")
+    if not seq.isdigit():
+        return None
+    return prefix + "-", int(seq)
+
+
+# Allocates sequential ids per date from an in-memory counter: one past the
+# highest sequence of the date's ids, like generate_id(). When the id with
+# the highest sequence is deleted, rewind() steps back so it is handed out
+# again, the same in every storage engine.
+class IdAllocator:
+    def __init__(
+        self,
+        expenses: Iterable[dict] = (),
+        sequences: dict[str, int] | None = None,
+    ) -> None:
+        self._last: dict[str, int] = dict(sequences or {})
+        for item in expenses:
+            self.observe(item.get("id"))
+
+    # Highest sequence seen per id prefix.
+    @property
+    def sequences(self) -> dict[str, int]:
+        return dict(self._last)
+
+    # Record an existing id so later allocations skip past it.
+    def observe(self, expense_id: object) -> None:
+        found = id_sequence(expense_id)
+        if found is None:
+            return
+        prefix, seq = found
+        self._last[prefix] = max(self._last.get(prefix, 0), seq)
+
+    # Highest sequence seen for an id prefix (0 when none).
+    def last(self, prefix: str) -> int:
+        return self._last.get(prefix, 0)
+
+    # Continue `prefix` after the highest sequence of `ids`, the ids with
+    # that prefix still in the ledger.
+    def rewind(self, prefix: str, ids: Iterable[str]) -> None:
+        self._last.pop(prefix, None)
+        for expense_id in ids:
+            self.observe(expense_id)
+
+    # Next free id for a date.
+    def allocate(self, date_str: str) -> str:
+        prefix = f"EXP-{date_str.replace('-', '')}-"
+        seq = self._last.get(prefix, 0) + 1
+        self._last[prefix] = seq
+        return f"{prefix}{seq:04d}"